@@ -2,81 +2,169 @@
 # The main Flask application for the air pressure dashboard.
 
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
-import threading
+from flask import Flask, Response, abort, g, render_template, jsonify, request, send_from_directory
+import logging
+import os
+import signal
+import statistics
 import time
-import atexit
-import RPi.GPIO as GPIO
-from apscheduler.schedulers.background import BackgroundScheduler
-from pressure_sensor import (
-    get_front_pressure, 
-    get_rear_pressure, 
-    setup_gpio, 
-    check_pressure_threshold,
-    # Import the new global variables to be updated
-    latest_front_pressure,
-    latest_rear_pressure,
-    latest_reading_timestamp
-)
+
+import applog
+import boot
+import ingest
+import metrics
+import profiler
+import querylog
 from database import (
-    setup_database, 
-    log_reading, 
     get_historical_readings, 
+    get_log_readings,
+    get_recent_readings,
     get_latest_reading, 
     get_hourly_average_readings, 
     get_minutes_average_readings,
-    cleanup_old_data,
+    get_alarm_episodes,
+    get_device_reading,
+    get_fleet_overview,
+    get_backfills,
+    get_loop_periods,
+    complete_backfills,
+    ingest_episodes,
+    ingest_minutes,
+    ingest_readings,
+    offer_backfills,
+    request_backfill,
+    split_reading_id,
+    to_ms,
+    DEVICE_ID,
+    FLEET_STALE_SECONDS,
+    INGEST_ENABLED,
+    LOG_PAGE_LIMIT,
+    ERROR_LOG_PAGE_LIMIT,
+    LIVE_RING_CAPACITY,
+    READING_ID_SPAN,
 )
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = ingest.MAX_BODY_BYTES  # Largest request body (an ingest batch) accepted
+log = logging.getLogger(__name__)
+
+MAX_LOG_PAGE_LIMIT = 1000  # Upper bound on rows per /api/log and /api/error-log request
+LOOP_INTERVAL = 0.5  # Sleep of the acquisition loop (acquisition.LOOP_INTERVAL), reported as the target period
 
-# Make scheduler global
-scheduler = None
+REQUEST_SECONDS = metrics.histogram('http_request_seconds', 'Time to handle a request', ['route', 'method', 'status'])
+RESPONSE_BYTES = metrics.histogram('http_response_bytes', 'Size of response bodies', ['route'],
+                                   buckets=metrics.SIZE_BUCKETS)
+REQUESTS_IN_FLIGHT = metrics.gauge('http_requests_in_flight', 'Requests being handled (the web tier queue depth)')
 
 def initialize_system():
     """
-    Initializes the database, starts the background logging thread,
-    and sets up the cleanup scheduler.
+    Starts sensor acquisition and the compaction and cleanup scheduler in this
+    process (dev server only). Under wsgi.py they run in acquisition.py instead.
     """
-    global scheduler  # Declare scheduler as global
-    
-    setup_database()
-    setup_gpio()
-    
-    # Set up the cleanup scheduler
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(cleanup_old_data, 'cron', hour=18, minute=5)
-    scheduler.start()
-    
-    # Start the background logging thread
-    t = threading.Thread(target=background_logging_task, daemon=True)
-    t.start()
+    import acquisition  # Imported here so web workers never touch the sensors or GPIO
+    acquisition.start()
 
-def background_logging_task():
+def requested_device():
     """
-    A continuous task to read sensor data and log it to the database.
-    This runs in a separate thread to not block the Flask web server.
+    The device a data request is for: ?device=<id>, or this node when it is
+    not given. Answers 400 for an id a node could not have pushed.
     """
-    print("Starting background sensor logging task...")
-    while True:
-        try:
-            # Reference the global variables to modify them
-            global latest_front_pressure, latest_rear_pressure, latest_reading_timestamp
-
-            front_pressure = get_front_pressure()
-            rear_pressure = get_rear_pressure()
-            if front_pressure is not None and rear_pressure is not None:
-                check_pressure_threshold(front_pressure, rear_pressure)
-                # Update in-memory values
-                latest_front_pressure = front_pressure
-                latest_rear_pressure = rear_pressure
-                latest_reading_timestamp = datetime.now().isoformat()
-                # Log to database for historical records
-                log_reading(front_pressure, rear_pressure)
-                print(f"Logged new reading: Front={front_pressure:.2f} MPa, Rear={rear_pressure:.2f} MPa")
-        except Exception as e:
-            print(f"Error in background task: {e}")
-        time.sleep(0.5)
+    device_id = request.args.get('device')
+    if device_id is None or device_id == '':
+        return DEVICE_ID
+    if not ingest.DEVICE_ID_PATTERN.match(device_id):
+        abort(400)
+    return device_id
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+    profiler.tag(f"request {request.url_rule.rule if request.url_rule else 'unmatched'}")
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(time.perf_counter() - started)
+        if response.content_length is not None:
+            RESPONSE_BYTES.labels(route).observe(response.content_length)
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    # Runs even when a view raised, so the in-flight count cannot leak
+    if g.pop('request_started', None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+    profiler.untag()
+
+@app.route('/metrics')
+def get_metrics():
+    """
+    Metrics of the acquisition process and every web worker in the Prometheus text format.
+    """
+    return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/slow-queries')
+def get_slow_queries():
+    """
+    Slowest database queries from the slow-query log, grouped by caller and
+    statement, worst total time first. Pass limit=N for more or fewer groups.
+    """
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify({
+        'threshold_ms': querylog.SLOW_QUERY_MS,
+        'queries': querylog.top_offenders(max(1, min(limit, 200))),
+    })
+
+@app.route('/admin/profile', methods=['GET'])
+def get_profile_status():
+    """
+    State of the profiler in the worker serving this request, and the profile files written so far.
+    The /admin/profile routes are only served when PROFILE_ENABLED=1.
+    """
+    if not profiler.PROFILE_ENABLED:
+        abort(404)
+    return jsonify({**profiler.status(), 'files': profiler.list_profiles()})
+
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    """
+    Starts a sampling profile of the requests in this worker and of the
+    acquisition loop (signalled with SIGUSR2), for seconds=N (default 120).
+    target=web or target=acquisition profiles only one of them.
+    """
+    if not profiler.PROFILE_ENABLED:
+        abort(404)
+    seconds = request.args.get('seconds', default=profiler.PROFILE_SECONDS, type=int)
+    target = request.args.get('target', default='all')
+    started = {}
+    pid = profiler.acquisition_pid()
+    if target in ('all', 'web') or pid == os.getpid():
+        # The dev server runs acquisition in this process, so one profile covers both
+        started['web'] = profiler.start('web', seconds)
+    if target in ('all', 'acquisition') and pid is not None and pid != os.getpid():
+        os.kill(pid, signal.SIGUSR2)
+        started['acquisition'] = True
+    return jsonify({'started': started, 'acquisition_pid': pid})
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def stop_profile():
+    """Ends the profile running in this worker early and writes its file."""
+    if not profiler.PROFILE_ENABLED:
+        abort(404)
+    profiler.stop()
+    return jsonify(profiler.status())
+
+@app.route('/admin/profile/<name>')
+def download_profile(name):
+    """Serves one collapsed-stack profile file for flamegraph.pl or speedscope."""
+    if not profiler.PROFILE_ENABLED:
+        abort(404)
+    if name not in profiler.list_profiles():
+        abort(404)
+    return send_from_directory(os.path.abspath(profiler.PROFILE_DIR), name, mimetype='text/plain')
 
 @app.route('/')
 def index():
@@ -87,33 +175,52 @@ def index():
 
 @app.route('/api/realtime')
 def get_realtime_data():
-    """Serves the latest reading directly from memory."""
-    if latest_reading_timestamp:
-        return jsonify({
-            'timestamp': latest_reading_timestamp,
-            'front_pressure': latest_front_pressure,
-            'rear_pressure': latest_rear_pressure
-        })
+    """
+    Serves the latest sample of the acquisition loop from the live ring, or
+    for another device (?device=) the newest reading it pushed.
+    """
+    reading = get_device_reading(requested_device())
+    if reading:
+        return jsonify(reading)
     return jsonify({'error': 'No data available yet'}), 404
 
+@app.route('/api/acquisition')
+def get_acquisition_stats():
+    """
+    Timing of the acquisition loop, to see whether web load delays sampling.
+    Pass last=N to only use the newest N loop periods.
+    """
+    last = request.args.get('last', default=LIVE_RING_CAPACITY, type=int)
+    periods = sorted(get_loop_periods(min(last, LIVE_RING_CAPACITY)))
+    if not periods:
+        return jsonify({'samples': 0})
+    return jsonify({
+        'samples': len(periods),
+        'target_period_ms': LOOP_INTERVAL * 1000,
+        'mean_period_ms': statistics.fmean(periods) * 1000,
+        'p50_period_ms': periods[len(periods) // 2] * 1000,
+        'p99_period_ms': periods[min(len(periods) - 1, int(len(periods) * 0.99))] * 1000,
+        'max_period_ms': periods[-1] * 1000,
+        'jitter_ms': statistics.pstdev(periods) * 1000,
+    })
+
 @app.route('/api/history')
 def api_history():
+    device_id = requested_device()
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
 
-        # Pass the dates to the database function
-        # We will update database.py next to accept these
-        data = get_historical_readings(start_date, end_date)
-        
         # If no specific range, just return the most recent points
-        # to keep the initial load fast
+        # from the ring file to keep the initial load fast
         if not start_date and not end_date:
-            return jsonify(data[-100:]) 
-            
+            return jsonify(get_recent_readings(100, device_id))
+
+        # Pass the dates to the database function
+        data = get_historical_readings(start_date, end_date, device_id)
         return jsonify(data)
     except Exception as e:
-        print(f"History API Error: {e}")
+        log.error("History API Error: %s", e)
         return jsonify([]), 500
 
 @app.route('/api/average/hour')
@@ -121,7 +228,7 @@ def get_average_hourly_data():
     """
     API endpoint to get the average pressure over the last hour.
     """
-    data = get_hourly_average_readings()
+    data = get_hourly_average_readings(requested_device())
     if data:
         return jsonify(data)
     return jsonify({'error': 'No data available'}), 404
@@ -131,7 +238,7 @@ def get_average_minute_data():
     """
     API endpoint to get the average pressure over the last minute.
     """
-    data = get_minutes_average_readings()
+    data = get_minutes_average_readings(requested_device())
     if data:
         return jsonify(data)
     return jsonify({'error': 'No data available'}), 404
@@ -153,28 +260,109 @@ def logs():
 @app.route('/api/log')
 def get_log_data():
     """
-    API endpoint to get all historical pressure readings for both sensors.
+    API endpoint to tail pressure readings for both sensors.
     Used by log.html for live log display.
+    Pass after_id (the last id the page has seen) to get only newer rows.
     """
-    data = get_historical_readings()  # Should return a list of dicts with timestamp, front_pressure, rear_pressure
+    after_id = request.args.get('after_id')
+    if after_id is not None:
+        try:
+            after_id = int(after_id)
+            if after_id // READING_ID_SPAN < 10000101:  # Before 1000-01-01, e.g. a bare row id
+                raise ValueError(after_id)
+            split_reading_id(after_id)
+        except ValueError:
+            return jsonify({'error': 'after_id must be a reading id from this endpoint'}), 400
+    limit = request.args.get('limit', default=LOG_PAGE_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_LOG_PAGE_LIMIT))
+    data = get_log_readings(after_id, limit, requested_device())  # List of dicts with id, timestamp, front_pressure, rear_pressure
     return jsonify(data)
 
 @app.route('/api/error-log')
 def get_error_log_data():
-    """API endpoint for error logs"""
-    error_logs = get_error_logs()
+    """
+    API endpoint for error logs.
+    Returns alarm episodes newest first; pass before_id to page back.
+    """
+    before_id = request.args.get('before_id', type=int)
+    limit = request.args.get('limit', default=ERROR_LOG_PAGE_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_LOG_PAGE_LIMIT))
+    error_logs = get_alarm_episodes(before_id, limit, requested_device())
     return jsonify(error_logs)
 
+@app.route('/api/devices')
+def get_devices():
+    """
+    Fleet overview: the newest reading and status of every device this box
+    knows, this node first. Every data endpoint takes ?device=<id> to show one of them.
+    """
+    return jsonify({
+        'local_device': DEVICE_ID,
+        'stale_seconds': FLEET_STALE_SECONDS,
+        'devices': get_fleet_overview(),
+    })
+
+@app.route('/api/devices/<device_id>/backfill', methods=['GET'])
+def get_device_backfills(device_id):
+    """Raw-data backfill requests of a device, newest first. Only served when INGEST_ENABLED=1."""
+    if not INGEST_ENABLED:
+        abort(404)
+    return jsonify(get_backfills(device_id))
+
+@app.route('/api/devices/<device_id>/backfill', methods=['POST'])
+def post_device_backfill(device_id):
+    """
+    Asks a node that uploads summaries for its raw readings from start to end
+    (ISO date-times, e.g. ?start=2026-03-01T10:00&end=2026-03-01T10:30).
+    The node picks the request up with its next upload and sends the
+    readings; until then GET shows it as not done. Only served when INGEST_ENABLED=1.
+    """
+    if not INGEST_ENABLED:
+        abort(404)
+    if not ingest.DEVICE_ID_PATTERN.match(device_id) or device_id == DEVICE_ID:
+        return jsonify({'error': 'Raw data can only be requested from another node'}), 400
+    try:
+        start_ms = to_ms(datetime.fromisoformat(request.args['start']))
+        end_ms = to_ms(datetime.fromisoformat(request.args['end']))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start and end must be ISO date-times'}), 400
+    if end_ms < start_ms:
+        return jsonify({'error': 'end is before start'}), 400
+    return jsonify(request_backfill(device_id, start_ms, end_ms)), 202
+
+@app.route('/api/ingest', methods=['POST'])
+def post_ingest():
+    """
+    Accepts a batch of readings, minute summaries and alarm episodes pushed
+    by another node (format in ingest.py), optionally gzip-compressed. Only
+    served when INGEST_ENABLED=1. Resending a batch is safe: rows already
+    stored are counted as duplicates. The answer lists the raw-data backfill
+    requests the node should serve next.
+    """
+    if not INGEST_ENABLED:
+        abort(404)
+    try:
+        batch = ingest.decode_batch(request.get_data(), request.headers.get('Content-Encoding'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    device_id, readings = batch['device_id'], batch['readings']
+    result = ingest_readings(device_id, readings)
+    result['device_id'] = device_id
+    result['received'] = len(readings)
+    # Every seq up to here is now stored (or was refused as too old), so the node may forget them
+    result['acked_seq'] = max((r[0] for r in readings), default=None)
+    if batch['minutes']:
+        result['minutes'] = ingest_minutes(device_id, batch['minutes'])
+    if batch['episodes']:
+        result['episodes'] = ingest_episodes(device_id, batch['episodes'])
+    complete_backfills(device_id, batch['backfill_done'])
+    result['backfill'] = offer_backfills(device_id)
+    return jsonify(result)
+
 if __name__ == '__main__':
+    # Development server. For production use wsgi.py with a WSGI server and run acquisition.py as a service.
+    applog.setup_logging()
     initialize_system()
+    boot.mark('web_ready')
     app.run(host='0.0.0.0', port=5300, debug=True) #port for raspi 02 = 5000
                                                    #port for raspi 4 mod-B = 5300 (SIM purpose)
-
-# Add cleanup handler at the end of the file
-@atexit.register
-def cleanup():
-    """Ensure GPIO is cleaned up and scheduler is shut down when the application exits"""
-    global scheduler  # Reference the global scheduler
-    GPIO.cleanup()
-    if scheduler:  # Only shutdown if scheduler exists
-        scheduler.shutdown()
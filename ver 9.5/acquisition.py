@@ -0,0 +1,307 @@
+# acquisition.py
+# Sensor acquisition and the compaction/cleanup scheduler.
+#
+# This is the only part of the system that writes data, so it must run exactly
+# once per data folder. An exclusive lock on database.ACQUISITION_LOCK_FILE
+# guarantees that: a second copy (another service instance, or the reloader
+# child of the dev server) finds the lock taken and does not start.
+#
+# Production runs it as its own service next to the web tier (see wsgi.py):
+#   python acquisition.py
+# The dev server (python AtsuKanshi.py) starts it in a background thread instead.
+#
+# Startup order is chosen so the alarm works as early as possible: lock, GPIO,
+# database, then the loop. The scheduler, metrics exporter and their imports
+# only start once the first sample has gone through. Phase timings are logged
+# and exported through boot.py.
+
+import boot  # First, so its clock starts before the other imports
+import atexit
+import fcntl
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import timedelta
+
+# SENSOR_BACKEND=sim runs on the simulated sensors (for testing off the shop floor),
+# SENSOR_BACKEND=replay plays back a recorded database (see pressure_sensorREPLAY.py)
+if os.environ.get('SENSOR_BACKEND') == 'sim':
+    from pressure_sensorSIM import (
+        init_sensors,
+        get_front_pressure,
+        get_rear_pressure,
+        setup_gpio,
+        check_pressure_threshold,
+    )
+elif os.environ.get('SENSOR_BACKEND') == 'replay':
+    from pressure_sensorREPLAY import (
+        init_sensors,
+        get_front_pressure,
+        get_rear_pressure,
+        setup_gpio,
+        check_pressure_threshold,
+        ReplayFinished,
+    )
+else:
+    from pressure_sensor import (
+        init_sensors,
+        get_front_pressure,
+        get_rear_pressure,
+        setup_gpio,
+        check_pressure_threshold,
+    )
+if os.environ.get('SENSOR_BACKEND') != 'replay':
+    class ReplayFinished(Exception):
+        """Only the replay backend runs out of samples; defined so the loop can always catch it."""
+import applog
+import clock
+import database
+import metrics
+import outbox
+import profiler
+import querylog
+from database import (
+    setup_database,
+    log_reading,
+    cleanup_old_data,
+    compact_closed_days,
+    record_alarm_state,
+    live_ring,
+)
+
+LOOP_INTERVAL = 0.5  # Seconds to sleep after each loop iteration
+# Daily maintenance jobs: (name, function, hour, minute)
+JOBS = [
+    ('compact', compact_closed_days, 0, 10),
+    ('cleanup', cleanup_old_data, 18, 5),
+]
+SERVICES_DELAY_LIMIT = 10.0  # Start the scheduler and exporter after this many seconds even without a first sample
+
+log = logging.getLogger('acquisition')
+
+scheduler = None
+_next_runs = None  # job name -> datetime of its next run, when the jobs follow a non-real clock
+_lock = None  # Open lock file, held for the life of the process
+first_iteration_done = threading.Event()
+
+SENSOR_READ_SECONDS = metrics.histogram('sensor_read_seconds', 'Time to read one pressure channel over I2C', ['channel'])
+SENSOR_ERRORS = metrics.counter('sensor_errors_total', 'Loop iterations that failed or returned no reading')
+LOOP_PERIOD_SECONDS = metrics.histogram('loop_period_seconds', 'Time between the starts of consecutive loop iterations',
+                                        buckets=(0.5, 0.505, 0.51, 0.52, 0.55, 0.6, 0.75, 1.0, 2.0, 5.0))
+LOOP_WORK_SECONDS = metrics.histogram('loop_work_seconds', 'Time spent in one loop iteration, excluding the sleep')
+ALARM_STATE_SECONDS = metrics.counter('alarm_state_seconds_total', 'Time spent in each alarm status', ['state'])
+MAINTENANCE_SECONDS = metrics.gauge('maintenance_duration_seconds', 'Duration of the last run of a scheduled job', ['job'])
+MAINTENANCE_LAST_RUN = metrics.gauge('maintenance_last_run_timestamp_seconds', 'Unix time a scheduled job last finished', ['job'])
+STORAGE_BYTES = metrics.gauge('storage_bytes', 'Size of the data files, by kind', ['file'])
+
+def acquire_lock():
+    """
+    Takes the exclusive acquisition lock. Returns True if this process now owns
+    acquisition, False if another process already does.
+    The lock file holds the owner's pid (see profiler.acquisition_pid).
+    """
+    global _lock
+    f = open(database.ACQUISITION_LOCK_FILE, 'a+')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    f.seek(0)
+    f.truncate()
+    f.write(f"{os.getpid()}\n")
+    f.flush()
+    _lock = f
+    return True
+
+def timed_job(name, func):
+    """Wraps a scheduled job so its duration and finish time are exported as metrics."""
+    def run():
+        started = time.perf_counter()
+        func()
+        MAINTENANCE_SECONDS.labels(name).set(time.perf_counter() - started)
+        MAINTENANCE_LAST_RUN.labels(name).set(clock.time())
+    return run
+
+def start_scheduler():
+    """
+    Starts the nightly compaction and the end-of-day cleanup jobs.
+    apscheduler only knows real time, so on a virtual or simulated clock the
+    loop runs the jobs itself instead (see run_due_jobs).
+    """
+    global scheduler, _next_runs
+    if not clock.is_real():
+        now = clock.now()
+        _next_runs = {name: next_run(now, hour, minute) for name, _, hour, minute in JOBS}
+        return
+    from apscheduler.schedulers.background import BackgroundScheduler  # Slow to import; not needed for the first sample
+
+    scheduler = BackgroundScheduler()
+    for name, func, hour, minute in JOBS:
+        scheduler.add_job(timed_job(name, func), 'cron', hour=hour, minute=minute)
+    scheduler.start()
+
+def next_run(after, hour, minute):
+    """Returns the first time after `after` that is hour:minute."""
+    run = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run if run > after else run + timedelta(days=1)
+
+def run_due_jobs():
+    """Runs the daily jobs whose time has come on the current clock."""
+    if _next_runs is None:
+        return
+    now = clock.now()
+    for name, func, hour, minute in JOBS:
+        if now >= _next_runs[name]:
+            _next_runs[name] = next_run(now, hour, minute)
+            try:
+                timed_job(name, func)()
+            except Exception as e:
+                log.error("Error running %s job: %s", name, e)
+
+def housekeeping():
+    """Runs with every metrics dump: refreshes the storage gauges and rotates the slow-query log."""
+    for name, size in database.storage_sizes().items():
+        STORAGE_BYTES.labels(name).set(size)
+    querylog.rotate_slow_log()
+
+def background_logging_task():
+    """
+    A continuous task to read sensor data and log it to the database.
+    Every iteration is also stamped into the live ring, which the web tier
+    reads for /api/realtime and /api/acquisition.
+    Returns only when a replay has played its recording to the end.
+    """
+    log.info("Starting background sensor logging task")
+    try:
+        init_sensors()
+        boot.mark('sensors')
+    except Exception as e:
+        log.error("Error initializing sensors: %s", e)  # Retried by every read below
+    ring = live_ring(writable=True)
+    summary = applog.ReadingSummary(log)
+    upload = bool(outbox.UPLOAD_URL)
+    last_start = None
+    alarm_status = None
+    while True:
+        started = clock.time()
+        tick = time.perf_counter()
+        profiler.poll_request()
+        profiler.tag('acquisition')
+        if last_start is not None:
+            period = tick - last_start
+            LOOP_PERIOD_SECONDS.observe(period)
+            if alarm_status is not None:
+                ALARM_STATE_SECONDS.labels(alarm_status).inc(period)
+        last_start = tick
+        front_pressure = rear_pressure = None
+        alarm_status = None
+        try:
+            front_pressure = get_front_pressure()
+            read = time.perf_counter()
+            SENSOR_READ_SECONDS.labels('front').observe(read - tick)
+            rear_pressure = get_rear_pressure()
+            SENSOR_READ_SECONDS.labels('rear').observe(time.perf_counter() - read)
+            if front_pressure is None or rear_pressure is None:
+                SENSOR_ERRORS.inc()
+            else:
+                boot.mark('first_sample')
+                alarm_status = check_pressure_threshold(front_pressure, rear_pressure)
+                boot.mark('first_alarm_check')
+                # Coalesce alarm samples into episodes for the error log
+                closed_episode = record_alarm_state(alarm_status, front_pressure, rear_pressure)
+                # Log to database for historical records
+                ts = log_reading(front_pressure, rear_pressure)
+                boot.mark('first_logged')
+                if upload:
+                    try:
+                        if ts is not None:
+                            outbox.add_reading(ts, front_pressure, rear_pressure)
+                        if closed_episode is not None:
+                            outbox.add_episode(closed_episode)
+                    except Exception as e:
+                        log.error("Error queueing reading for upload: %s", e)
+                summary.add(front_pressure, rear_pressure)
+                log.debug("Logged new reading: Front=%.3f MPa, Rear=%.3f MPa", front_pressure, rear_pressure)
+        except ReplayFinished:
+            profiler.untag()
+            log.warning("Recording replayed to the end; acquisition stopped")
+            return
+        except Exception as e:
+            SENSOR_ERRORS.inc()
+            log.error("Error in background task: %s", e)
+        try:
+            ring.append(started * 1000, front_pressure, rear_pressure)
+        except Exception as e:
+            log.error("Error updating live ring: %s", e)
+        if upload:
+            try:
+                outbox.close_minute(started * 1000)
+            except Exception as e:
+                log.error("Error queueing minute summary for upload: %s", e)
+        LOOP_WORK_SECONDS.observe(time.perf_counter() - tick)
+        profiler.untag()
+        run_due_jobs()
+        first_iteration_done.set()
+        clock.sleep(LOOP_INTERVAL)
+
+def start_services():
+    """
+    Starts everything the first sample does not need (scheduler, metrics
+    exporter, uploader) once the loop has completed its first iteration.
+    """
+    first_iteration_done.wait(SERVICES_DELAY_LIMIT)
+    try:
+        start_scheduler()
+        metrics.start_exporter('acquisition', before_dump=housekeeping)
+        outbox.start_uploader()
+        boot.mark('services')
+    except Exception as e:
+        log.error("Error starting background services: %s", e)
+    boot.report(log)
+
+def start(in_thread=True):
+    """
+    Sets up GPIO and the database and starts the logging loop, then the
+    scheduler, unless another process already holds the acquisition lock.
+    With in_thread=True the loop runs in a daemon thread and this returns
+    True/False for whether acquisition was started here; otherwise the loop
+    runs in the calling thread and this only returns (True) once a replay
+    has ended, so the process can exit.
+    """
+    if not acquire_lock():
+        log.warning("Acquisition is already running in another process; serving data only")
+        return False
+    boot.mark('lock')
+    setup_gpio()
+    boot.mark('gpio')
+    # Only the lock owner may set up the database: setup closes episodes left open
+    setup_database()
+    boot.mark('database')
+    threading.Thread(target=start_services, daemon=True).start()
+    # kill -USR2 <pid> profiles the loop for profiler.PROFILE_SECONDS (see /admin/profile)
+    signal.signal(signal.SIGUSR2, lambda signum, frame: profiler.request('acquisition'))
+    atexit.register(cleanup)
+    if in_thread:
+        threading.Thread(target=background_logging_task, daemon=True).start()
+        return True
+    background_logging_task()
+    return True
+
+def cleanup():
+    """Ensure GPIO is cleaned up and scheduler is shut down when the process exits"""
+    import RPi.GPIO as GPIO
+    GPIO.cleanup()
+    if scheduler:  # Only shutdown if scheduler exists
+        scheduler.shutdown(wait=False)
+
+if __name__ == '__main__':
+    # Let service managers stop us with SIGTERM and still run the atexit cleanup
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    applog.setup_logging()
+    boot.mark('imports')
+    if not start(in_thread=False):
+        sys.exit(1)
@@ -0,0 +1,171 @@
+# applog.py
+# Logging setup shared by the acquisition service, the web tier and logger.py.
+#
+# Records are handed to a bounded in-memory queue and written to stderr
+# (journald under systemd) by a background listener thread, so a logging call
+# in the sampling loop never does I/O and never formats the message itself.
+# If the queue is full the record is dropped and counted instead of blocking.
+#
+# Lines are logfmt-style key=value pairs; fields passed with extra={...} are
+# added as keys:
+#   ts=2026-03-01T08:00:00.123 level=info logger=acquisition msg="Readings summary" count=120 front_min=0.161
+#
+# Warnings and errors repeating the same message template are rate-limited:
+# the first one goes out, repeats within REPEAT_WINDOW seconds are counted, and
+# the next one after the window reports how many were suppressed.
+# Per-sample values go through ReadingSummary, which logs one min/max/avg line
+# per SUMMARY_INTERVAL instead of one line per reading.
+
+import atexit
+from datetime import datetime
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()  # DEBUG also logs every reading
+QUEUE_SIZE = 10000  # Records waiting for the listener thread before new ones are dropped
+REPEAT_WINDOW = 60.0  # Seconds during which repeats of the same warning/error are suppressed
+SUMMARY_INTERVAL = 60.0  # Seconds covered by one ReadingSummary line
+
+LOG_RECORDS_DROPPED = metrics.counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+LOG_QUEUE_DEPTH = metrics.gauge('log_queue_depth', 'Log records waiting to be written')
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+class LogfmtFormatter(logging.Formatter):
+    """Formats records as key=value pairs, including any extra fields."""
+    def format(self, record):
+        fields = [
+            ('ts', datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')),
+            ('level', record.levelname.lower()),
+            ('logger', record.name),
+            ('msg', record.getMessage()),
+        ]
+        fields.extend((key, value) for key, value in vars(record).items() if key not in _STANDARD_ATTRS)
+        line = ' '.join(f'{key}={self.quote(value)}' for key, value in fields)
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+    @staticmethod
+    def quote(value):
+        if isinstance(value, float):
+            return f'{value:.4f}'
+        text = str(value)
+        if text and not any(c in text for c in ' "=\n'):
+            return text
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues the record as-is: the message is formatted later by the listener,
+    and a full queue drops the record instead of waiting.
+    """
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+        LOG_QUEUE_DEPTH.set(self.queue.qsize())
+
+class RepeatFilter(logging.Filter):
+    """
+    Lets the first warning/error with a given message template through and
+    suppresses repeats for REPEAT_WINDOW seconds. The first one after the
+    window carries a `suppressed` field with the number that were dropped.
+    """
+    def __init__(self, window=REPEAT_WINDOW):
+        super().__init__()
+        self.window = window
+        self.lock = threading.Lock()
+        self.seen = {}  # (logger, template) -> [window start, suppressed count]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            state = self.seen.get(key)
+            if state is not None and now - state[0] < self.window:
+                state[1] += 1
+                return False
+            if state is not None and state[1]:
+                record.suppressed = state[1]
+            self.seen[key] = [now, 0]
+        return True
+
+def setup_logging(level=LOG_LEVEL):
+    """
+    Sends all logging through the queue to stderr. Safe to call more than once;
+    only the first call configures anything.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(QUEUE_SIZE)
+    output = logging.StreamHandler()
+    output.setFormatter(LogfmtFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RepeatFilter())
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # Scheduler chatter is only useful when debugging
+    logging.getLogger('apscheduler').setLevel(max(logging.WARNING, root.level))
+    atexit.register(_listener.stop)  # Flush what is still queued on exit
+
+class ReadingSummary:
+    """
+    Collects readings and logs one line per `interval` seconds with the count
+    and min/max/avg of each channel. add() only updates a few numbers, so it is
+    cheap enough to call for every sample. None values are ignored.
+    """
+    def __init__(self, logger, interval=SUMMARY_INTERVAL, message='Readings summary'):
+        self.logger = logger
+        self.interval = interval
+        self.message = message
+        self.lock = threading.Lock()
+        self.reset(time.monotonic())
+
+    def reset(self, now):
+        self.started = now
+        self.count = 0
+        self.stats = {'front': [0, 0.0, None, None], 'rear': [0, 0.0, None, None]}  # n, sum, min, max
+
+    def add(self, front_pressure, rear_pressure):
+        now = time.monotonic()
+        with self.lock:
+            self.count += 1
+            for name, value in (('front', front_pressure), ('rear', rear_pressure)):
+                if value is None:
+                    continue
+                stat = self.stats[name]
+                stat[0] += 1
+                stat[1] += value
+                stat[2] = value if stat[2] is None else min(stat[2], value)
+                stat[3] = value if stat[3] is None else max(stat[3], value)
+            if now - self.started < self.interval:
+                return
+            fields = {'count': self.count, 'seconds': round(now - self.started, 1)}
+            for name, (n, total, low, high) in self.stats.items():
+                if n:
+                    fields.update({f'{name}_min': low, f'{name}_max': high, f'{name}_avg': total / n})
+            self.reset(now)
+        self.logger.info(self.message, extra=fields)
@@ -0,0 +1,220 @@
+# archive.py
+# Compressed archive of closed days of raw readings.
+#
+# Each archived day is one file made of blocks of up to BLOCK_SIZE samples.
+# Inside a block every column is stored on its own, transformed as in Gorilla:
+#   ts     - first value, then delta-of-delta (zigzag-encoded, so small
+#            negatives stay small)
+#   front  - first value, then XOR against the previous value
+#   rear   - same as front
+# Missing pressures are stored as NaN.
+#
+# Unlike Gorilla the transformed values are not bit-packed into
+# variable-length codes, which can only be decoded one value after another.
+# Every column is kept as 64-bit words, the bytes of the words grouped by
+# position (all lowest bytes first, and so on) and zlib-compressed. The
+# mostly-zero high bytes compress to almost nothing, and decoding is a zlib
+# call plus a few NumPy array operations (cumsum, bitwise_xor.accumulate)
+# per block.
+#
+# File layout:
+#   MAGIC
+#   block 0 .. block N-1   (each: three columns, each prefixed by its byte length)
+#   index                  (one INDEX_ENTRY per block)
+#   footer                 (index offset, block count, MAGIC)
+#
+# Writing is pure Python so it can run on the Pi without extra packages.
+# Reading needs NumPy and decodes straight from a memory-mapped file.
+
+from datetime import date, datetime
+import math
+import mmap
+import os
+import struct
+import zlib
+
+ARCHIVE_DIR = 'archive'  # One archive file per day: archive/readings_YYYY-MM-DD.pga
+# Days of other nodes (readings pushed to a collector) go to archive/<device_id>/
+MAGIC = b'PGA1'
+BLOCK_SIZE = 4096  # Samples per block
+INDEX_ENTRY = struct.Struct('<qqIQI')  # first_ts, last_ts, count, offset, length
+FOOTER = struct.Struct('<QI4s')  # index offset, block count, magic
+COLUMN_LENGTH = struct.Struct('<I')
+WORD_MASK = 0xFFFFFFFFFFFFFFFF
+
+def pack_words(words):
+    """Compresses unsigned 64-bit words, grouped by byte position."""
+    data = struct.pack(f'<{len(words)}Q', *words)
+    return zlib.compress(b''.join(data[i::8] for i in range(8)))
+
+def unpack_words(np, data, offset, length, count):
+    """Reverses pack_words into a uint64 array."""
+    grouped = np.frombuffer(zlib.decompress(data[offset:offset + length]), dtype=np.uint8)
+    return np.ascontiguousarray(grouped.reshape(8, count).T).view('<u8').ravel()
+
+def pack_timestamps(timestamps):
+    """Packs integer millisecond timestamps as the first value and zigzag-encoded delta-of-deltas."""
+    words = [timestamps[0] & WORD_MASK]
+    prev, prev_delta = timestamps[0], 0
+    for ts in timestamps[1:]:
+        delta = ts - prev
+        dod = delta - prev_delta
+        words.append(((dod << 1) ^ (dod >> 63)) & WORD_MASK)
+        prev, prev_delta = ts, delta
+    return pack_words(words)
+
+def unpack_timestamps(np, data, offset, length, count, out):
+    """Decodes a column written by pack_timestamps into the int64 array `out`."""
+    words = unpack_words(np, data, offset, length, count)
+    dod = (words >> np.uint64(1)).view(np.int64) ^ -(words & np.uint64(1)).view(np.int64)
+    dod[0] = 0
+    out[:] = words[:1].view(np.int64) + np.cumsum(np.cumsum(dod))
+
+def pack_floats(values):
+    """Packs floats as XOR against the previous value (the first against 0)."""
+    bits = struct.unpack(f'<{len(values)}Q', struct.pack(f'<{len(values)}d', *(
+        math.nan if value is None else value for value in values)))
+    return pack_words([bits[0]] + [a ^ b for a, b in zip(bits, bits[1:])])
+
+def unpack_floats(np, data, offset, length, count, out):
+    """Decodes a column written by pack_floats into the float64 array `out`."""
+    out[:] = np.bitwise_xor.accumulate(unpack_words(np, data, offset, length, count)).view(np.float64)
+
+def write_archive(path, timestamps, front_values, rear_values):
+    """
+    Writes one archive file from parallel lists of millisecond timestamps and pressures.
+    The file is written to a temporary name first so readers never see a partial file.
+    """
+    index = []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for start in range(0, len(timestamps), BLOCK_SIZE):
+            ts = timestamps[start:start + BLOCK_SIZE]
+            offset = f.tell()
+            for column in (pack_timestamps(ts),
+                           pack_floats(front_values[start:start + BLOCK_SIZE]),
+                           pack_floats(rear_values[start:start + BLOCK_SIZE])):
+                f.write(COLUMN_LENGTH.pack(len(column)))
+                f.write(column)
+            index.append((ts[0], ts[-1], len(ts), offset, f.tell() - offset))
+        index_offset = f.tell()
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+        f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+    os.replace(tmp_path, path)
+
+def read_index(buffer):
+    """Returns the block index of an archive as a list of (first_ts, last_ts, count, offset, length)."""
+    index_offset, block_count, magic = FOOTER.unpack_from(buffer, len(buffer) - FOOTER.size)
+    if magic != MAGIC or buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a pressure archive file')
+    return [INDEX_ENTRY.unpack_from(buffer, index_offset + i * INDEX_ENTRY.size) for i in range(block_count)]
+
+def read_archive(path, start_ms=None, end_ms=None):
+    """
+    Reads an archive file into NumPy arrays.
+    Only blocks overlapping [start_ms, end_ms] are decoded.
+    Returns a dict with 'ts' (int64 ms), 'front_pressure' and 'rear_pressure' (float64).
+    """
+    import numpy as np  # Only needed for reading archives
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        blocks = [
+            entry for entry in read_index(buffer)
+            if (start_ms is None or entry[1] >= start_ms) and (end_ms is None or entry[0] <= end_ms)
+        ]
+        total = sum(entry[2] for entry in blocks)
+        ts = np.empty(total, dtype=np.int64)
+        front = np.empty(total, dtype=np.float64)
+        rear = np.empty(total, dtype=np.float64)
+
+        pos = 0
+        for _, _, count, offset, _ in blocks:
+            for unpack, out in ((unpack_timestamps, ts), (unpack_floats, front), (unpack_floats, rear)):
+                (length,) = COLUMN_LENGTH.unpack_from(buffer, offset)
+                offset += COLUMN_LENGTH.size
+                unpack(np, buffer, offset, length, count, out[pos:pos + count])
+                offset += length
+            pos += count
+
+    if start_ms is not None or end_ms is not None:
+        mask = np.ones(total, dtype=bool)
+        if start_ms is not None:
+            mask &= ts >= start_ms
+        if end_ms is not None:
+            mask &= ts <= end_ms
+        ts, front, rear = ts[mask], front[mask], rear[mask]
+    return {'ts': ts, 'front_pressure': front, 'rear_pressure': rear}
+
+def can_read():
+    """True if NumPy, which reading archives needs, is installed."""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def to_rows(data):
+    """Turns the arrays of read_archive into (ts, front, rear) tuples, with None for missing pressures."""
+    columns = [data['ts'].tolist()]
+    for key in ('front_pressure', 'rear_pressure'):
+        values = data[key].astype(object)
+        values[data[key] != data[key]] = None  # NaN
+        columns.append(values.tolist())
+    return list(zip(*columns))
+
+def archive_dir(device_id=None):
+    """Returns the folder of a device's archives; None is this node."""
+    return ARCHIVE_DIR if device_id is None else os.path.join(ARCHIVE_DIR, device_id)
+
+def archive_path(day, device_id=None):
+    """Returns the file path of the archive for the given day."""
+    return os.path.join(archive_dir(device_id), f'readings_{day.isoformat()}.pga')
+
+def list_archive_devices():
+    """Returns the ids of the other nodes that have an archive folder."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(name for name in os.listdir(ARCHIVE_DIR) if os.path.isdir(os.path.join(ARCHIVE_DIR, name)))
+
+def list_archive_days(start_day=None, end_day=None, device_id=None):
+    """
+    Returns the days that have an archive file, oldest first.
+    If start_day/end_day are given, only days in that range (inclusive) are returned.
+    """
+    days = []
+    folder = archive_dir(device_id)
+    if not os.path.isdir(folder):
+        return days
+    for name in os.listdir(folder):
+        if not (name.startswith('readings_') and name.endswith('.pga')):
+            continue
+        try:
+            day = date.fromisoformat(name[len('readings_'):-len('.pga')])
+        except ValueError:
+            continue
+        if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+            days.append(day)
+    days.sort()
+    return days
+
+def read_archived_range(start_ms, end_ms, device_id=None):
+    """
+    Reads every archived sample of one device (default: this node) in
+    [start_ms, end_ms] across day files.
+    Returns the same dict of NumPy arrays as read_archive.
+    """
+    import numpy as np
+
+    start_day = datetime.fromtimestamp(start_ms / 1000).date()
+    end_day = datetime.fromtimestamp(end_ms / 1000).date()
+    parts = [read_archive(archive_path(day, device_id), start_ms, end_ms)
+             for day in list_archive_days(start_day, end_day, device_id)]
+    if not parts:
+        return {
+            'ts': np.empty(0, dtype=np.int64),
+            'front_pressure': np.empty(0, dtype=np.float64),
+            'rear_pressure': np.empty(0, dtype=np.float64),
+        }
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
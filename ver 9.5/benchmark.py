@@ -0,0 +1,301 @@
+# benchmark.py
+# Benchmarks the database.py query/ingest paths and the Flask endpoints
+# against generated databases of different sizes.
+#
+# Each data size is generated once with generate_history.py into
+# <work-dir>/days_<N> and reused by later runs. Results (latency percentiles,
+# rows/sec, peak memory) are written as JSON so runs can be compared.
+#
+# Example:
+#   python benchmark.py --days 1 7 30 90 --output bench_results.json
+#   python benchmark.py --days 7 --compare bench_results.json
+
+import argparse
+from datetime import datetime, timedelta
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import time
+import tracemalloc
+
+import database
+import generate_history
+import ingest
+import outbox
+
+READY_MARKER = '.generated'  # Written into a data folder once generation has finished
+INGEST_DEVICE = 'bench-node'  # Device the ingest benchmarks push readings as
+INGEST_BATCH = outbox.UPLOAD_BATCH  # Readings per pushed batch, as large as a node sends
+
+def percentile(sorted_values, p):
+    """Returns the p-th percentile (0-100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def count_rows(result):
+    """
+    Number of rows a benchmarked call returned (1 for a single record), or
+    stored for an ingest call. An endpoint call returns its response, which
+    is parsed here, outside the timing.
+    """
+    if hasattr(result, 'get_json'):
+        result = result.get_json(silent=True)
+    if isinstance(result, dict) and 'stored' in result:
+        return result['stored']
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+def measure(func, repeat, warmup=1):
+    """
+    Calls func repeatedly and returns latency percentiles (ms), rows returned,
+    rows/sec and peak traced memory (KiB) for one extra traced call.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+        rows = count_rows(result)
+        del result
+
+    # Peak memory is measured separately because tracing slows every allocation down
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    timings.sort()
+    total_s = sum(timings) / 1000
+    return {
+        'calls': repeat,
+        'p50_ms': percentile(timings, 50),
+        'p90_ms': percentile(timings, 90),
+        'p99_ms': percentile(timings, 99),
+        'max_ms': timings[-1],
+        'mean_ms': statistics.fmean(timings),
+        'rows': rows,
+        'rows_per_sec': rows * repeat / total_s if total_s else None,
+        'peak_kib': peak / 1024,
+    }
+
+def prepare_data(work_dir, days, rate):
+    """Generates (once) and selects the data folder for `days` days of history."""
+    path = os.path.join(work_dir, f'days_{days}')
+    database.set_data_dir(path)
+    if not os.path.exists(os.path.join(path, READY_MARKER)):
+        print(f"Generating {days} day(s) of data in {path} ...")
+        database.setup_database()
+        end_day = datetime.now().date() - timedelta(days=1)
+        generate_history.generate(days, rate, end_day, seed=days, idle_hours=None)
+        database.compact_closed_days()
+        generate_history.fill_ring(24, end_day)
+        open(os.path.join(path, READY_MARKER), 'w').close()
+    database.setup_database()
+    if not database.get_log_readings(limit=1):
+        raise SystemExit(f"No readings in {path}; generate more data (a higher --rate) or delete the folder")
+    return path
+
+class PushedBatches:
+    """
+    Batches of new readings and minute summaries of INGEST_DEVICE, so every
+    ingest call stores rows instead of skipping duplicates. Readings start
+    six days back, inside the raw retention window, and move forward 500 ms
+    apart; minutes start 30 days back.
+    """
+    def __init__(self):
+        now_ms = database.to_ms(datetime.now())
+        self.seq = 0
+        self.reading_ms = now_ms - 6 * 86400000
+        self.minute_ms = (now_ms - 30 * 86400000) // ingest.MINUTE_MS * ingest.MINUTE_MS
+
+    def readings(self, count=INGEST_BATCH):
+        batch = [(self.seq + i + 1, self.reading_ms + i * 500, 0.14, 0.14) for i in range(count)]
+        self.seq += count
+        self.reading_ms += count * 500
+        return batch
+
+    def minutes(self, count=60):
+        batch = [(self.minute_ms + i * ingest.MINUTE_MS, 0.14, 0.13, 0.15, 0.14, 0.13, 0.15, 120)
+                 for i in range(count)]
+        self.minute_ms += count * ingest.MINUTE_MS
+        return batch
+
+def database_cases(days, pushed):
+    """Returns (name, func, repeat) for every database.py function to benchmark."""
+    today = datetime.now().date()
+    week_ago = (today - timedelta(days=min(days, 7))).isoformat()
+    oldest = (today - timedelta(days=days)).isoformat()
+    latest_id = database.get_log_readings(limit=1)[-1]['id']
+    recent_id = database.get_log_readings(limit=500)[0]['id']
+    ring = database.recent_ring()
+    end_ms = database.to_ms(datetime.now())
+
+    def log_readings_batch():
+        for _ in range(100):
+            database.log_reading(0.14, 0.14)
+
+    def alarm_state_batch():
+        for status in ['warning'] * 50 + ['normal']:
+            database.record_alarm_state(status, 0.12, 0.13)
+
+    return [
+        ('get_historical_readings(last 24h)', database.get_historical_readings, 5),
+        ('get_historical_readings(7 days)', lambda: database.get_historical_readings(week_ago, today.isoformat()), 3),
+        ('get_historical_readings(all days)', lambda: database.get_historical_readings(oldest, today.isoformat()), 3),
+        ('get_log_readings(tail)', database.get_log_readings, 50),
+        ('get_log_readings(after_id=newest)', lambda: database.get_log_readings(latest_id), 50),
+        ('get_log_readings(after_id=500 back)', lambda: database.get_log_readings(recent_id), 50),
+        ('get_recent_readings(100)', lambda: database.get_recent_readings(100), 50),
+        ('get_latest_reading', database.get_latest_reading, 50),
+        ('get_hourly_average_readings', database.get_hourly_average_readings, 50),
+        ('get_minutes_average_readings', database.get_minutes_average_readings, 50),
+        ('range_average(10 min, SQLite)', lambda: database.range_average(end_ms - 600000, end_ms), 50),
+        ('ring.window(24h)', lambda: ring.window(end_ms - 86400000, end_ms), 10),
+        ('get_alarm_episodes', database.get_alarm_episodes, 50),
+        ('get_fleet_overview', database.get_fleet_overview, 50),
+        ('log_reading x100', log_readings_batch, 10),
+        ('record_alarm_state x51', alarm_state_batch, 10),
+        (f'ingest_readings({INGEST_BATCH})', lambda: database.ingest_readings(INGEST_DEVICE, pushed.readings()), 10),
+        ('ingest_minutes(60)', lambda: database.ingest_minutes(INGEST_DEVICE, pushed.minutes()), 20),
+        ('compact_partition(1 day)', lambda: database.compact_partition(today - timedelta(days=1)), 2),
+    ]
+
+def endpoint_cases(scale, pushed):
+    """
+    Returns (cases, payload sizes) for the Flask endpoints, where cases is a
+    list of (name, func, repeat). cases is empty if the app cannot be imported
+    here (e.g. no Flask or sensor libraries).
+    """
+    try:
+        import AtsuKanshi
+    except Exception as e:
+        print(f"Skipping endpoint benchmarks: {e}")
+        return [], {}
+    AtsuKanshi.INGEST_ENABLED = True  # Serve POST /api/ingest in this process
+    client = AtsuKanshi.app.test_client()
+    today = datetime.now().date()
+    latest_id = database.get_log_readings(limit=1)[-1]['id']
+    sizes = {}
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            sizes[url] = len(response.data)
+            return response
+        call.url = url
+        return call
+
+    # Batch bodies are gzip-encoded up front, as a node sends them: one per
+    # timed call, plus the warmup and the memory-traced call of measure()
+    ingest_repeat = 10
+    bodies = [ingest.encode_batch(INGEST_DEVICE, pushed.readings())
+              for _ in range(max(1, int(ingest_repeat * scale)) + 2)]
+
+    def post_ingest():
+        return client.post('/api/ingest', data=bodies.pop(), headers={'Content-Encoding': 'gzip'})
+
+    urls = [
+        ('/api/realtime', 200),
+        ('/api/history', 50),
+        (f'/api/history?start_date={(today - timedelta(days=1)).isoformat()}&end_date={today.isoformat()}', 3),
+        ('/api/average/hour', 50),
+        ('/api/average/minute', 50),
+        ('/api/log', 50),
+        (f'/api/log?after_id={latest_id}', 50),
+        ('/api/error-log', 50),
+        ('/api/devices', 50),
+        ('/metrics', 20),
+    ]
+    cases = [(f'GET {url}', get(url), repeat) for url, repeat in urls]
+    cases.append((f'POST /api/ingest({INGEST_BATCH} readings)', post_ingest, ingest_repeat))
+    return cases, sizes
+
+def cleanup_stats(path):
+    """Times cleanup_old_data once on a copy of the data folder, since it changes the data."""
+    copy = path + '_cleanup'
+    shutil.rmtree(copy, ignore_errors=True)
+    shutil.copytree(path, copy)
+    database.set_data_dir(copy)
+    try:
+        return measure(database.cleanup_old_data, 1, warmup=0)
+    finally:
+        database.set_data_dir(path)
+        shutil.rmtree(copy)
+
+def run(days_list, rate, work_dir, scale):
+    results = {}
+    for days in days_list:
+        path = prepare_data(work_dir, days, rate)
+        print(f"\n=== {days} day(s) ===")
+        results[str(days)] = {}
+        pushed = PushedBatches()  # Shared, so the two sets of ingest cases never send the same seq
+        cases = database_cases(days, pushed)
+        endpoints, sizes = endpoint_cases(scale, pushed)
+        for name, func, repeat in cases + endpoints:
+            stats = measure(func, max(1, int(repeat * scale)))
+            if getattr(func, 'url', None) in sizes:
+                stats['payload_bytes'] = sizes[func.url]
+            results[str(days)][name] = stats
+            print(f"{name:45s} p50 {stats['p50_ms']:9.2f} ms  p99 {stats['p99_ms']:9.2f} ms  "
+                  f"rows {stats['rows']:7d}  peak {stats['peak_kib']:9.0f} KiB")
+
+        stats = cleanup_stats(path)
+        results[str(days)]['cleanup_old_data'] = stats
+        print(f"{'cleanup_old_data':45s} {stats['p50_ms']:9.2f} ms")
+    return results
+
+def compare(results, baseline_path):
+    """Prints the p50 ratio of every benchmark against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\n=== Compared with {baseline_path} (p50 new / old) ===")
+    for days, cases in results.items():
+        for name, stats in cases.items():
+            old = baseline.get(days, {}).get(name)
+            if old and old['p50_ms']:
+                print(f"{days:>3} days  {name:45s} {stats['p50_ms'] / old['p50_ms']:6.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark database.py and the Flask endpoints.')
+    parser.add_argument('--days', type=int, nargs='+', default=[1, 7, 30, 90], help='data sizes in days')
+    parser.add_argument('--rate', type=float, default=2.0, help='samples per second of generated data')
+    parser.add_argument('--work-dir', default='bench_data', help='folder for the generated databases')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the number of calls per case')
+    parser.add_argument('--output', default='bench_results.json', help='JSON file to write results to')
+    parser.add_argument('--compare', metavar='JSON', help='previous results file to compare against')
+    args = parser.parse_args()
+
+    started = datetime.now()
+    results = run(args.days, args.rate, args.work_dir, args.scale)
+    report = {
+        'meta': {
+            'started': started.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'rate': args.rate,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# boot.py
+# Startup phase timings, measured from the moment the process was started.
+#
+# The entry points call mark(phase) as each phase finishes; the times go to the
+# boot_phase_seconds metric (one series per process id) and report() logs them
+# as one line. The acquisition service marks, among others:
+#   gpio               - alarm output set up (the GPIO is driven from here on)
+#   first_sample       - both channels read once
+#   first_alarm_check  - first sample went through check_pressure_threshold
+#   first_logged       - first sample stored
+# so time-to-first-sample and time-to-alarm-capability can be compared between
+# versions and boots.
+#
+# Kept free of heavy imports so it can be imported first.
+
+import os
+import time
+
+_origin = None  # time.monotonic() when the process started
+_marks = {}  # phase -> seconds since process start
+
+def process_started():
+    """
+    Returns time.monotonic() at the moment this process was started (before the
+    interpreter itself loaded), read from /proc on Linux. Falls back to the time
+    this module was first imported.
+    """
+    global _origin
+    if _origin is None:
+        try:
+            with open('/proc/self/stat') as f:
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/uptime') as f:
+                uptime = float(f.read().split()[0])
+            age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+            _origin = time.monotonic() - max(0.0, age)
+        except (OSError, ValueError, IndexError):
+            _origin = time.monotonic()
+    return _origin
+
+process_started()
+
+def mark(phase):
+    """Records that `phase` has finished now. Only the first mark of a phase counts."""
+    if phase in _marks:
+        return _marks[phase]
+    elapsed = time.monotonic() - _origin
+    _marks[phase] = elapsed
+    import metrics  # Imported late so importing boot stays instant
+    # Per process: /metrics sums the snapshots of all processes, and every web worker marks web_ready
+    metrics.gauge('boot_phase_seconds', 'Seconds from process start until each startup phase finished',
+                  ['phase', 'pid']).labels(phase, str(os.getpid())).set(elapsed)
+    return elapsed
+
+def timings():
+    """Returns {phase: seconds since process start}, in the order they finished."""
+    return dict(_marks)
+
+def report(logger, message='Startup timings'):
+    """Logs every phase so far as one line, in milliseconds."""
+    logger.info(message, extra={f'{phase}_ms': round(seconds * 1000) for phase, seconds in _marks.items()})
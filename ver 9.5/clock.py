@@ -0,0 +1,114 @@
+# clock.py
+# The time source used by the acquisition pipeline.
+#
+# Code that stamps, schedules or times readings calls clock.time(), clock.now(),
+# clock.monotonic() and clock.sleep() instead of the time/datetime functions, so
+# a run can be switched to another clock with set_clock(). By default they
+# are the system clock. Durations that measure our own work (perf_counter for
+# metrics) stay on real time.
+#
+# VirtualClock runs at a multiple of real time (the replay backend uses it);
+# SimulatedClock only moves when told to, so a month of operation including
+# retention and the daily jobs can be run in minutes:
+#   sim = clock.SimulatedClock(datetime(2026, 3, 1).timestamp())
+#   clock.set_clock(sim)
+#   sim.advance(30 * 86400)
+
+from datetime import datetime
+import threading
+import time as systime
+
+class SystemClock:
+    """The real wall clock."""
+    def time(self):
+        return systime.time()
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return systime.monotonic()
+
+    def sleep(self, seconds):
+        systime.sleep(seconds)
+
+class VirtualClock:
+    """
+    A clock that starts at `start` (Unix seconds) and runs `speed` times faster
+    than real time, e.g. to replay a recording at 10x. With speed=0 it runs as
+    fast as possible: time stands still until sleep() or jump() moves it, and
+    sleep() returns immediately.
+    """
+    def __init__(self, start, speed=1.0):
+        self.lock = threading.Lock()
+        self.speed = speed
+        self._base = start
+        self._real_base = systime.monotonic()
+
+    def time(self):
+        if not self.speed:
+            return self._base
+        return self._base + (systime.monotonic() - self._real_base) * self.speed
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    def monotonic(self):
+        return self.time()
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        if self.speed:
+            systime.sleep(seconds / self.speed)
+        else:
+            with self.lock:
+                self._base += seconds
+
+    def jump(self, to):
+        """Moves the clock forward to `to` without waiting. Never moves it back."""
+        with self.lock:
+            if to > self.time():
+                self._base = to
+                self._real_base = systime.monotonic()
+
+class SimulatedClock(VirtualClock):
+    """
+    A clock that stands still until advance(), jump() or sleep() moves it.
+    Starts at the current real time unless `start` (Unix seconds) is given.
+    """
+    def __init__(self, start=None):
+        super().__init__(systime.time() if start is None else start, speed=0)
+
+    def advance(self, seconds):
+        """Moves the clock forward by `seconds`."""
+        self.sleep(seconds)
+
+_clock = SystemClock()
+
+def set_clock(new_clock):
+    """Makes every clock.* call in this process use `new_clock`."""
+    global _clock
+    _clock = new_clock
+
+def get_clock():
+    return _clock
+
+def is_real():
+    """True while the system clock is in use."""
+    return isinstance(_clock, SystemClock)
+
+def time():
+    """Current time in Unix seconds."""
+    return _clock.time()
+
+def now():
+    """Current local time as a datetime."""
+    return _clock.now()
+
+def monotonic():
+    """Seconds on a clock that never goes back, for measuring intervals."""
+    return _clock.monotonic()
+
+def sleep(seconds):
+    _clock.sleep(seconds)
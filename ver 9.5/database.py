@@ -1,49 +1,752 @@
 # database.py
 # Handles all database interactions for the pressure monitoring system.
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 import json
+import logging
+import math
+import os
+import re
+import socket
 import sqlite3
+from time import perf_counter
+from urllib.request import pathname2url
 
-DB_FILE = 'pressure_data.db'
+import archive
+import clock
+import metrics
+import querylog
+from ring_buffer import RingFile
+
+DB_FILE = 'pressure_data.db'  # Error logs and alarm episodes
+PARTITION_DIR = 'readings'  # Readings are stored in one SQLite file per day in this folder
+ROLLUP_DB_FILE = 'pressure_rollups.db'  # Per-second and per-minute aggregates
+RING_FILE = 'recent_readings.ring'  # Memory-mapped ring of the last ~24 hours (see ring_buffer.py)
+LIVE_RING_FILE = 'live_readings.ring'  # Every acquisition loop sample, including idle ones, for /api/realtime
+LIVE_RING_CAPACITY = 1200  # About 10 minutes of loop iterations
+ACQUISITION_LOCK_FILE = 'acquisition.lock'  # Held by the one process that logs readings (see acquisition.py)
+DATA_DIR = os.environ.get('DATA_DIR')  # Folder of all the files above instead of the working directory (e.g. for a replay)
+RETENTION_DAYS = 30  # Days of error logs and alarm episodes kept by cleanup_old_data
+ARCHIVE_DAYS = 365  # Days of compressed raw archives kept (see archive.py)
+# Retention tiers, finest first: (name, bucket size in ms, days kept).
+# The first tier is the raw day partitions; each later tier is rolled up from the one before.
+RETENTION_TIERS = [
+    ('raw', None, 7),
+    ('1s', 1000, 60),
+    ('1m', 60000, 3 * 365),
+]
+MINUTE_TIER = '1m'  # Tier that per-minute summaries pushed by nodes are stored in
+READING_ID_SPAN = 10 ** 8  # Reading ids are YYYYMMDD * READING_ID_SPAN + row id within that day
 IDLE_PRESSURE_THRESHOLD = 0.029  # MPa — do not log readings at or below this
+LOG_PAGE_LIMIT = 200  # Default number of rows returned to the log page per poll
+ERROR_LOG_PAGE_LIMIT = 50  # Default number of alarm episodes returned per page
+INGEST_ENABLED = os.environ.get('INGEST_ENABLED') == '1'  # This box collects readings pushed by other nodes (POST /api/ingest)
+# Name of this node. Every row it logs carries it, and it is the device the pages show by default.
+DEVICE_ID = os.environ.get('DEVICE_ID') or re.sub(r'[^A-Za-z0-9._-]', '-', socket.gethostname())[:64]
+LOW_PRESSURE_THRESHOLD = 0.125  # MPa, same as pressure_sensor.py
+FLEET_STALE_SECONDS = 180  # A device with no reading for this long is shown as offline (summaries arrive once a minute)
+BACKFILL_RESEND_SECONDS = 3600  # A backfill request handed to a node but not completed is handed out again after this
+
+log = logging.getLogger(__name__)
+
+DB_WRITE_SECONDS = metrics.histogram('db_write_seconds', 'Time to insert and commit one reading', ['phase'])
+ROWS_WRITTEN = metrics.counter('rows_written_total', 'Rows written by table', ['table'])
+READINGS_SKIPPED = metrics.counter('readings_skipped_total', 'Readings not logged because the line was idle')
+INGEST_REJECTED = metrics.counter('ingest_rejected_total', 'Pushed readings not stored, by reason', ['reason'])
+ALARM_ACTIVE = metrics.gauge('alarm_active', '1 while a low-pressure alarm episode is open')
+ALARM_EPISODE_SECONDS = metrics.histogram('alarm_episode_seconds', 'Duration of closed alarm episodes',
+                                          buckets=(1, 5, 15, 30, 60, 120, 300, 900, 3600))
+
+def set_data_dir(path):
+    """
+    Points every data file (main database, partitions, rollups, ring and archives)
+    at the given folder. Used by tools that work on a copy instead of the live data.
+    """
+    global DB_FILE, PARTITION_DIR, ROLLUP_DB_FILE, RING_FILE, LIVE_RING_FILE, ACQUISITION_LOCK_FILE, _ring, _live_ring
+    os.makedirs(path, exist_ok=True)
+    DB_FILE = os.path.join(path, os.path.basename(DB_FILE))
+    PARTITION_DIR = os.path.join(path, os.path.basename(PARTITION_DIR))
+    ROLLUP_DB_FILE = os.path.join(path, os.path.basename(ROLLUP_DB_FILE))
+    RING_FILE = os.path.join(path, os.path.basename(RING_FILE))
+    LIVE_RING_FILE = os.path.join(path, os.path.basename(LIVE_RING_FILE))
+    ACQUISITION_LOCK_FILE = os.path.join(path, os.path.basename(ACQUISITION_LOCK_FILE))
+    archive.ARCHIVE_DIR = os.path.join(path, os.path.basename(archive.ARCHIVE_DIR))
+    metrics.METRICS_DIR = os.path.join(path, os.path.basename(metrics.METRICS_DIR))
+    querylog.SLOW_LOG_FILE = os.path.join(path, os.path.basename(querylog.SLOW_LOG_FILE))
+    for ring in (_ring, _live_ring):
+        if ring is not None:
+            ring.close()
+    _ring = _live_ring = None
+    _ready_files.clear()
+
+# True in processes that only serve data (web workers under wsgi.py)
+READ_ONLY = False
+
+def set_read_only(enabled=True):
+    """
+    Opens every database read-only from now on. Schema setup is skipped and
+    any write fails, so a web worker can never take a write lock that the
+    acquisition process is waiting for.
+    """
+    global READ_ONLY
+    READ_ONLY = enabled
+
+def connect_db(path):
+    """
+    Opens a SQLite file, read-only when READ_ONLY is set.
+    Every query on the connection is timed, and slow ones are logged (see querylog.py).
+    """
+    if READ_ONLY:
+        return sqlite3.connect(f'file:{pathname2url(os.path.abspath(path))}?mode=ro', uri=True, timeout=5.0,
+                               factory=querylog.TimedConnection)
+    return sqlite3.connect(path, timeout=5.0, factory=querylog.TimedConnection)
+
+# --- Day partitions ---
+# Each day's readings live in PARTITION_DIR/readings_YYYY-MM-DD.db with the table
+#   readings(id INTEGER PRIMARY KEY, ts INTEGER, front_pressure REAL, rear_pressure REAL,
+#            device_id TEXT, seq INTEGER)
+# where ts is the Unix time in milliseconds and device_id the node that took the
+# reading (DEVICE_ID for this one). Range queries fan out over the days they
+# cover and retention deletes whole files. Every query is for one device and
+# is served by an index that starts with device_id: (device_id, ts) carries
+# both pressures, so range reads never touch the table itself. seq is only
+# set on readings pushed by other nodes (see ingest_readings).
+
+# Database files whose schema has already been created by this process
+_ready_files = set()
+
+def to_ms(dt):
+    """Converts a local datetime into a Unix timestamp in milliseconds."""
+    return int(dt.timestamp() * 1000)
+
+def ms_to_iso(ms):
+    """Converts a Unix timestamp in milliseconds into a local ISO string."""
+    return datetime.fromtimestamp(ms / 1000).isoformat(timespec='milliseconds')
+
+# to_ms in SQL for the local ISO timestamp column of older versions' readings table,
+# exact to the millisecond ('utc' applies the local offset). Used by sync.py and import_legacy.py.
+LEGACY_TIMESTAMP_MS = '''CAST(strftime('%s', substr(timestamp, 1, 19), 'utc') AS INTEGER) * 1000
+                         + CAST(substr(timestamp || '000', 21, 3) AS INTEGER)'''
+
+def partition_path(day):
+    """Returns the file path of the partition holding the given day's readings."""
+    return os.path.join(PARTITION_DIR, f'readings_{day.isoformat()}.db')
+
+def list_partition_days(start_day=None, end_day=None):
+    """
+    Returns the days that have a partition file, oldest first.
+    If start_day/end_day are given, only days in that range (inclusive) are returned.
+    """
+    days = []
+    if not os.path.isdir(PARTITION_DIR):
+        return days
+    for name in os.listdir(PARTITION_DIR):
+        if not (name.startswith('readings_') and name.endswith('.db')):
+            continue
+        try:
+            day = date.fromisoformat(name[len('readings_'):-len('.db')])
+        except ValueError:
+            continue
+        if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+            days.append(day)
+    days.sort()
+    return days
+
+def connect_partition(day, create=False):
+    """
+    Opens the partition for the given day.
+    Returns None if it does not exist, unless create is True.
+    """
+    path = partition_path(day)
+    if READ_ONLY:
+        return connect_db(path) if os.path.exists(path) else None
+    if path not in _ready_files:
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(PARTITION_DIR, exist_ok=True)
+        conn = connect_db(path)
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS readings (
+                id INTEGER PRIMARY KEY,
+                ts INTEGER NOT NULL,
+                front_pressure REAL,
+                rear_pressure REAL,
+                device_id TEXT,
+                seq INTEGER
+            )
+        ''')
+        # Partitions written before ingest existed have no device columns yet
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(readings)')}
+        for column, kind in (('device_id', 'TEXT'), ('seq', 'INTEGER')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE readings ADD COLUMN {column} {kind}')
+        conn.execute('DROP INDEX IF EXISTS idx_readings_ts')
+        # Covering, so history and averages read one device's rows in ts order from the index alone
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_readings_device_ts
+            ON readings (device_id, ts, front_pressure, rear_pressure)
+        ''')
+        # Log page cursor (ids of one device in order)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_readings_device_id ON readings (device_id, id)')
+        # A resent reading hits this index and is skipped (NULLs never collide, so local readings don't)
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_device_seq ON readings (device_id, seq)')
+        # Readings logged before devices were tracked are this node's own
+        conn.execute('UPDATE readings SET device_id = ? WHERE device_id IS NULL', (DEVICE_ID,))
+        conn.commit()
+        _ready_files.add(path)
+        return conn
+    return connect_db(path)
+
+def make_reading_id(day, row_id):
+    """Builds the global reading id from a partition day and its row id."""
+    return (day.year * 10000 + day.month * 100 + day.day) * READING_ID_SPAN + row_id
+
+def split_reading_id(reading_id):
+    """Splits a global reading id back into (day, row id)."""
+    day_key, row_id = divmod(reading_id, READING_ID_SPAN)
+    return date(day_key // 10000, day_key // 100 % 100, day_key % 100), row_id
+
+def query_partitions(start_ms, end_ms, query, params=()):
+    """
+    Runs a query against every partition overlapping [start_ms, end_ms] and
+    yields (day, rows) per partition, oldest first.
+    The query must take ts bounds as its first two parameters.
+    """
+    start_day = datetime.fromtimestamp(start_ms / 1000).date()
+    end_day = datetime.fromtimestamp(end_ms / 1000).date()
+    for day in list_partition_days(start_day, end_day):
+        conn = connect_partition(day)
+        if conn is None:
+            continue
+        try:
+            rows = conn.execute(query, (start_ms, end_ms) + tuple(params)).fetchall()
+        finally:
+            conn.close()
+        yield day, rows
+
+def range_average(start_ms, end_ms, device_id=None):
+    """
+    Averages both channels of one device (default: this node) over
+    [start_ms, end_ms] across partitions.
+    Returns (front_average, rear_average), or (None, None) if there is no data.
+    """
+    totals = [0.0, 0, 0.0, 0]
+    query = '''
+        SELECT SUM(front_pressure), COUNT(front_pressure), SUM(rear_pressure), COUNT(rear_pressure)
+        FROM readings
+        WHERE ts BETWEEN ? AND ? AND device_id = ?
+    '''
+    for _, rows in query_partitions(start_ms, end_ms, query, (device_id or DEVICE_ID,)):
+        front_sum, front_count, rear_sum, rear_count = rows[0]
+        totals[0] += front_sum or 0.0
+        totals[1] += front_count
+        totals[2] += rear_sum or 0.0
+        totals[3] += rear_count
+    front_average = totals[0] / totals[1] if totals[1] else None
+    rear_average = totals[2] / totals[3] if totals[3] else None
+    return front_average, rear_average
+
+# --- Retention tiers ---
+# Raw samples live in the day partitions. Closed days are rolled up into
+# per-second and per-minute aggregates in ROLLUP_DB_FILE, one table per tier:
+#   readings_<name>(device_id TEXT, ts INTEGER, front_avg, front_min, front_max,
+#                   rear_avg, rear_min, rear_max, sample_count,
+#                   PRIMARY KEY (device_id, ts)) WITHOUT ROWID
+# where ts is the start of the bucket in milliseconds. WITHOUT ROWID stores the
+# rows in primary key order, so one device's buckets are contiguous on disk.
+
+def create_tier_table(conn, name):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS readings_{name} (
+            device_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            front_avg REAL,
+            front_min REAL,
+            front_max REAL,
+            rear_avg REAL,
+            rear_min REAL,
+            rear_max REAL,
+            sample_count INTEGER,
+            PRIMARY KEY (device_id, ts)
+        ) WITHOUT ROWID
+    ''')
+
+def migrate_tier_table(conn, name):
+    """Rebuilds a tier table from before devices were tracked, filing its rows under this node."""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info(readings_{name})')}
+    if not columns or 'device_id' in columns:
+        return
+    log.info("Adding device_id to rollup tier %s", name)
+    conn.execute(f'ALTER TABLE readings_{name} RENAME TO readings_{name}_old')
+    create_tier_table(conn, name)
+    conn.execute(f'''
+        INSERT INTO readings_{name}
+        SELECT ?, ts, front_avg, front_min, front_max, rear_avg, rear_min, rear_max, sample_count
+        FROM readings_{name}_old
+    ''', (DEVICE_ID,))
+    conn.execute(f'DROP TABLE readings_{name}_old')
+
+def connect_rollups():
+    """
+    Opens the rollup database, creating the tier tables if needed.
+    """
+    conn = connect_db(ROLLUP_DB_FILE)
+    if ROLLUP_DB_FILE not in _ready_files and not READ_ONLY:
+        conn.execute('PRAGMA journal_mode=WAL;')
+        for name, bucket_ms, _ in RETENTION_TIERS[1:]:
+            migrate_tier_table(conn, name)
+            create_tier_table(conn, name)
+        # Days of raw data that have already been rolled up
+        conn.execute('CREATE TABLE IF NOT EXISTS compacted_days (day TEXT PRIMARY KEY)')
+        conn.commit()
+        _ready_files.add(ROLLUP_DB_FILE)
+    return conn
+
+def tier_cutoff_ms(days):
+    """Returns the oldest timestamp (ms) a tier keeping `days` days still covers."""
+    return to_ms(clock.now() - timedelta(days=days))
+
+def compact_partition(day):
+    """
+    Rolls one day of raw readings up through every rollup tier.
+    Safe to run more than once for the same day.
+    """
+    conn = connect_partition(day)
+    if conn is None:
+        return
+    connect_rollups().close()
+    start_ms = to_ms(datetime.combine(day, time.min))
+    end_ms = to_ms(datetime.combine(day + timedelta(days=1), time.min)) - 1
+
+    try:
+        conn.execute('ATTACH DATABASE ? AS rollup', (ROLLUP_DB_FILE,))
+        # Raw samples -> first rollup tier
+        name, bucket_ms, _ = RETENTION_TIERS[1]
+        conn.execute(f'''
+            INSERT OR REPLACE INTO rollup.readings_{name}
+            SELECT device_id, (ts / ?) * ?, AVG(front_pressure), MIN(front_pressure), MAX(front_pressure),
+                   AVG(rear_pressure), MIN(rear_pressure), MAX(rear_pressure), COUNT(*)
+            FROM readings
+            GROUP BY device_id, ts / ?
+        ''', (bucket_ms, bucket_ms, bucket_ms))
+        # Each rollup tier -> the next, coarser one, a primary key range per device
+        devices = [row[0] for row in conn.execute('SELECT DISTINCT device_id FROM readings')]
+        for (source, _, _), (name, bucket_ms, _) in zip(RETENTION_TIERS[1:], RETENTION_TIERS[2:]):
+            for device_id in devices:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO rollup.readings_{name}
+                    SELECT device_id, (ts / ?) * ?,
+                           SUM(front_avg * sample_count) / SUM(sample_count), MIN(front_min), MAX(front_max),
+                           SUM(rear_avg * sample_count) / SUM(sample_count), MIN(rear_min), MAX(rear_max),
+                           SUM(sample_count)
+                    FROM rollup.readings_{source}
+                    WHERE device_id = ? AND ts BETWEEN ? AND ?
+                    GROUP BY ts / ?
+                ''', (bucket_ms, bucket_ms, device_id, start_ms, end_ms, bucket_ms))
+        conn.execute('INSERT OR REPLACE INTO rollup.compacted_days (day) VALUES (?)', (day.isoformat(),))
+        conn.commit()
+    finally:
+        conn.close()
+
+def compact_closed_days():
+    """
+    Rolls every finished day that has not been compacted yet into the rollup tiers.
+    Run in the background shortly after midnight; cleanup_old_data also calls it
+    so raw data is never dropped before it has been rolled up.
+    """
+    conn = connect_rollups()
+    done = {row[0] for row in conn.execute('SELECT day FROM compacted_days')}
+    conn.close()
+
+    today = clock.now().date()
+    for day in list_partition_days(end_day=today - timedelta(days=1)):
+        if day.isoformat() in done:
+            continue
+        try:
+            compact_partition(day)
+        except Exception as e:
+            log.error("Error compacting %s: %s", day, e)
+
+def tier_rows(name, start_ms, end_ms, device_id=None):
+    """
+    Returns one device's rollup rows of one tier in [start_ms, end_ms] as
+    (ts, front_avg, rear_avg), oldest first.
+    """
+    if READ_ONLY and not os.path.exists(ROLLUP_DB_FILE):
+        return []
+    conn = connect_rollups()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT ts, front_avg, rear_avg
+        FROM readings_{name}
+        WHERE device_id = ? AND ts BETWEEN ? AND ?
+        ORDER BY ts ASC
+    ''', (device_id or DEVICE_ID, start_ms, end_ms))
+    data = cursor.fetchall()
+    conn.close()
+    return data
+
+def query_tier(name, start_ms, end_ms, device_id=None):
+    """
+    Returns one device's rollup rows of one tier in [start_ms, end_ms] as
+    reading dictionaries, using the bucket averages as the pressure values.
+    """
+    return [
+        {'timestamp': ms_to_iso(r[0]), 'front_pressure': r[1], 'rear_pressure': r[2]}
+        for r in tier_rows(name, start_ms, end_ms, device_id)
+    ]
+
+def archived_rows(days, start_ms, end_ms, device_id):
+    """
+    Reads one device's raw readings in [start_ms, end_ms] back from the
+    archives of the given days, as (ts, front, rear) tuples, oldest first.
+    """
+    folder = None if is_local(device_id) else device_id
+    rows = []
+    for day in days:
+        rows.extend(archive.to_rows(archive.read_archive(archive.archive_path(day, folder), start_ms, end_ms)))
+    return rows
+
+def fill_from_minutes(rows, start_ms, end_ms, device_id):
+    """
+    Adds the minute-tier averages of the minutes in [start_ms, end_ms] that
+    have no finer rows. A node that uploads summaries (see outbox.py) only
+    has minutes here, except where raw data was backfilled.
+    rows are (ts, front, rear) tuples, oldest first.
+    """
+    covered = {r[0] // 60000 for r in rows}
+    extra = [r for r in tier_rows(MINUTE_TIER, start_ms, end_ms, device_id) if r[0] // 60000 not in covered]
+    if not extra:
+        return rows
+    return sorted(rows + extra, key=lambda r: r[0])
+
+# --- Recent readings ring ---
+
+# Ring file opened by this process (writable in the acquisition process)
+_ring = None
+
+def recent_ring(writable=False):
+    """
+    Returns the ring file of recent readings, or None if it has not been created yet.
+    Pass writable=True from the process that logs readings.
+    """
+    global _ring
+    if _ring is None or (writable and not _ring.writable):
+        if not writable and not os.path.exists(RING_FILE):
+            return None
+        _ring = RingFile(RING_FILE, writable=writable)
+    return _ring
+
+# Live ring opened by this process (see live_ring)
+_live_ring = None
+
+def live_ring(writable=False):
+    """
+    Returns the ring of acquisition loop samples, or None if it has not been created yet.
+    The acquisition process appends one record per loop iteration, with the loop
+    start time as ts and NaN pressures when a sensor read failed, so other
+    processes can serve /api/realtime and the loop timing from it.
+    """
+    global _live_ring
+    if _live_ring is None or (writable and not _live_ring.writable):
+        if not writable and not os.path.exists(LIVE_RING_FILE):
+            return None
+        _live_ring = RingFile(LIVE_RING_FILE, capacity=LIVE_RING_CAPACITY, writable=writable)
+    return _live_ring
+
+def get_live_reading():
+    """
+    Returns the newest complete sample of the acquisition loop as a dictionary,
+    whether or not it was logged, or None if there is none yet.
+    """
+    ring = live_ring()
+    if ring is None:
+        return None
+    for ts, front, rear in reversed(ring.latest(10)):
+        if not (math.isnan(front) or math.isnan(rear)):
+            return {'timestamp': ms_to_iso(ts), 'front_pressure': front, 'rear_pressure': rear}
+    return None
+
+def get_loop_periods(last):
+    """Returns the newest `last` acquisition loop periods in seconds, oldest first."""
+    ring = live_ring()
+    if ring is None or last <= 0:
+        return []
+    starts = [r[0] for r in ring.latest(last + 1)]
+    return [(b - a) / 1000 for a, b in zip(starts, starts[1:])]
+
+def ring_average(ring, start_ms, end_ms):
+    """
+    Averages both channels over [start_ms, end_ms] from the ring.
+    Returns (front_average, rear_average), or (None, None) if there is no data.
+    """
+    records = ring.window(start_ms, end_ms)
+    front = [r[1] for r in records if not math.isnan(r[1])]
+    rear = [r[2] for r in records if not math.isnan(r[2])]
+    return (sum(front) / len(front) if front else None,
+            sum(rear) / len(rear) if rear else None)
+
+def is_local(device_id):
+    """True for this node's own device (the one the rings hold)."""
+    return device_id is None or device_id == DEVICE_ID
+
+def recent_average(start_ms, end_ms, device_id=None):
+    """
+    Averages both channels of one device over a recent window, from the ring
+    when it is this node and the ring still covers the window, and from the
+    partitions otherwise.
+    """
+    if is_local(device_id):
+        ring = recent_ring()
+        if ring is not None and ring.covers(start_ms):
+            return ring_average(ring, start_ms, end_ms)
+    return range_average(start_ms, end_ms, device_id)
+
+def storage_sizes():
+    """
+    Returns the size in bytes of each kind of data file, including the SQLite
+    write-ahead logs, which grow if a reader keeps a checkpoint from completing.
+    """
+    def size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    partitions = [partition_path(day) for day in list_partition_days()]
+    archives = [archive.archive_path(day, device_id)
+                for device_id in [None] + archive.list_archive_devices()
+                for day in archive.list_archive_days(device_id=device_id)]
+    return {
+        'main': size(DB_FILE),
+        'main_wal': size(DB_FILE + '-wal'),
+        'rollups': size(ROLLUP_DB_FILE),
+        'rollups_wal': size(ROLLUP_DB_FILE + '-wal'),
+        'partitions': sum(size(path) for path in partitions),
+        'partitions_wal': sum(size(path + '-wal') for path in partitions),
+        'archives': sum(size(path) for path in archives),
+        'rings': size(RING_FILE) + size(LIVE_RING_FILE),
+    }
+
+# --- Devices ---
+# The devices table in DB_FILE holds one row per node with its newest reading:
+#   devices(device_id TEXT PRIMARY KEY, first_seen, last_ts, front_pressure,
+#           rear_pressure, last_seq, received)
+# with times in Unix milliseconds. ingest_readings and ingest_minutes keep the
+# rows of pushing nodes up to date, so the fleet overview is one primary key
+# scan. This node's own live values come from the live ring instead of a
+# write per sample.
+#
+# Nodes that upload summaries keep their raw readings to themselves. Raw data
+# for a range is asked for with a row in
+#   backfill_requests(id, device_id, start_ts, end_ts, requested, offered, done)
+# which the collector hands to the node in its answer to the node's next push
+# (see offer_backfills); the node sends the readings and then reports the
+# request done.
+
+def connect_devices():
+    """Opens DB_FILE, creating the devices and backfill_requests tables if needed."""
+    conn = connect_db(DB_FILE)
+    if DB_FILE not in _ready_files and not READ_ONLY:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id TEXT PRIMARY KEY,
+                first_seen INTEGER,
+                last_ts INTEGER,
+                front_pressure REAL,
+                rear_pressure REAL,
+                last_seq INTEGER,
+                received INTEGER
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_requests (
+                id INTEGER PRIMARY KEY,
+                device_id TEXT NOT NULL,
+                start_ts INTEGER NOT NULL,
+                end_ts INTEGER NOT NULL,
+                requested INTEGER,
+                offered INTEGER,
+                done INTEGER
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_backfill_requests_device ON backfill_requests (device_id, done)')
+        conn.commit()
+        _ready_files.add(DB_FILE)
+    return conn
+
+def register_device(device_id):
+    """Adds a device to the devices table if it is not there yet."""
+    conn = connect_devices()
+    try:
+        conn.execute('INSERT OR IGNORE INTO devices (device_id, first_seen) VALUES (?, ?)',
+                     (device_id, to_ms(clock.now())))
+        conn.commit()
+    finally:
+        conn.close()
+
+def list_devices():
+    """Returns the ids of every known device, this node first."""
+    if READ_ONLY and not os.path.exists(DB_FILE):
+        return [DEVICE_ID]
+    conn = connect_devices()
+    try:
+        devices = [row[0] for row in conn.execute('SELECT device_id FROM devices ORDER BY device_id')]
+    finally:
+        conn.close()
+    return sorted(set(devices) | {DEVICE_ID}, key=lambda device_id: (device_id != DEVICE_ID, device_id))
+
+def device_status(last_ts, front_pressure, rear_pressure, now_ms):
+    """Classifies a device's newest reading the way check_pressure_threshold does, or as offline."""
+    pressures = [p for p in (front_pressure, rear_pressure) if p is not None]
+    if last_ts is None or now_ms - last_ts > FLEET_STALE_SECONDS * 1000 or not pressures:
+        return 'offline'
+    if min(pressures) <= IDLE_PRESSURE_THRESHOLD:
+        return 'idle'
+    if min(pressures) < LOW_PRESSURE_THRESHOLD:
+        return 'warning'
+    return 'normal'
+
+def get_fleet_overview():
+    """
+    Returns the newest state of every device as a list of dictionaries, this
+    node first: its newest reading, seq and status (normal, warning, idle or
+    offline when nothing arrived for FLEET_STALE_SECONDS).
+    """
+    now_ms = to_ms(clock.now())
+    rows = []
+    if not READ_ONLY or os.path.exists(DB_FILE):
+        conn = connect_devices()
+        try:
+            rows = conn.execute('''
+                SELECT device_id, last_ts, front_pressure, rear_pressure, last_seq, received
+                FROM devices
+                ORDER BY device_id
+            ''').fetchall()
+        finally:
+            conn.close()
+
+    devices = {r[0]: r for r in rows}
+    ring = live_ring()
+    local = ring.latest(1) if ring is not None else []
+    if local:
+        ts, front, rear = local[-1]
+        front = None if math.isnan(front) else front
+        rear = None if math.isnan(rear) else rear
+        devices[DEVICE_ID] = (DEVICE_ID, ts, front, rear, None, ts)
+    elif DEVICE_ID not in devices:
+        devices[DEVICE_ID] = (DEVICE_ID, None, None, None, None, None)
+
+    return [
+        {
+            'device_id': device_id,
+            'local': device_id == DEVICE_ID,
+            'timestamp': ms_to_iso(last_ts) if last_ts is not None else None,
+            'front_pressure': front,
+            'rear_pressure': rear,
+            'last_seq': seq,
+            'received': ms_to_iso(received) if received is not None else None,
+            'status': device_status(last_ts, front, rear, now_ms),
+        }
+        for device_id, last_ts, front, rear, seq, received
+        in sorted(devices.values(), key=lambda r: (r[0] != DEVICE_ID, r[0]))
+    ]
+
+def get_device_reading(device_id):
+    """
+    Returns the newest reading of a device as a dictionary, or None if there is none:
+    the live ring for this node, the devices table for the others.
+    """
+    if is_local(device_id):
+        return get_live_reading()
+    if READ_ONLY and not os.path.exists(DB_FILE):
+        return None
+    conn = connect_devices()
+    try:
+        row = conn.execute('SELECT last_ts, front_pressure, rear_pressure FROM devices WHERE device_id = ?',
+                           (device_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or row[0] is None:
+        return None
+    return {'timestamp': ms_to_iso(row[0]), 'front_pressure': row[1], 'rear_pressure': row[2]}
 
 def setup_database():
     """
     Sets up the SQLite database and creates the required tables.
+    Readings partitions are created on demand by connect_partition.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    conn = connect_db(DB_FILE)
     cursor = conn.cursor()
     cursor.execute('PRAGMA journal_mode=WAL;')
     
-    # Create readings table
+    # Create error_logs table
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS readings (
+        CREATE TABLE IF NOT EXISTS error_logs (
             id INTEGER PRIMARY KEY,
             timestamp TEXT,
             front_pressure REAL,
-            rear_pressure REAL
+            rear_pressure REAL,
+            error_type TEXT,
+            device_id TEXT,
+            seq INTEGER
         )
     ''')
-    
-    # Create error_logs table
+
+    # Create alarm_episodes table: one row per low-pressure alarm, updated in place while open
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS error_logs (
+        CREATE TABLE IF NOT EXISTS alarm_episodes (
             id INTEGER PRIMARY KEY,
-            timestamp TEXT,
-            front_pressure REAL,
-            rear_pressure REAL,
-            error_type TEXT
+            start_ts TEXT,
+            end_ts TEXT,
+            min_front_pressure REAL,
+            min_rear_pressure REAL,
+            duration REAL,
+            sample_count INTEGER,
+            error_type TEXT,
+            is_open INTEGER,
+            device_id TEXT,
+            seq INTEGER
         )
     ''')
+
+    # Rows written before devices were tracked are this node's own
+    for table in ('error_logs', 'alarm_episodes'):
+        columns = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+        if 'device_id' not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN device_id TEXT')
+            cursor.execute(f'UPDATE {table} SET device_id = ?', (DEVICE_ID,))
+        if 'seq' not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN seq INTEGER')
+
+    # Index timestamps so range queries and cleanup don't scan the whole table
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_error_logs_timestamp ON error_logs (timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarm_episodes_start ON alarm_episodes (start_ts)')
+    # Per-device pages
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_error_logs_device_timestamp ON error_logs (device_id, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarm_episodes_device_id ON alarm_episodes (device_id, id)')
+    # Episodes pushed by other nodes carry the node's episode id; a resent one hits this index
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_alarm_episodes_device_seq ON alarm_episodes (device_id, seq)')
+    # Same for error logs copied from another node's database (see sync.py)
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_error_logs_device_seq ON error_logs (device_id, seq)')
+
+    # An episode left open by a previous run can never be continued, so close it
+    cursor.execute('UPDATE alarm_episodes SET is_open = 0 WHERE is_open = 1')
     
     conn.commit()
     conn.close()
 
+    connect_devices().close()
+    register_device(DEVICE_ID)
+    # Open every partition and the rollups once, so files from before devices were tracked are migrated
+    for day in list_partition_days():
+        connect_partition(day).close()
+    connect_rollups().close()
+
 def log_reading(front_pressure, rear_pressure):
     """
     Logs a new pressure reading to the database.
     Will skip saving if both values are None or if any provided reading is at/below idle threshold.
+    Returns the timestamp (ms) the reading was stored with, or None if it was skipped.
     """
     # Don't log if there's no data
     if front_pressure is None and rear_pressure is None:
@@ -52,151 +755,606 @@ def log_reading(front_pressure, rear_pressure):
     # Don't log if any available reading indicates the system is idle
     if (front_pressure is not None and front_pressure <= IDLE_PRESSURE_THRESHOLD) or \
        (rear_pressure is not None and rear_pressure <= IDLE_PRESSURE_THRESHOLD):
+        READINGS_SKIPPED.inc()
         return
 
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
+    now = clock.now()
+    ts = to_ms(now)
+    conn = connect_partition(now.date(), create=True)
     cursor = conn.cursor()
-    timestamp = datetime.now().isoformat()
-    cursor.execute('INSERT INTO readings (timestamp, front_pressure, rear_pressure) VALUES (?, ?, ?)',
-                   (timestamp, front_pressure, rear_pressure))
+    started = perf_counter()
+    cursor.execute('INSERT INTO readings (ts, front_pressure, rear_pressure, device_id) VALUES (?, ?, ?, ?)',
+                   (ts, front_pressure, rear_pressure, DEVICE_ID))
+    inserted = perf_counter()
     conn.commit()
+    DB_WRITE_SECONDS.labels('insert').observe(inserted - started)
+    DB_WRITE_SECONDS.labels('commit').observe(perf_counter() - inserted)
+    ROWS_WRITTEN.labels('readings').inc()
     conn.close()
 
+    # Keep the recent-readings ring in step for dashboard queries
+    recent_ring(writable=True).append(ts, front_pressure, rear_pressure)
+    return ts
+
+def ingest_readings(device_id, readings):
+    """
+    Stores a batch of readings pushed by another node, with one executemany and
+    one transaction per day partition the batch touches.
+    readings is a list of (seq, ts, front_pressure, rear_pressure) with ts in
+    Unix milliseconds. A (device_id, seq) that is already stored is skipped, so
+    a node can resend a batch it got no answer for. Readings older than the raw
+    retention window are refused, since their day has already been rolled up.
+    The device's row in the devices table is moved on to the newest reading.
+    Returns a dictionary with the number stored, duplicates and too_old.
+    """
+    oldest_ms = to_ms(datetime.combine(clock.now().date() - timedelta(days=RETENTION_TIERS[0][2]), time.min))
+    today = clock.now().date()
+    by_day = {}
+    too_old = 0
+    for seq, ts, front_pressure, rear_pressure in readings:
+        if ts < oldest_ms:
+            too_old += 1
+            continue
+        day = datetime.fromtimestamp(ts / 1000).date()
+        by_day.setdefault(day, []).append((ts, front_pressure, rear_pressure, device_id, seq))
+
+    stored = 0
+    reopened = []  # Closed days that received late readings
+    for day, rows in sorted(by_day.items()):
+        conn = connect_partition(day, create=True)
+        try:
+            before = conn.total_changes
+            started = perf_counter()
+            conn.executemany('''
+                INSERT OR IGNORE INTO readings (ts, front_pressure, rear_pressure, device_id, seq)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            DB_WRITE_SECONDS.labels('ingest').observe(perf_counter() - started)
+            added = conn.total_changes - before
+        finally:
+            conn.close()
+        stored += added
+        if added and day < today:
+            reopened.append(day.isoformat())
+
+    newest = max((r for rows in by_day.values() for r in rows), key=lambda r: r[0], default=None)
+    if newest is not None:
+        update_device(device_id, newest[4], newest[0], newest[1], newest[2])
+
+    if reopened:
+        # Have the next compaction roll those days up again
+        conn = connect_rollups()
+        conn.executemany('DELETE FROM compacted_days WHERE day = ?', [(day,) for day in reopened])
+        conn.commit()
+        conn.close()
+
+    duplicates = len(readings) - too_old - stored
+    ROWS_WRITTEN.labels('readings').inc(stored)
+    INGEST_REJECTED.labels('duplicate').inc(duplicates)
+    INGEST_REJECTED.labels('too_old').inc(too_old)
+    return {'stored': stored, 'duplicates': duplicates, 'too_old': too_old}
+
+def update_device(device_id, seq, ts, front_pressure, rear_pressure):
+    """Records a pushed reading as the device's newest, unless a newer one is already stored."""
+    now_ms = to_ms(clock.now())
+    conn = connect_devices()
+    try:
+        # Every SET expression sees the old row, so the pressures are compared with the old last_ts
+        conn.execute('''
+            INSERT INTO devices (device_id, first_seen, last_ts, front_pressure, rear_pressure, last_seq, received)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (device_id) DO UPDATE SET
+                front_pressure = CASE WHEN excluded.last_ts >= COALESCE(last_ts, 0)
+                                      THEN excluded.front_pressure ELSE front_pressure END,
+                rear_pressure = CASE WHEN excluded.last_ts >= COALESCE(last_ts, 0)
+                                     THEN excluded.rear_pressure ELSE rear_pressure END,
+                last_ts = MAX(COALESCE(last_ts, 0), excluded.last_ts),
+                last_seq = MAX(COALESCE(last_seq, 0), COALESCE(excluded.last_seq, 0)),
+                received = excluded.received
+        ''', (device_id, now_ms, ts, front_pressure, rear_pressure, seq, now_ms))
+        conn.commit()
+    finally:
+        conn.close()
+
+def ingest_minutes(device_id, minutes):
+    """
+    Stores per-minute summaries pushed by a node that does not upload every
+    reading, straight into the minute tier. minutes are tuples in the order
+    of ingest.MINUTE_FIELDS. A resent minute replaces the stored one.
+    Returns a dictionary with the number stored and too_old.
+    """
+    cutoff = tier_cutoff_ms(next(days for name, _, days in RETENTION_TIERS if name == MINUTE_TIER))
+    rows = [(device_id,) + tuple(minute) for minute in minutes if minute[0] >= cutoff]
+    if rows:
+        conn = connect_rollups()
+        try:
+            started = perf_counter()
+            conn.executemany(f'INSERT OR REPLACE INTO readings_{MINUTE_TIER} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.commit()
+            DB_WRITE_SECONDS.labels('ingest').observe(perf_counter() - started)
+        finally:
+            conn.close()
+        newest = max(rows, key=lambda r: r[1])
+        update_device(device_id, None, newest[1] + 60000 - 1, newest[2], newest[5])
+    ROWS_WRITTEN.labels(f'readings_{MINUTE_TIER}').inc(len(rows))
+    INGEST_REJECTED.labels('too_old').inc(len(minutes) - len(rows))
+    return {'stored': len(rows), 'too_old': len(minutes) - len(rows)}
+
+def ingest_episodes(device_id, episodes):
+    """
+    Stores closed alarm episodes pushed by a node. episodes are tuples in the
+    order of ingest.EPISODE_FIELDS; seq is the node's own episode id, so a
+    resent episode is skipped. Returns a dictionary with the number stored
+    and duplicates.
+    """
+    rows = [(ms_to_iso(start_ts), ms_to_iso(end_ts), min_front, min_rear, (end_ts - start_ts) / 1000,
+             sample_count, error_type, device_id, seq)
+            for seq, start_ts, end_ts, min_front, min_rear, sample_count, error_type in episodes]
+    conn = connect_db(DB_FILE)
+    try:
+        before = conn.total_changes
+        conn.executemany('''
+            INSERT OR IGNORE INTO alarm_episodes (start_ts, end_ts, min_front_pressure, min_rear_pressure,
+                                                  duration, sample_count, error_type, is_open, device_id, seq)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)
+        ''', rows)
+        conn.commit()
+        stored = conn.total_changes - before
+    finally:
+        conn.close()
+    ROWS_WRITTEN.labels('alarm_episodes').inc(stored)
+    INGEST_REJECTED.labels('duplicate').inc(len(rows) - stored)
+    return {'stored': stored, 'duplicates': len(rows) - stored}
+
+def request_backfill(device_id, start_ms, end_ms):
+    """
+    Asks a node for its raw readings in [start_ms, end_ms], widened to whole
+    minutes so the minutes rolled up from them match the summaries already
+    stored. Returns the request as a dictionary.
+    """
+    start_ms -= start_ms % 60000
+    end_ms += 60000 - 1 - end_ms % 60000
+    conn = connect_devices()
+    try:
+        cursor = conn.execute('''
+            INSERT INTO backfill_requests (device_id, start_ts, end_ts, requested) VALUES (?, ?, ?, ?)
+        ''', (device_id, start_ms, end_ms, to_ms(clock.now())))
+        conn.commit()
+        request_id = cursor.lastrowid
+    finally:
+        conn.close()
+    return {'id': request_id, 'start_ts': start_ms, 'end_ts': end_ms}
+
+def offer_backfills(device_id):
+    """
+    Returns the device's open backfill requests as dictionaries and marks
+    them as handed out. A request that is not done BACKFILL_RESEND_SECONDS
+    after it was handed out is handed out again.
+    """
+    now_ms = to_ms(clock.now())
+    conn = connect_devices()
+    try:
+        rows = conn.execute('''
+            SELECT id, start_ts, end_ts FROM backfill_requests
+            WHERE device_id = ? AND done IS NULL AND (offered IS NULL OR offered < ?)
+            ORDER BY id
+        ''', (device_id, now_ms - BACKFILL_RESEND_SECONDS * 1000)).fetchall()
+        if rows:
+            conn.executemany('UPDATE backfill_requests SET offered = ? WHERE id = ?', [(now_ms, r[0]) for r in rows])
+            conn.commit()
+    finally:
+        conn.close()
+    return [{'id': r[0], 'start_ts': r[1], 'end_ts': r[2]} for r in rows]
+
+def complete_backfills(device_id, request_ids):
+    """Marks backfill requests of a device as done."""
+    if not request_ids:
+        return
+    now_ms = to_ms(clock.now())
+    conn = connect_devices()
+    try:
+        conn.executemany('UPDATE backfill_requests SET done = ? WHERE device_id = ? AND id = ? AND done IS NULL',
+                         [(now_ms, device_id, request_id) for request_id in request_ids])
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_backfills(device_id, limit=ERROR_LOG_PAGE_LIMIT):
+    """Returns the newest backfill requests of a device as dictionaries, newest first."""
+    if READ_ONLY and not os.path.exists(DB_FILE):
+        return []
+    conn = connect_devices()
+    try:
+        rows = conn.execute('''
+            SELECT id, start_ts, end_ts, requested, offered, done FROM backfill_requests
+            WHERE device_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (device_id, limit)).fetchall()
+    finally:
+        conn.close()
+
+    def iso(ms):
+        return ms_to_iso(ms) if ms is not None else None
+
+    return [
+        {'id': r[0], 'start': iso(r[1]), 'end': iso(r[2]), 'requested': iso(r[3]),
+         'offered': iso(r[4]), 'done': iso(r[5])}
+        for r in rows
+    ]
+
 def log_error_event(front_pressure, rear_pressure, error_type):
     """
     Logs an error event to the database. Error logging continues 24/7.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
+    conn = connect_db(DB_FILE)
     cursor = conn.cursor()
-    timestamp = datetime.now().isoformat()
+    timestamp = clock.now().isoformat()
     
     try:
         cursor.execute('''
-            INSERT INTO error_logs (timestamp, front_pressure, rear_pressure, error_type)
-            VALUES (?, ?, ?, ?)
-        ''', (timestamp, front_pressure, rear_pressure, error_type))
+            INSERT INTO error_logs (timestamp, front_pressure, rear_pressure, error_type, device_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (timestamp, front_pressure, rear_pressure, error_type, DEVICE_ID))
         conn.commit()
     except Exception as e:
-        print(f"Error logging error event: {e}")
+        log.error("Error logging error event: %s", e)
+    finally:
+        conn.close()
+
+def open_alarm_episode(front_pressure, rear_pressure, error_type='low_pressure'):
+    """
+    Starts a new alarm episode with the first alarming sample.
+    Returns the id of the new episode.
+    """
+    conn = connect_db(DB_FILE)
+    cursor = conn.cursor()
+    timestamp = clock.now().isoformat()
+    cursor.execute('''
+        INSERT INTO alarm_episodes (start_ts, end_ts, min_front_pressure, min_rear_pressure,
+                                    duration, sample_count, error_type, is_open, device_id)
+        VALUES (?, ?, ?, ?, 0.0, 1, ?, 1, ?)
+    ''', (timestamp, timestamp, front_pressure, rear_pressure, error_type, DEVICE_ID))
+    episode_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    ROWS_WRITTEN.labels('alarm_episodes').inc()
+    return episode_id
+
+def update_alarm_episode(episode_id, front_pressure=None, rear_pressure=None, close=False):
+    """
+    Extends an open alarm episode up to now.
+    If pressures are given, they count as one more sample and update the minimums.
+    If close is True, the episode is marked as finished.
+    """
+    conn = connect_db(DB_FILE)
+    cursor = conn.cursor()
+    timestamp = clock.now().isoformat()
+    samples = 0 if front_pressure is None and rear_pressure is None else 1
+    cursor.execute('''
+        UPDATE alarm_episodes
+        SET end_ts = ?,
+            duration = (julianday(?) - julianday(start_ts)) * 86400.0,
+            min_front_pressure = MIN(min_front_pressure, COALESCE(?, min_front_pressure)),
+            min_rear_pressure = MIN(min_rear_pressure, COALESCE(?, min_rear_pressure)),
+            sample_count = sample_count + ?,
+            is_open = ?
+        WHERE id = ?
+    ''', (timestamp, timestamp, front_pressure, rear_pressure, samples, 0 if close else 1, episode_id))
+    conn.commit()
+    conn.close()
+
+# Id of the alarm episode currently being recorded (None when no alarm is active)
+current_episode_id = None
+current_episode_started = None  # clock.monotonic() when it was opened
+
+def record_alarm_state(status, front_pressure, rear_pressure):
+    """
+    Feeds the alarm status returned by check_pressure_threshold into the episode store.
+    Consecutive "warning" samples are coalesced into one episode;
+    the episode is closed on the first sample that is not a warning.
+    Returns the id of the episode this sample closed, otherwise None.
+    """
+    global current_episode_id, current_episode_started
+
+    closed = None
+    try:
+        if status == "warning":
+            if current_episode_id is None:
+                current_episode_id = open_alarm_episode(front_pressure, rear_pressure)
+                current_episode_started = clock.monotonic()
+                ALARM_ACTIVE.set(1)
+            else:
+                update_alarm_episode(current_episode_id, front_pressure, rear_pressure)
+        elif current_episode_id is not None:
+            update_alarm_episode(current_episode_id, close=True)
+            ALARM_EPISODE_SECONDS.observe(clock.monotonic() - current_episode_started)
+            ALARM_ACTIVE.set(0)
+            closed, current_episode_id = current_episode_id, None
+    except Exception as e:
+        log.error("Error recording alarm episode: %s", e)
+    return closed
+
+def drop_partition(day):
+    """
+    Deletes the partition file for the given day, including its WAL and shared-memory files.
+    """
+    path = partition_path(day)
+    _ready_files.discard(path)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def archive_partition(day):
+    """
+    Packs one closed day of raw readings into compressed archive files, one
+    per device (this node's in ARCHIVE_DIR, the others in a subfolder each).
+    Returns True if the archives exist afterwards.
+    """
+    conn = connect_partition(day)
+    if conn is None:
+        return False
+    try:
+        for (device_id,) in conn.execute('SELECT DISTINCT device_id FROM readings').fetchall():
+            folder = None if is_local(device_id) else device_id
+            path = archive.archive_path(day, folder)
+            if os.path.exists(path):
+                continue
+            rows = conn.execute('''
+                SELECT ts, front_pressure, rear_pressure FROM readings
+                WHERE device_id = ?
+                ORDER BY ts ASC
+            ''', (device_id,)).fetchall()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            timestamps, front_values, rear_values = (list(column) for column in zip(*rows))
+            archive.write_archive(path, timestamps, front_values, rear_values)
     finally:
         conn.close()
+    return True
 
 def cleanup_old_data():
     """
-    Removes data older than 30 days from both readings and error_logs tables.
+    Applies the retention horizon of every tier, and removes error logs and
+    alarm episodes older than RETENTION_DAYS days.
+    Raw readings are only dropped after they have been rolled up and archived,
+    and are removed by deleting whole day partitions, so this never scans or
+    locks the partition the logging thread is writing to.
     Should be run once per day at end of working hours.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
+    compact_closed_days()
+
+    try:
+        conn = connect_rollups()
+        compacted = {row[0] for row in conn.execute('SELECT day FROM compacted_days')}
+
+        # Drop whole days of raw readings
+        raw_cutoff = clock.now() - timedelta(days=RETENTION_TIERS[0][2])
+        for day in list_partition_days(end_day=raw_cutoff.date() - timedelta(days=1)):
+            if day.isoformat() in compacted and archive_partition(day):
+                drop_partition(day)
+
+        # Delete whole archive files past their horizon
+        archive_cutoff = clock.now().date() - timedelta(days=ARCHIVE_DAYS)
+        for folder in [None] + archive.list_archive_devices():
+            for day in archive.list_archive_days(end_day=archive_cutoff - timedelta(days=1), device_id=folder):
+                os.remove(archive.archive_path(day, folder))
+
+        # Delete expired buckets from each rollup tier (a primary key range per device)
+        devices = list_devices()
+        for name, _, days in RETENTION_TIERS[1:]:
+            cutoff = tier_cutoff_ms(days)
+            conn.executemany(f'DELETE FROM readings_{name} WHERE device_id = ? AND ts < ?',
+                             [(device_id, cutoff) for device_id in devices])
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        log.error("Error during cleanup: %s", e)
+
+    conn = connect_db(DB_FILE)
     cursor = conn.cursor()
-    
-    # Calculate cutoff date (30 days ago)
-    cutoff_date = (datetime.now() - timedelta(days=30)).isoformat()
+    cutoff_date = (clock.now() - timedelta(days=RETENTION_DAYS)).isoformat()
     
     try:
-        # Delete old readings
-        cursor.execute('DELETE FROM readings WHERE timestamp < ?', (cutoff_date,))
         # Delete old error logs
         cursor.execute('DELETE FROM error_logs WHERE timestamp < ?', (cutoff_date,))
+        # Delete old alarm episodes
+        cursor.execute('DELETE FROM alarm_episodes WHERE start_ts < ? AND is_open = 0', (cutoff_date,))
         conn.commit()
     except Exception as e:
-        print(f"Error during cleanup: {e}")
+        log.error("Error during cleanup: %s", e)
     finally:
         conn.close()
 
-def get_historical_readings(start_date=None, end_date=None):
+def get_historical_readings(start_date=None, end_date=None, device_id=None):
     """
-    Retrieves historical pressure readings. 
+    Retrieves historical pressure readings of one device (default: this node).
     If start_date and end_date are provided, filters by range.
     Otherwise, returns the last 24 hours of data.
-    
+    Each part of the range is served from the finest retention tier that still
+    covers it, so older parts come back as per-second or per-minute averages.
+    Minutes a device only sent a summary for come back as minute averages.
+    A range no longer than the raw retention window also reaches back into
+    the archives, so an archived day comes back as raw readings.
+
     start_date and end_date should be in YYYY-MM-DD format (e.g., "2026-02-15")
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
-    cursor = conn.cursor()
-    
     if start_date and end_date:
-        # Convert dates to include full day range (00:00:00 to 23:59:59)
-        start_datetime = f"{start_date}T00:00:00"
-        end_datetime = f"{end_date}T23:59:59"
-        query = 'SELECT timestamp, front_pressure, rear_pressure FROM readings WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp ASC'
-        cursor.execute(query, (start_datetime, end_datetime))
+        # Convert dates to include full day range (00:00:00 to 23:59:59.999)
+        start_ms = to_ms(datetime.combine(date.fromisoformat(start_date), time.min))
+        end_ms = to_ms(datetime.combine(date.fromisoformat(end_date) + timedelta(days=1), time.min)) - 1
     else:
         # Default behavior: last 24 hours
-        one_day_ago = (datetime.now() - timedelta(days=1)).isoformat()
-        query = 'SELECT timestamp, front_pressure, rear_pressure FROM readings WHERE timestamp >= ? ORDER BY timestamp ASC'
-        cursor.execute(query, (one_day_ago,))
-        
-    data = cursor.fetchall()
-    conn.close()
-    
+        now = clock.now()
+        start_ms = to_ms(now - timedelta(days=1))
+        end_ms = to_ms(now)
+
+    device_id = device_id or DEVICE_ID
+    raw_days = list_partition_days()
+    raw_start_ms = to_ms(datetime.combine(raw_days[0], time.min)) if raw_days else end_ms + 1
+    archived_days = []  # Archived days without a partition
+    if end_ms - start_ms < RETENTION_TIERS[0][2] * 86400000 and archive.can_read():
+        archived_days = [day for day in archive.list_archive_days(
+            datetime.fromtimestamp(start_ms / 1000).date(), datetime.fromtimestamp(end_ms / 1000).date(),
+            None if is_local(device_id) else device_id) if day not in raw_days]
+        if archived_days:
+            raw_start_ms = min(raw_start_ms, to_ms(datetime.combine(archived_days[0], time.min)))
+
+    # Split the range into (tier, start, end) segments, newest first
+    segments = []
+    upper = end_ms
+    for name, _, days in RETENTION_TIERS:
+        if upper < start_ms:
+            break
+        lower = max(start_ms, raw_start_ms if name == 'raw' else tier_cutoff_ms(days))
+        if lower <= upper:
+            segments.append((name, lower, upper))
+        upper = min(upper, lower - 1)
+
+    query = '''
+        SELECT ts, front_pressure, rear_pressure FROM readings
+        WHERE ts BETWEEN ? AND ? AND device_id = ?
+        ORDER BY ts ASC
+    '''
+    result = []
+    for name, lower, upper in reversed(segments):
+        if name == 'raw':
+            rows = [r for _, part in query_partitions(lower, upper, query, (device_id,)) for r in part]
+            if archived_days:
+                rows = sorted(rows + archived_rows(archived_days, lower, upper, device_id), key=lambda r: r[0])
+        else:
+            rows = tier_rows(name, lower, upper, device_id)
+        if name != MINUTE_TIER:
+            rows = fill_from_minutes(rows, lower, upper, device_id)
+        result.extend(
+            {'timestamp': ms_to_iso(r[0]), 'front_pressure': r[1], 'rear_pressure': r[2]}
+            for r in rows
+        )
+    return result
+
+def get_log_readings(after_id=None, limit=LOG_PAGE_LIMIT, device_id=None):
+    """
+    Retrieves one device's readings for the live log page using the reading id as a cursor.
+    If after_id is given, returns up to `limit` readings newer than that id.
+    Otherwise, returns the most recent `limit` readings.
+    Both cases are keyset lookups on each partition's (device_id, id) index,
+    so the cost does not grow with the amount of stored data.
+    The tail only looks at the cursor's day and later ones: rows stored in an
+    earlier day's partition after the cursor moved on (readings ingested or
+    synced late) are never returned by it.
+    """
+    device_id = device_id or DEVICE_ID
+    rows = []  # (day, row) pairs, oldest first
+
+    if after_id is not None:
+        after_day, after_row = split_reading_id(after_id)
+        for day in list_partition_days(start_day=after_day):
+            conn = connect_partition(day)
+            if conn is None:
+                continue
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, ts, front_pressure, rear_pressure
+                FROM readings
+                WHERE device_id = ? AND id > ?
+                ORDER BY id ASC
+                LIMIT ?
+            ''', (device_id, after_row if day == after_day else 0, limit - len(rows)))
+            rows.extend((day, r) for r in cursor.fetchall())
+            conn.close()
+            if len(rows) >= limit:
+                break
+    else:
+        # Walk back from the newest partition until we have enough rows
+        for day in reversed(list_partition_days()):
+            conn = connect_partition(day)
+            if conn is None:
+                continue
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, ts, front_pressure, rear_pressure
+                FROM readings
+                WHERE device_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (device_id, limit - len(rows)))
+            rows[:0] = [(day, r) for r in reversed(cursor.fetchall())]
+            conn.close()
+            if len(rows) >= limit:
+                break
+
     return [
-        {'timestamp': r[0], 'front_pressure': r[1], 'rear_pressure': r[2]}
-        for r in data
-    ] 
+        {'id': make_reading_id(day, r[0]), 'timestamp': ms_to_iso(r[1]),
+         'front_pressure': r[2], 'rear_pressure': r[3]}
+        for day, r in rows
+    ]
 
-def get_latest_reading():
+def get_recent_readings(limit=100, device_id=None):
     """
-    Retrieves the latest pressure reading from the database.
+    Retrieves the newest `limit` readings of one device, oldest first, for chart bootstraps.
+    This node's are served from the ring file; other devices, or this node
+    before there is a ring, from the partitions.
+    """
+    ring = recent_ring() if is_local(device_id) else None
+    if ring is None:
+        return [
+            {k: r[k] for k in ('timestamp', 'front_pressure', 'rear_pressure')}
+            for r in get_log_readings(limit=limit, device_id=device_id)
+        ]
+    return [
+        {'timestamp': ms_to_iso(r[0]),
+         'front_pressure': None if math.isnan(r[1]) else r[1],
+         'rear_pressure': None if math.isnan(r[2]) else r[2]}
+        for r in ring.latest(limit)
+    ]
+
+def get_latest_reading(device_id=None):
+    """
+    Retrieves the latest pressure reading of one device from the database.
     Returns a dictionary.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
-    cursor = conn.cursor()
-    cursor.execute('SELECT timestamp, front_pressure, rear_pressure FROM readings ORDER BY timestamp DESC LIMIT 1')
-    data = cursor.fetchone()
-    conn.close()
-    
-    if data:
-        return {'timestamp': data[0], 'front_pressure': data[1], 'rear_pressure': data[2]}
+    for day in reversed(list_partition_days()):
+        conn = connect_partition(day)
+        if conn is None:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT ts, front_pressure, rear_pressure FROM readings
+            WHERE device_id = ?
+            ORDER BY ts DESC
+            LIMIT 1
+        ''', (device_id or DEVICE_ID,))
+        data = cursor.fetchone()
+        conn.close()
+
+        if data:
+            return {'timestamp': ms_to_iso(data[0]), 'front_pressure': data[1], 'rear_pressure': data[2]}
     return None
 
-def get_hourly_average_readings():
+def get_hourly_average_readings(device_id=None):
     """
     Calculates the average pressure for the last 10 minutes (was 1 hour).
     Returns a dictionary with the average values.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
-    cursor = conn.cursor()
-    
-    # Calculate the timestamp for ten minutes ago
-    ten_minutes_ago = datetime.now() - timedelta(minutes=10)
-    
-    # Query for all readings in the last 10 minutes
-    cursor.execute('''
-        SELECT AVG(front_pressure), AVG(rear_pressure)
-        FROM readings
-        WHERE timestamp >= ?
-    ''', (ten_minutes_ago.isoformat(),))
-    
-    data = cursor.fetchone()
-    conn.close()
-    
-    if data and data[0] is not None and data[1] is not None:
-        return {'front_average': data[0], 'rear_average': data[1]}
+    # Average over readings from ten minutes ago until now
+    now = clock.now()
+    front_average, rear_average = recent_average(to_ms(now - timedelta(minutes=10)), to_ms(now), device_id)
+
+    if front_average is not None and rear_average is not None:
+        return {'front_average': front_average, 'rear_average': rear_average}
     return {'front_average': 0.0, 'rear_average': 0.0} # Return 0 if no data is found
 
-def get_minutes_average_readings():
+def get_minutes_average_readings(device_id=None):
     """
     Calculates the average pressure for the last minute.
     Returns a dictionary with the average values.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
-    cursor = conn.cursor()
-    
-    # Calculate the timestamp for one minute ago
-    one_minute_ago = datetime.now() - timedelta(minutes=1)
-    
-    # Query for all readings in the last minute
-    cursor.execute('''
-        SELECT AVG(front_pressure), AVG(rear_pressure)
-        FROM readings
-        WHERE timestamp >= ?
-    ''', (one_minute_ago.isoformat(),))
-    
-    data = cursor.fetchone()
-    conn.close()
-    
-    if data and data[0] is not None and data[1] is not None:
-        return {'front_averageM': data[0], 'rear_averageM': data[1]}
+    # Average over readings from one minute ago until now
+    now = clock.now()
+    front_average, rear_average = recent_average(to_ms(now - timedelta(minutes=1)), to_ms(now), device_id)
+
+    if front_average is not None and rear_average is not None:
+        return {'front_averageM': front_average, 'rear_averageM': rear_average}
     return {'front_averageM': 0.0, 'rear_averageM': 0.0} # Return 0 if no data is found
 
 def get_historical_readings_json():
@@ -207,20 +1365,20 @@ def get_historical_readings_json():
     readings = get_historical_readings()
     return json.dumps(readings)
 
-def get_error_logs():
+def get_error_logs(device_id=None):
     """
-    Retrieves error logs from the last 24 hours.
+    Retrieves one device's error logs from the last 24 hours.
     Returns a list of dictionaries.
     """
-    conn = sqlite3.connect(DB_FILE, timeout=5.0)
+    conn = connect_db(DB_FILE)
     cursor = conn.cursor()
-    one_day_ago = datetime.now() - timedelta(days=1)
+    one_day_ago = clock.now() - timedelta(days=1)
     cursor.execute('''
         SELECT timestamp, front_pressure, rear_pressure, error_type
         FROM error_logs
-        WHERE timestamp >= ?
+        WHERE device_id = ? AND timestamp >= ?
         ORDER BY timestamp DESC
-    ''', (one_day_ago.isoformat(),))
+    ''', (device_id or DEVICE_ID, one_day_ago.isoformat()))
     data = cursor.fetchall()
     conn.close()
     
@@ -233,3 +1391,61 @@ def get_error_logs():
         }
         for r in data
     ]
+
+def get_alarm_episode(episode_id):
+    """Retrieves one alarm episode as a dictionary (see get_alarm_episodes), or None."""
+    conn = connect_db(DB_FILE)
+    try:
+        row = conn.execute('''
+            SELECT id, start_ts, end_ts, min_front_pressure, min_rear_pressure,
+                   duration, sample_count, error_type, is_open
+            FROM alarm_episodes
+            WHERE id = ?
+        ''', (episode_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return dict(zip(('id', 'start_ts', 'end_ts', 'min_front_pressure', 'min_rear_pressure',
+                     'duration', 'sample_count', 'error_type'), row[:8]), is_open=bool(row[8]))
+
+def get_alarm_episodes(before_id=None, limit=ERROR_LOG_PAGE_LIMIT, device_id=None):
+    """
+    Retrieves one device's alarm episodes, newest first.
+    Pass before_id (the oldest id already shown) to get the next page.
+    Returns a list of dictionaries.
+    """
+    conn = connect_db(DB_FILE)
+    cursor = conn.cursor()
+    query = '''
+        SELECT id, start_ts, end_ts, min_front_pressure, min_rear_pressure,
+               duration, sample_count, error_type, is_open
+        FROM alarm_episodes
+        WHERE device_id = ?
+    '''
+    device_id = device_id or DEVICE_ID
+    if before_id is not None:
+        cursor.execute(query + ' AND id < ? ORDER BY id DESC LIMIT ?', (device_id, before_id, limit))
+    else:
+        cursor.execute(query + ' ORDER BY id DESC LIMIT ?', (device_id, limit))
+    data = cursor.fetchall()
+    conn.close()
+
+    return [
+        {
+            'id': r[0],
+            'start_ts': r[1],
+            'end_ts': r[2],
+            'min_front_pressure': r[3],
+            'min_rear_pressure': r[4],
+            'duration': r[5],
+            'sample_count': r[6],
+            'error_type': r[7],
+            'is_open': bool(r[8])
+        }
+        for r in data
+    ]
+
+# Applied once everything set_data_dir touches exists
+if DATA_DIR:
+    set_data_dir(DATA_DIR)
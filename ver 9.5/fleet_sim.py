@@ -0,0 +1,257 @@
+# fleet_sim.py
+# Simulates a fleet of Pi nodes pushing readings to a central collector.
+#
+# Every node is an asyncio task in this one process with its own seeded
+# compressor profile (sim_model.CompressorModel) and fault schedule. A node
+# samples its two channels every --nodes / --rate seconds, so the whole fleet
+# produces --rate readings per second, and pushes what it has collected every
+# --push-interval seconds over its own keep-alive HTTP connection, as a
+# gzip-compressed batch in the format of ingest.py (POST /api/ingest on a
+# collector started with INGEST_ENABLED=1).
+#
+# Faults, drawn per node at --faults-per-hour:
+#   leak     - extra air loss that pulls the line below the alarm threshold
+#   idle     - the line is switched off and bleeds down to zero
+#   dropout  - one sensor returns no reading (null)
+#   offline  - the node cannot reach the collector; readings queue up (at most
+#              --max-backlog) and are sent in one burst when it is back
+# Failed pushes (connection errors, 429 and 5xx) are kept and retried with the
+# next push; other 4xx responses drop the batch.
+#
+# Example, against a collector on this machine:
+#   python fleet_sim.py --nodes 200 --rate 400 --duration 120
+#
+# The report shows pushes and readings per second, push latency and the
+# responses by status.
+
+import argparse
+import asyncio
+import collections
+import itertools
+import random
+import time
+from urllib.parse import urlsplit
+
+import ingest
+from sim_model import CompressorModel
+
+FAULT_SECONDS = {  # Duration range of each fault kind, in seconds
+    'leak': (20, 180),
+    'idle': (60, 600),
+    'dropout': (5, 60),
+    'offline': (10, 300),
+}
+
+class Stats:
+    """Fleet-wide counters; every node runs on the same event loop, so no locking."""
+    def __init__(self):
+        self.readings = 0  # Generated
+        self.sent = 0  # Accepted by the collector
+        self.dropped = 0  # Rejected with a 4xx, or pushed out of a full backlog
+        self.pushes = 0
+        self.errors = 0  # Connection errors and timeouts
+        self.bytes = 0  # Request bodies sent, as compressed
+        self.statuses = collections.Counter()
+        self.latencies = []
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+class Connection:
+    """A minimal HTTP/1.1 keep-alive client for one node."""
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.reader = self.writer = None
+
+    async def post(self, path, body, compressed):
+        """
+        Sends one JSON POST and returns the response status. A kept-alive
+        connection the server has meanwhile closed is retried once on a new one.
+        """
+        reused = self.writer is not None
+        try:
+            return await asyncio.wait_for(self._post(path, body, compressed), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, IndexError):
+            if not reused:
+                raise
+            self.close()
+            return await asyncio.wait_for(self._post(path, body, compressed), self.timeout)
+
+    async def _post(self, path, body, compressed):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        encoding = 'Content-Encoding: gzip\r\n' if compressed else ''
+        self.writer.write(
+            f'POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: application/json\r\n'
+            f'{encoding}Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n'.encode() + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length, close = 0, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value == 'close':
+                close = True
+        if length:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+def fault_schedule(rng, duration, per_hour):
+    """Returns [(start, end, kind)] in seconds from the start of the run."""
+    faults = []
+    if per_hour <= 0:
+        return faults
+    for kind, (shortest, longest) in FAULT_SECONDS.items():
+        start = rng.expovariate(per_hour / 3600)
+        while start < duration:
+            faults.append((start, start + rng.uniform(shortest, longest), kind))
+            start += rng.expovariate(per_hour / 3600)
+    return faults
+
+class Node:
+    """One simulated Pi: samples its line and pushes readings to the collector."""
+    def __init__(self, index, args, stats):
+        self.device_id = f'{args.prefix}-{index:03d}'
+        self.args = args
+        self.stats = stats
+        self.rng = random.Random(args.seed * 100003 + index)
+        self.model = CompressorModel(self.rng)
+        self.faults = fault_schedule(self.rng, args.duration, args.faults_per_hour)
+        self.dropout_channel = self.rng.choice(('front', 'rear'))
+        self.leak_rate = self.rng.uniform(0.5, 1.5) * self.model.fill_rate
+        self.seq = 0
+        self.backlog = collections.deque()
+        self.connection = Connection(args.host, args.port, args.timeout)
+
+    def active_faults(self, elapsed):
+        return {kind for start, end, kind in self.faults if start <= elapsed < end}
+
+    def sample(self, dt, faults):
+        front, rear = self.model.step(dt, leak=self.leak_rate if 'leak' in faults else 0.0,
+                                      powered='idle' not in faults)
+        if 'dropout' in faults:
+            if self.dropout_channel == 'front':
+                front = None
+            else:
+                rear = None
+        self.seq += 1
+        if len(self.backlog) >= self.args.max_backlog:
+            self.backlog.popleft()
+            self.stats.dropped += 1
+        self.backlog.append((self.seq, int(time.time() * 1000), front, rear))
+        self.stats.readings += 1
+
+    async def push(self):
+        batch = list(itertools.islice(self.backlog, self.args.max_batch))
+        body = ingest.encode_batch(self.device_id, batch, self.args.compress)
+        self.stats.bytes += len(body)
+        started = time.perf_counter()
+        try:
+            status = await self.connection.post(self.args.path, body, self.args.compress)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            self.connection.close()
+            self.stats.errors += 1
+            return
+        self.stats.latencies.append(time.perf_counter() - started)
+        self.stats.pushes += 1
+        self.stats.statuses[status] += 1
+        if status < 300:
+            self.stats.sent += len(batch)
+        elif status == 429 or status >= 500:
+            return  # Kept for the next push
+        else:
+            self.stats.dropped += len(batch)
+        for _ in batch:
+            self.backlog.popleft()
+
+    async def run(self, started):
+        interval = self.args.nodes / self.args.rate
+        # Nodes are not switched on at the same moment
+        next_sample = started + self.rng.uniform(0, interval)
+        next_push = started + self.rng.uniform(0, self.args.push_interval)
+        end = started + self.args.duration
+        last = None
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now >= end:
+                break
+            faults = self.active_faults(now - started)
+            if now >= next_sample:
+                self.sample(interval if last is None else now - last, faults)
+                last = now
+                next_sample += interval
+            if now >= next_push:
+                next_push += self.args.push_interval
+                if self.backlog and 'offline' not in faults:
+                    await self.push()
+            await asyncio.sleep(max(0.0, min(next_sample, next_push, end) - loop.time()))
+        self.connection.close()
+
+async def report(stats, started, every):
+    """Prints one progress line every `every` seconds."""
+    loop = asyncio.get_running_loop()
+    last_sent, last_pushes, last_time = 0, 0, started
+    while True:
+        await asyncio.sleep(every)
+        now = loop.time()
+        dt = now - last_time
+        print(f"{now - started:7.0f} s  readings/s {(stats.sent - last_sent) / dt:8.1f}  pushes/s "
+              f"{(stats.pushes - last_pushes) / dt:7.1f}  p95 {stats.percentile(0.95):7.1f} ms  "
+              f"errors {stats.errors:5d}  statuses {dict(stats.statuses)}", flush=True)
+        last_sent, last_pushes, last_time = stats.sent, stats.pushes, now
+
+async def run(args):
+    stats = Stats()
+    nodes = [Node(i + 1, args, stats) for i in range(args.nodes)]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    reporter = asyncio.create_task(report(stats, started, args.report_interval))
+    await asyncio.gather(*(node.run(started) for node in nodes))
+    reporter.cancel()
+    return stats, loop.time() - started, sum(len(node.backlog) for node in nodes)
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a fleet of nodes pushing readings to a collector.')
+    parser.add_argument('--url', default='http://127.0.0.1:5300/api/ingest', help='ingest endpoint of the collector')
+    parser.add_argument('--nodes', type=int, default=200, help='number of simulated nodes')
+    parser.add_argument('--rate', type=float, default=400.0, help='readings per second of the whole fleet')
+    parser.add_argument('--push-interval', type=float, default=5.0, help='seconds between pushes of one node')
+    parser.add_argument('--max-batch', type=int, default=500, help='readings per push at most')
+    parser.add_argument('--no-compress', dest='compress', action='store_false', help='send batches without gzip')
+    parser.add_argument('--max-backlog', type=int, default=10000, help='readings a node keeps while it cannot push')
+    parser.add_argument('--faults-per-hour', type=float, default=2.0, help='faults of each kind per node per hour')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds to run')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds before a push is given up')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between progress lines')
+    parser.add_argument('--prefix', default='line', help='device id prefix')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the node profiles and fault schedules')
+    args = parser.parse_args()
+
+    parts = urlsplit(args.url)
+    args.host, args.port, args.path = parts.hostname, parts.port or 80, parts.path or '/'
+    print(f"Running {args.nodes} nodes at {args.rate:g} readings/s for {args.duration:.0f} s against {args.url} ...")
+    stats, elapsed, unsent = asyncio.run(run(args))
+
+    print(f"\nreadings generated {stats.readings}  accepted {stats.sent}  dropped {stats.dropped}  still queued {unsent}")
+    print(f"pushes {stats.pushes} ({stats.pushes / elapsed:.1f}/s)  accepted readings/s {stats.sent / elapsed:.1f}  "
+          f"connection errors {stats.errors}  body KiB/s {stats.bytes / elapsed / 1024:.1f}")
+    print(f"push latency p50 {stats.percentile(0.50):.1f} ms  p95 {stats.percentile(0.95):.1f} ms  "
+          f"p99 {stats.percentile(0.99):.1f} ms")
+    print(f"responses by status: {dict(sorted(stats.statuses.items()))}")
+
+if __name__ == '__main__':
+    main()
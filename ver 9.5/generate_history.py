@@ -0,0 +1,197 @@
+# generate_history.py
+# Fills a data folder with synthetic readings for scale testing.
+#
+# The signal is the simulator model from sim_model.py (slow sine + noise) with
+# compressor load/unload cycles, optional idle nights and random low-pressure
+# incidents on top. Days are bulk-loaded into the day partitions with
+# executemany, one transaction per day.
+#
+# Example (30 days at 2 Hz, about 5M rows):
+#   python generate_history.py --days 30 --rate 2 --data-dir bench_data
+
+import argparse
+from datetime import datetime, time as dtime, timedelta
+import math
+import os
+import random
+import time
+
+import database
+from sim_model import SIM_BASE_PRESSURE_FRONT, SIM_BASE_PRESSURE_REAR, simulated_pressure
+
+LOW_PRESSURE_THRESHOLD = 0.125  # MPa, same as pressure_sensor.py
+LINE_OFFSET = 0.012  # MPa added to the simulator base so normal running stays above the alarm threshold
+COMPRESSOR_PERIOD = 180.0  # Seconds per compressor load/unload cycle
+COMPRESSOR_LOAD_FRACTION = 0.6  # Share of the cycle spent loading (pressure rising)
+COMPRESSOR_AMPLITUDE = 0.003  # MPa swing of the cycle around the base
+INCIDENTS_PER_DAY = 4  # Average number of low-pressure incidents per day
+INCIDENT_DURATION = (5.0, 90.0)  # Seconds
+INCIDENT_DEPTH = (0.015, 0.04)  # MPa dip at the worst point
+
+def compressor_wave(t):
+    """Sawtooth of the compressor cycle: rises while loading, falls while unloading."""
+    phase = (t % COMPRESSOR_PERIOD) / COMPRESSOR_PERIOD
+    if phase < COMPRESSOR_LOAD_FRACTION:
+        x = phase / COMPRESSOR_LOAD_FRACTION
+    else:
+        x = 1.0 - (phase - COMPRESSOR_LOAD_FRACTION) / (1.0 - COMPRESSOR_LOAD_FRACTION)
+    return (2.0 * x - 1.0) * COMPRESSOR_AMPLITUDE
+
+def is_idle(hour, idle_hours):
+    """True if the hour of the day falls in the (start, end) idle hours, which may wrap midnight (22-6)."""
+    start, end = idle_hours
+    if start > end:
+        return hour >= start or hour < end
+    return start <= hour < end
+
+def plan_incidents(rng):
+    """Returns a sorted list of (start_s, end_s, depth, channel) incidents for one day."""
+    incidents = []
+    for _ in range(rng.randint(0, 2 * INCIDENTS_PER_DAY)):
+        start = rng.uniform(0, 86400)
+        duration = rng.uniform(*INCIDENT_DURATION)
+        channel = rng.choice(('front', 'rear', 'both'))
+        incidents.append((start, start + duration, rng.uniform(*INCIDENT_DEPTH), channel))
+    incidents.sort()
+    return incidents
+
+def generate_day(day, rate, rng, idle_hours, t0):
+    """
+    Yields (ts_ms, front, rear) rows for one day, skipping idle samples the
+    same way log_reading does.
+    """
+    day_start = datetime.combine(day, dtime.min)
+    day_start_ms = database.to_ms(day_start)
+    incidents = plan_incidents(rng)
+    step = 1.0 / rate
+    next_incident = 0
+    for i in range(int(86400 * rate)):
+        s = i * step
+        hour = s / 3600
+        if idle_hours and is_idle(hour, idle_hours):
+            continue  # Line is off: pressure is below the idle threshold and is not logged
+
+        t = (day_start_ms - t0) / 1000 + s
+        wave = compressor_wave(t)
+        front = simulated_pressure(SIM_BASE_PRESSURE_FRONT + LINE_OFFSET, t, rng) + wave
+        rear = simulated_pressure(SIM_BASE_PRESSURE_REAR + LINE_OFFSET, t + 7.0, rng) + wave
+
+        while next_incident < len(incidents) and incidents[next_incident][1] < s:
+            next_incident += 1
+        if next_incident < len(incidents) and incidents[next_incident][0] <= s:
+            start, end, depth, channel = incidents[next_incident]
+            dip = depth * math.sin(math.pi * (s - start) / (end - start))
+            if channel != 'rear':
+                front -= dip
+            if channel != 'front':
+                rear -= dip
+
+        if front <= database.IDLE_PRESSURE_THRESHOLD or rear <= database.IDLE_PRESSURE_THRESHOLD:
+            continue
+        # Jitter the timestamp a little like the real 0.5 s loop
+        yield (day_start_ms + int(s * 1000) + rng.randint(0, 3), front, rear)
+
+class EpisodeCollector:
+    """Turns consecutive low-pressure rows into alarm_episodes rows."""
+    def __init__(self):
+        self.episodes = []
+        self.current = None
+
+    def feed(self, row):
+        ts, front, rear = row
+        if front < LOW_PRESSURE_THRESHOLD or rear < LOW_PRESSURE_THRESHOLD:
+            if self.current is None:
+                self.current = [ts, ts, front, rear, 1]
+            else:
+                self.current[1] = ts
+                self.current[2] = min(self.current[2], front)
+                self.current[3] = min(self.current[3], rear)
+                self.current[4] += 1
+        else:
+            self.close()
+        return row
+
+    def close(self):
+        if self.current is not None:
+            start, end, min_front, min_rear, count = self.current
+            self.episodes.append((database.ms_to_iso(start), database.ms_to_iso(end), min_front, min_rear,
+                                  (end - start) / 1000, count, 'low_pressure', 0, database.DEVICE_ID))
+            self.current = None
+
+def generate(days, rate, end_day, seed, idle_hours):
+    """Generates `days` full days ending at end_day. Returns the number of rows written."""
+    rng = random.Random(seed)
+    t0 = database.to_ms(datetime.combine(end_day - timedelta(days=days - 1), dtime.min))
+    collector = EpisodeCollector()
+    total = 0
+    for n in range(days):
+        day = end_day - timedelta(days=days - 1 - n)
+        if os.path.exists(database.partition_path(day)):
+            database.drop_partition(day)
+        conn = database.connect_partition(day, create=True)
+        conn.execute('PRAGMA synchronous=OFF')
+        before = conn.total_changes
+        conn.executemany('INSERT INTO readings (ts, front_pressure, rear_pressure, device_id) VALUES (?, ?, ?, ?)',
+                         (collector.feed(row) + (database.DEVICE_ID,)
+                          for row in generate_day(day, rate, rng, idle_hours, t0)))
+        conn.commit()
+        rows = conn.total_changes - before
+        conn.close()
+        collector.close()
+        total += rows
+        print(f"{day}: {rows} rows")
+
+    conn = database.connect_db(database.DB_FILE)
+    conn.executemany('''
+        INSERT INTO alarm_episodes (start_ts, end_ts, min_front_pressure, min_rear_pressure,
+                                    duration, sample_count, error_type, is_open, device_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', collector.episodes)
+    conn.commit()
+    conn.close()
+    print(f"{len(collector.episodes)} alarm episodes")
+    return total
+
+def fill_ring(hours, end_day):
+    """Copies the last `hours` of generated readings up to the end of end_day into the ring file."""
+    end_ms = database.to_ms(datetime.combine(end_day + timedelta(days=1), dtime.min)) - 1
+    query = 'SELECT ts, front_pressure, rear_pressure FROM readings WHERE ts BETWEEN ? AND ? ORDER BY ts ASC'
+    ring = database.recent_ring(writable=True)
+    for _, rows in database.query_partitions(end_ms - int(hours * 3600000), end_ms, query):
+        for row in rows:
+            ring.append(*row)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic pressure history for scale testing.')
+    parser.add_argument('--days', type=int, default=30, help='number of days to generate (default 30)')
+    parser.add_argument('--rate', type=float, default=2.0, help='samples per second (default 2)')
+    parser.add_argument('--end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        default=datetime.now().date() - timedelta(days=1),
+                        help='last day to generate, YYYY-MM-DD (default yesterday)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default 1)')
+    parser.add_argument('--idle-nights', metavar='START-END', default=None,
+                        help='hours the line is off, e.g. 22-6 or 1-5 (default: runs 24 hours)')
+    parser.add_argument('--data-dir', default='.', help='folder to write the data files to')
+    parser.add_argument('--compact', action='store_true', help='build the 1s/1m rollup tiers afterwards')
+    parser.add_argument('--ring', action='store_true', help='copy the last 24 hours into the ring file')
+    args = parser.parse_args()
+
+    idle_hours = tuple(int(h) for h in args.idle_nights.split('-')) if args.idle_nights else None
+
+    database.set_data_dir(args.data_dir)
+    database.setup_database()
+    started = time.perf_counter()
+    total = generate(args.days, args.rate, args.end, args.seed, idle_hours)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {total} rows in {elapsed:.1f} s ({total / elapsed:.0f} rows/s)")
+
+    if args.compact:
+        started = time.perf_counter()
+        database.compact_closed_days()
+        print(f"Compacted rollup tiers in {time.perf_counter() - started:.1f} s")
+    if args.ring:
+        fill_ring(24, args.end)
+        print(f"Filled ring file with the last 24 hours of {args.end}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+# gunicorn.conf.py
+# Settings for serving wsgi.py with gunicorn:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# Override with WEB_BIND / WEB_WORKERS / WEB_THREADS environment variables.
+
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5300')  # port for raspi 02 = 5000, raspi 4 mod-B = 5300
+workers = int(os.environ.get('WEB_WORKERS', 3))  # One per core on a Pi 4 leaves a core for acquisition
+threads = int(os.environ.get('WEB_THREADS', 4))  # Dashboards mostly wait on polling, so threads are cheap
+worker_class = 'gthread'
+timeout = 60  # Long history ranges can take a while on a Pi
+keepalive = 5  # Dashboards poll every 0.5 s, keep their connections open
+accesslog = None  # The per-request access log would write to the SD card twice a second per dashboard
+errorlog = '-'
@@ -0,0 +1,197 @@
+# import_legacy.py
+# Bulk import of pressure_data.db files from older versions (ver 4.x to 9.0).
+#
+# Those files keep every reading in one table
+#   readings(id INTEGER PRIMARY KEY, timestamp TEXT, front_pressure REAL, rear_pressure REAL)
+# with local ISO timestamps. Copies of the same box taken at different times
+# (ver 4.1, 4.3 and 4.5) overlap, and the ids of different versions' files
+# overlap too, so rows are matched by their timestamp instead. Rows logged
+# within the same millisecond are kept once.
+#
+# Everything runs inside SQLite, without a Python loop over the rows:
+#   1. the legacy files are attached read-only (up to LEGACY_ATTACH_LIMIT at a
+#      time) and copied into a staging table keyed by the timestamp in Unix
+#      milliseconds, converted in SQL; INSERT OR IGNORE keeps the first file's
+#      row where files overlap
+#   2. every day of the staging table is copied into its day partition with
+#      one INSERT ... SELECT, seq = the timestamp, so rows imported before are
+#      skipped by the (device_id, seq) index and importing again is harmless
+#   3. in the same transaction the imported device's rows of that day are
+#      rolled up into every rollup tier that still covers the day, each tier
+#      from the one before as compact_partition does
+# Days past the raw retention window are archived and dropped by the next
+# cleanup, like any other day.
+#
+# Error logs of the old files can be copied with sync.py.
+#
+# Example, on the box that ran the older versions:
+#   python import_legacy.py "../ver 4.1/pressure_data.db" "../ver 4.3/pressure_data.db" "../ver 9.0/pressure_data.db"
+
+import argparse
+from datetime import datetime, time as dtime, timedelta
+import os
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+import clock
+import database
+
+LEGACY_ATTACH_LIMIT = 9  # SQLite attaches at most 10 databases; one is kept for the partition being filled
+STAGING_CACHE_KIB = 65536  # Page cache of the staging database
+
+def attach_uri(path):
+    return f'file:{pathname2url(os.path.abspath(path))}?mode=ro'
+
+def stage(conn, paths):
+    """
+    Copies the readings of the legacy files into the staging table, first file
+    first. Returns the number of rows read per file.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS staged (
+            ts INTEGER PRIMARY KEY,
+            front_pressure REAL,
+            rear_pressure REAL
+        )
+    ''')
+    read = {}
+    for start in range(0, len(paths), LEGACY_ATTACH_LIMIT):
+        group = paths[start:start + LEGACY_ATTACH_LIMIT]
+        for i, path in enumerate(group):
+            conn.execute(f'ATTACH DATABASE ? AS legacy{i}', (attach_uri(path),))
+        try:
+            for i, path in enumerate(group):
+                read[path] = conn.execute(f'SELECT COUNT(*) FROM legacy{i}.readings').fetchone()[0]
+                # Rows whose timestamp does not convert are skipped: SQLite would give a NULL key a new rowid
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO staged (ts, front_pressure, rear_pressure)
+                    SELECT {database.LEGACY_TIMESTAMP_MS}, front_pressure, rear_pressure
+                    FROM legacy{i}.readings
+                    WHERE ({database.LEGACY_TIMESTAMP_MS}) IS NOT NULL
+                    ORDER BY id
+                ''')
+            conn.commit()
+        finally:
+            for i in range(len(group)):
+                conn.execute(f'DETACH DATABASE legacy{i}')
+    return read
+
+def load_day(conn, day, device_id):
+    """
+    Copies one day of staged rows into its partition and rolls the device's
+    rows of that day up into the rollup tiers, in one transaction.
+    Returns the number of rows stored.
+    """
+    start_ms = database.to_ms(datetime.combine(day, dtime.min))
+    end_ms = database.to_ms(datetime.combine(day + timedelta(days=1), dtime.min)) - 1
+    database.connect_partition(day, create=True).close()
+    conn.execute('ATTACH DATABASE ? AS part', (database.partition_path(day),))
+    try:
+        before = conn.total_changes
+        conn.execute('''
+            INSERT OR IGNORE INTO part.readings (ts, front_pressure, rear_pressure, device_id, seq)
+            SELECT ts, front_pressure, rear_pressure, ?, ts
+            FROM staged
+            WHERE ts BETWEEN ? AND ?
+        ''', (device_id, start_ms, end_ms))
+        stored = conn.total_changes - before
+        source = None  # Finer tier already rolled up for this day
+        for name, bucket_ms, days in database.RETENTION_TIERS[1:]:
+            if not stored or end_ms < database.tier_cutoff_ms(days):
+                continue  # Nothing new, or would be deleted by the next cleanup
+            if source is None:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO rollup.readings_{name}
+                    SELECT device_id, (ts / ?) * ?, AVG(front_pressure), MIN(front_pressure), MAX(front_pressure),
+                           AVG(rear_pressure), MIN(rear_pressure), MAX(rear_pressure), COUNT(*)
+                    FROM part.readings
+                    WHERE device_id = ? AND ts BETWEEN ? AND ?
+                    GROUP BY ts / ?
+                ''', (bucket_ms, bucket_ms, device_id, start_ms, end_ms, bucket_ms))
+            else:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO rollup.readings_{name}
+                    SELECT device_id, (ts / ?) * ?,
+                           SUM(front_avg * sample_count) / SUM(sample_count), MIN(front_min), MAX(front_max),
+                           SUM(rear_avg * sample_count) / SUM(sample_count), MIN(rear_min), MAX(rear_max),
+                           SUM(sample_count)
+                    FROM rollup.readings_{source}
+                    WHERE device_id = ? AND ts BETWEEN ? AND ?
+                    GROUP BY ts / ?
+                ''', (bucket_ms, bucket_ms, device_id, start_ms, end_ms, bucket_ms))
+            source = name
+        conn.commit()
+    finally:
+        conn.execute('DETACH DATABASE part')
+    return stored
+
+def import_files(paths, device_id):
+    """
+    Imports the readings of legacy pressure_data.db files as the given device.
+    Returns a dictionary with the rows read per file, the distinct timestamps,
+    the rows stored and the days touched.
+    """
+    database.connect_rollups().close()
+    # A private temporary database: SQLite deletes it when the connection closes
+    conn = sqlite3.connect('')
+    try:
+        conn.execute(f'PRAGMA cache_size = -{STAGING_CACHE_KIB}')
+        read = stage(conn, paths)
+        distinct, first_ts = conn.execute('SELECT COUNT(*), MIN(ts) FROM staged').fetchone()
+        result = {'read': read, 'distinct': distinct, 'stored': 0, 'days': 0}
+        if not distinct:
+            return result
+
+        conn.execute('ATTACH DATABASE ? AS rollup', (database.ROLLUP_DB_FILE,))
+        compacted = {row[0] for row in conn.execute('SELECT day FROM rollup.compacted_days')}
+        today = clock.now().date()
+        ts = first_ts
+        while ts is not None:
+            day = datetime.fromtimestamp(ts / 1000).date()
+            existed = os.path.exists(database.partition_path(day))
+            stored = load_day(conn, day, device_id)
+            result['stored'] += stored
+            result['days'] += 1
+            # The other devices of a day that was already rolled up are unchanged; a day that was
+            # not is left to compact_closed_days, which rolls up the whole partition
+            if stored and day < today and (not existed or day.isoformat() in compacted):
+                conn.execute('INSERT OR REPLACE INTO rollup.compacted_days (day) VALUES (?)', (day.isoformat(),))
+                conn.commit()
+            # Next day with staged rows, so gaps of months between the files cost nothing
+            next_day_ms = database.to_ms(datetime.combine(day + timedelta(days=1), dtime.min))
+            ts = conn.execute('SELECT MIN(ts) FROM staged WHERE ts >= ?', (next_day_ms,)).fetchone()[0]
+
+        if not database.is_local(device_id):
+            newest = conn.execute('SELECT ts, front_pressure, rear_pressure FROM staged ORDER BY ts DESC LIMIT 1').fetchone()
+            database.update_device(device_id, None, *newest)
+    finally:
+        conn.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Import the readings of pressure_data.db files from older versions.')
+    parser.add_argument('files', nargs='+', help='legacy pressure_data.db files; where they overlap the first one wins')
+    parser.add_argument('--device', help='device id to file the readings under (default: this box)')
+    parser.add_argument('--data-dir', default='.', help='data folder to import into')
+    args = parser.parse_args()
+
+    for path in args.files:
+        if not os.path.isfile(path):
+            parser.error(f"{path}: not found")
+    database.set_data_dir(args.data_dir)
+    database.setup_database()
+    device_id = args.device or database.DEVICE_ID
+
+    started = time.perf_counter()
+    result = import_files(args.files, device_id)
+    elapsed = time.perf_counter() - started
+    for path, rows in result['read'].items():
+        print(f"{path}: {rows} rows")
+    total = sum(result['read'].values())
+    print(f"{total} rows read, {result['distinct']} distinct timestamps, {result['stored']} stored "
+          f"as {device_id} over {result['days']} days")
+    print(f"Imported in {elapsed:.1f} s ({total / max(elapsed, 1e-6):.0f} rows/s)")
+
+if __name__ == '__main__':
+    main()
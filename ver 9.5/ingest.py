@@ -0,0 +1,159 @@
+# ingest.py
+# Wire format of the readings batches that nodes push to a collector
+# (POST /api/ingest), and its validation.
+#
+# A batch is JSON, gzip-compressed when sent with Content-Encoding: gzip:
+#   {"device_id": "line-007", "readings": [
+#       {"seq": 41, "ts": 1771000000123, "front_pressure": 0.412, "rear_pressure": 0.405}, ...]}
+# seq identifies a reading on its node and never repeats, so the collector
+# can drop readings it already has when a node resends a batch. ts is Unix
+# time in milliseconds, at most MAX_CLOCK_SKEW_MS ahead of the collector's
+# clock; a pressure may be null when its sensor failed.
+#
+# A node that uploads summaries instead of every sample (see outbox.py) sends
+# the other lists, each optional:
+#   "minutes":  [{"ts": 1771000020000, "front_avg": 0.41, "front_min": 0.40, "front_max": 0.42,
+#                 "rear_avg": ..., "rear_min": ..., "rear_max": ..., "count": 120}, ...]
+#               one per minute with logged readings, ts at the start of the minute
+#   "episodes": [{"seq": 17, "start_ts": ..., "end_ts": ..., "min_front_pressure": 0.11,
+#                 "min_rear_pressure": 0.12, "sample_count": 9, "error_type": "low_pressure"}, ...]
+#               closed alarm episodes, seq being the node's episode id
+#   "backfill_done": [3, ...]
+#               raw backfill requests (see database.request_backfill) whose
+#               readings have all been sent, in this batch or before
+# The collector answers with the backfill requests still open for the device.
+
+import gzip
+import json
+import math
+import re
+import zlib
+
+import clock
+
+MAX_BATCH = 20000  # Readings, minutes and episodes accepted in one batch
+MAX_BODY_BYTES = 16 * 1024 * 1024  # Decompressed size limit of one batch
+DEVICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')  # Also a folder name (see archive.py)
+ERROR_TYPE_PATTERN = re.compile(r'^[a-z_]{1,32}$')
+MINUTE_MS = 60000
+MAX_CLOCK_SKEW_MS = 5 * 60000  # How far a node's clock may run ahead of the collector's
+MINUTE_FIELDS = ('ts', 'front_avg', 'front_min', 'front_max', 'rear_avg', 'rear_min', 'rear_max', 'count')
+EPISODE_FIELDS = ('seq', 'start_ts', 'end_ts', 'min_front_pressure', 'min_rear_pressure', 'sample_count', 'error_type')
+
+def encode_batch(device_id, readings, compress=True, minutes=(), episodes=(), backfill_done=()):
+    """
+    Returns the request body for a batch of (seq, ts, front_pressure,
+    rear_pressure) readings, gzip-compressed unless compress is False.
+    minutes and episodes are tuples in the order of MINUTE_FIELDS and
+    EPISODE_FIELDS; backfill_done is a list of request ids.
+    """
+    payload = {
+        'device_id': device_id,
+        'readings': [{'seq': seq, 'ts': ts, 'front_pressure': front, 'rear_pressure': rear}
+                     for seq, ts, front, rear in readings],
+    }
+    if minutes:
+        payload['minutes'] = [dict(zip(MINUTE_FIELDS, minute)) for minute in minutes]
+    if episodes:
+        payload['episodes'] = [dict(zip(EPISODE_FIELDS, episode)) for episode in episodes]
+    if backfill_done:
+        payload['backfill_done'] = list(backfill_done)
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    return gzip.compress(body, compresslevel=6) if compress else body
+
+def decompress(body, encoding):
+    """Undoes the Content-Encoding of a request body without expanding it past MAX_BODY_BYTES."""
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding not in ('gzip', 'deflate'):
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+    decompressor = zlib.decompressobj(31 if encoding == 'gzip' else 15)
+    try:
+        data = decompressor.decompress(body, MAX_BODY_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"Body could not be decompressed: {e}")
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"Batch is larger than {MAX_BODY_BYTES} bytes")
+    if not decompressor.eof:
+        raise ValueError("Compressed body is truncated")
+    return data
+
+def _pressure(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Invalid pressure: {value!r}")
+    return float(value)
+
+def _count(value, name, minimum=0):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"Invalid {name}: {value!r}")
+    return value
+
+def _timestamp(value, name, limit):
+    """A Unix ms timestamp that is not later than limit (a future day would never be dropped by retention)."""
+    value = _count(value, name)
+    if value > limit:
+        raise ValueError(f"{name} is in the future: {value!r}")
+    return value
+
+def _items(payload, key):
+    items = payload.get(key, [])
+    if not isinstance(items, list):
+        raise ValueError(f"{key} must be a list")
+    return items
+
+def decode_batch(body, encoding=None):
+    """
+    Parses and checks a request body. Returns a dictionary with device_id,
+    readings as a list of (seq, ts, front_pressure, rear_pressure), minutes
+    and episodes as tuples in the order of MINUTE_FIELDS and EPISODE_FIELDS,
+    and backfill_done as a list of ids.
+    Raises ValueError describing the first problem found.
+    """
+    try:
+        payload = json.loads(decompress(body, encoding))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Body is not valid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("Body must be a JSON object")
+    device_id = payload.get('device_id')
+    if not isinstance(device_id, str) or not DEVICE_ID_PATTERN.match(device_id):
+        raise ValueError("device_id must be 1-64 letters, digits, '.', '_' or '-', starting with a letter or digit")
+    items = {key: _items(payload, key) for key in ('readings', 'minutes', 'episodes', 'backfill_done')}
+    if sum(len(items[key]) for key in ('readings', 'minutes', 'episodes')) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} readings, minutes and episodes per batch")
+    if not all(isinstance(item, dict) for key in ('readings', 'minutes', 'episodes') for item in items[key]):
+        raise ValueError("Every reading, minute and episode must be an object")
+
+    limit = int(clock.now().timestamp() * 1000) + MAX_CLOCK_SKEW_MS
+    readings = []
+    for item in items['readings']:
+        seq, ts = _count(item.get('seq'), 'seq', 1), _timestamp(item.get('ts'), 'ts', limit)
+        readings.append((seq, ts, _pressure(item.get('front_pressure')), _pressure(item.get('rear_pressure'))))
+
+    minutes = []
+    for item in items['minutes']:
+        ts = _timestamp(item.get('ts'), 'ts', limit)
+        if ts % MINUTE_MS:
+            raise ValueError(f"Minute ts must be the start of a minute: {ts!r}")
+        minutes.append((ts,) + tuple(_pressure(item.get(key)) for key in MINUTE_FIELDS[1:-1])
+                       + (_count(item.get('count'), 'count', 1),))
+
+    episodes = []
+    for item in items['episodes']:
+        start_ts = _timestamp(item.get('start_ts'), 'start_ts', limit)
+        end_ts = _timestamp(item.get('end_ts'), 'end_ts', limit)
+        if end_ts < start_ts:
+            raise ValueError(f"Episode ends before it starts: {item!r}")
+        error_type = item.get('error_type')
+        if not isinstance(error_type, str) or not ERROR_TYPE_PATTERN.match(error_type):
+            raise ValueError(f"Invalid error_type: {error_type!r}")
+        episodes.append((_count(item.get('seq'), 'seq', 1), start_ts, end_ts,
+                         _pressure(item.get('min_front_pressure')), _pressure(item.get('min_rear_pressure')),
+                         _count(item.get('sample_count'), 'sample_count'), error_type))
+
+    backfill_done = [_count(value, 'backfill id', 1) for value in items['backfill_done']]
+    return {'device_id': device_id, 'readings': readings, 'minutes': minutes,
+            'episodes': episodes, 'backfill_done': backfill_done}
@@ -0,0 +1,187 @@
+# loadtest.py
+# Simulates many dashboard clients polling a running AtsuKanshi.py.
+#
+# Each simulated browser replays the request pattern of one page:
+#   dashboard - script.js: / and /api/history once, /api/realtime every 500 ms
+#               (registered twice, so two requests per interval) and
+#               /api/average/hour + /api/average/minute every 10 s
+#   log       - log.js: /logs once, then /api/log (with after_id) and /api/error-log every 5 s
+#   history   - history.js: /history once, then /api/history for yesterday..today, reloaded every --history-reload s
+#
+# Start the app with the simulator first, e.g.
+#   SENSOR_BACKEND=sim python AtsuKanshi.py
+# then
+#   python loadtest.py --dashboards 10 --log-pages 2 --history-pages 1 --duration 60
+#
+# The report shows throughput and latency per endpoint, and the logging loop
+# timing from /api/acquisition before and during the load.
+
+import argparse
+from datetime import datetime, timedelta
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+REALTIME_INTERVAL = 0.5
+AVERAGE_INTERVAL = 10.0
+LOG_INTERVAL = 5.0
+
+class Browser(threading.Thread):
+    """One simulated browser tab with its own keep-alive connection."""
+    def __init__(self, host, port, page, results, lock, stop, history_reload):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.page = page
+        self.results, self.lock, self.stop = results, lock, stop
+        self.history_reload = history_reload
+        self.conn = None
+        self.last_log_id = None
+
+    def request(self, path, name=None):
+        """Sends one GET and records its latency under `name` (default: the path)."""
+        name = name or path
+        started = time.perf_counter()
+        ok, size, body = False, 0, None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request('GET', path)
+            response = self.conn.getresponse()
+            body = response.read()
+            size = len(body)
+            ok = response.status < 500
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            entry = self.results.setdefault(name, {'latencies': [], 'errors': 0, 'bytes': 0})
+            entry['latencies'].append(elapsed)
+            entry['bytes'] += size
+            if not ok:
+                entry['errors'] += 1
+        return body if ok else None
+
+    def schedule(self):
+        """Returns the page's periodic jobs as [interval, function] pairs."""
+        if self.page == 'dashboard':
+            self.request('/')
+            self.request('/api/history')
+            realtime = lambda: (self.request('/api/realtime'), self.request('/api/realtime'))
+            averages = lambda: (self.request('/api/average/hour'), self.request('/api/average/minute'))
+            return [[REALTIME_INTERVAL, realtime], [AVERAGE_INTERVAL, averages]]
+        if self.page == 'log':
+            self.request('/logs')
+            return [[LOG_INTERVAL, self.poll_log], [LOG_INTERVAL, lambda: self.request('/api/error-log')]]
+        self.request('/history')
+        return [[self.history_reload, self.load_history]]
+
+    def poll_log(self):
+        if self.last_log_id is None:
+            body = self.request('/api/log')
+        else:
+            body = self.request(f'/api/log?after_id={self.last_log_id}', '/api/log?after_id=...')
+        if body:
+            rows = json.loads(body)
+            if rows:
+                self.last_log_id = rows[-1]['id']
+
+    def load_history(self):
+        today = datetime.now().date()
+        path = f'/api/history?start_date={today - timedelta(days=1)}&end_date={today}'
+        self.request(path, '/api/history?start_date=...&end_date=...')
+
+    def run(self):
+        jobs = self.schedule()
+        # Pages are not opened at exactly the same moment
+        now = time.monotonic()
+        due = [now + random.uniform(0, interval) for interval, _ in jobs]
+        while not self.stop.is_set():
+            i = min(range(len(jobs)), key=due.__getitem__)
+            delay = due[i] - time.monotonic()
+            if delay > 0 and self.stop.wait(delay):
+                break
+            jobs[i][1]()
+            due[i] += jobs[i][0]
+        if self.conn is not None:
+            self.conn.close()
+
+def acquisition_stats(host, port, last):
+    """Reads /api/acquisition for the newest `last` loop periods (None if unavailable)."""
+    try:
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        conn.request('GET', f'/api/acquisition?last={last}')
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return json.loads(body) if response.status == 200 else None
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+
+def summarize(results, duration):
+    """Prints per-endpoint throughput and latency percentiles."""
+    print(f"\n{'endpoint':45s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s} {'errors':>7s} {'KiB/s':>8s}")
+    total = 0
+    for name, entry in sorted(results.items()):
+        latencies = sorted(entry['latencies'])
+        n = len(latencies)
+        total += n
+        pick = lambda p: latencies[min(n - 1, int(n * p))] * 1000
+        print(f"{name:45s} {n / duration:8.1f} {pick(0.50):8.1f} {pick(0.95):8.1f} {pick(0.99):8.1f} "
+              f"{latencies[-1] * 1000:8.1f} {entry['errors']:7d} {entry['bytes'] / duration / 1024:8.1f}")
+    print(f"{'total':45s} {total / duration:8.1f}")
+
+def print_acquisition(label, stats):
+    if not stats or not stats.get('samples'):
+        print(f"{label}: no acquisition data")
+        return
+    print(f"{label}: period mean {stats['mean_period_ms']:.1f} ms, p99 {stats['p99_period_ms']:.1f} ms, "
+          f"max {stats['max_period_ms']:.1f} ms, jitter {stats['jitter_ms']:.1f} ms ({stats['samples']} loops)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboard with simulated browsers.')
+    parser.add_argument('--url', default='http://127.0.0.1:5300', help='base URL of the running app')
+    parser.add_argument('--dashboards', type=int, default=10, help='number of dashboard tabs')
+    parser.add_argument('--log-pages', type=int, default=1, help='number of log page tabs')
+    parser.add_argument('--history-pages', type=int, default=0, help='number of history page tabs')
+    parser.add_argument('--history-reload', type=float, default=60.0, help='seconds between history page reloads')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of load')
+    parser.add_argument('--baseline', type=float, default=10.0, help='seconds of idle measurement before the load')
+    args = parser.parse_args()
+
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    loops_per_second = 1 / REALTIME_INTERVAL
+
+    print(f"Measuring idle acquisition timing for {args.baseline:.0f} s ...")
+    time.sleep(args.baseline)
+    baseline = acquisition_stats(host, port, int(args.baseline * loops_per_second))
+
+    results, lock, stop = {}, threading.Lock(), threading.Event()
+    pages = ['dashboard'] * args.dashboards + ['log'] * args.log_pages + ['history'] * args.history_pages
+    browsers = [Browser(host, port, page, results, lock, stop, args.history_reload) for page in pages]
+    print(f"Running {len(browsers)} browsers for {args.duration:.0f} s ...")
+    started = time.monotonic()
+    for browser in browsers:
+        browser.start()
+    time.sleep(args.duration)
+    stop.set()
+    for browser in browsers:
+        browser.join()
+    elapsed = time.monotonic() - started
+    loaded = acquisition_stats(host, port, int(args.duration * loops_per_second))
+
+    summarize(results, elapsed)
+    print()
+    print_acquisition('Acquisition idle  ', baseline)
+    print_acquisition('Acquisition loaded', loaded)
+    if baseline and loaded and baseline.get('samples') and loaded.get('samples'):
+        print(f"Jitter change: {loaded['jitter_ms'] - baseline['jitter_ms']:+.1f} ms, "
+              f"p99 period change: {loaded['p99_period_ms'] - baseline['p99_period_ms']:+.1f} ms")
+
+if __name__ == '__main__':
+    main()
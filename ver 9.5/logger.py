@@ -1,8 +1,14 @@
 from pressure_sensor import get_front_pressure, get_rear_pressure
 from database import log_reading, setup_database
+import applog
+import logging
 import time
 import threading
 
+log = logging.getLogger('logger')
+# Both threads feed one summary: a line per minute instead of a line per sample
+summary = applog.ReadingSummary(log)
+
 def log_front_sensor():
     setup_database()
     while True:
@@ -10,9 +16,10 @@ def log_front_sensor():
             front_pressure = get_front_pressure()
             # Only log front pressure, rear as None
             log_reading(front_pressure, None)
-            print(f"Logged: Front={front_pressure:.3f} MPa")
+            summary.add(front_pressure, None)
+            log.debug("Logged: Front=%.3f MPa", front_pressure)
         except Exception as e:
-            print(f"Front logging error: {e}")
+            log.error("Front logging error: %s", e)
         time.sleep(0.5)
 
 def log_rear_sensor():
@@ -22,12 +29,14 @@ def log_rear_sensor():
             rear_pressure = get_rear_pressure()
             # Only log rear pressure, front as None
             log_reading(None, rear_pressure)
-            print(f"Logged: Rear={rear_pressure:.3f} MPa")
+            summary.add(None, rear_pressure)
+            log.debug("Logged: Rear=%.3f MPa", rear_pressure)
         except Exception as e:
-            print(f"Rear logging error: {e}")
+            log.error("Rear logging error: %s", e)
         time.sleep(0.5)
 
 if __name__ == '__main__':
+    applog.setup_logging()
     # Run both loggers in parallel threads
     threading.Thread(target=log_front_sensor, daemon=True).start()
     threading.Thread(target=log_rear_sensor, daemon=True).start()
@@ -0,0 +1,279 @@
+# metrics.py
+# Small in-process metrics registry (counters, gauges, histograms) rendered in
+# the Prometheus text format for /metrics.
+#
+# Updating a metric is a dict lookup and an add under a per-series lock, so it
+# is safe to call from the acquisition loop and the request hooks.
+#
+# Acquisition and every web worker are separate processes, so each one dumps a
+# JSON snapshot of its registry into METRICS_DIR every DUMP_INTERVAL seconds.
+# /metrics merges the live registry of the serving process with the fresh
+# snapshots of the others: counters and histograms are summed, and gauges are
+# summed too (each gauge here is only set by one process, or adds up, like
+# requests in flight).
+
+import atexit
+import bisect
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+METRICS_DIR = 'metrics'  # Snapshot files: metrics/<role>-<pid>.json
+DUMP_INTERVAL = 10.0  # Seconds between snapshot dumps
+STALE_SECONDS = 60.0  # Snapshots older than this belong to dead processes and are ignored
+PREFIX = 'atsukanshi_'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class _Value:
+    """One counter or gauge series."""
+    def __init__(self, metric):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def snapshot(self):
+        return self.value
+
+class _HistogramValue:
+    """One histogram series: a count per bucket (not cumulative), plus sum and count."""
+    def __init__(self, metric):
+        self.lock = threading.Lock()
+        self.bounds = metric.buckets
+        self.counts = [0] * (len(metric.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self.lock:
+            return {'counts': list(self.counts), 'sum': self.sum}
+
+class Metric:
+    """
+    A named metric with optional labels. Call labels(*values) to get one series,
+    or inc/set/observe directly when the metric has no labels.
+    """
+    kind = None
+    series_class = _Value
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.series_class(self))
+        return child
+
+    def snapshot(self):
+        family = {'type': self.kind, 'help': self.help, 'labelnames': list(self.labelnames),
+                  'samples': [[list(values), child.snapshot()] for values, child in list(self.children.items())]}
+        if self.kind == 'histogram':
+            family['buckets'] = list(self.buckets)
+        return family
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1.0):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+class Histogram(Metric):
+    kind = 'histogram'
+    series_class = _HistogramValue
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+# All metrics of this process, by full name
+REGISTRY = {}
+
+def _register(cls, name, help, labelnames=(), **kwargs):
+    metric = REGISTRY.get(PREFIX + name)
+    if metric is None:
+        metric = REGISTRY[PREFIX + name] = cls(name, help, labelnames, **kwargs)
+    return metric
+
+def counter(name, help, labelnames=()):
+    """Returns the counter with this name, creating it on first use."""
+    return _register(Counter, name, help, labelnames)
+
+def gauge(name, help, labelnames=()):
+    """Returns the gauge with this name, creating it on first use."""
+    return _register(Gauge, name, help, labelnames)
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Returns the histogram with this name, creating it on first use."""
+    return _register(Histogram, name, help, labelnames, buckets=buckets)
+
+def snapshot():
+    """Returns the current value of every metric as a JSON-serialisable dict."""
+    return {name: metric.snapshot() for name, metric in list(REGISTRY.items())}
+
+def snapshot_path(role, pid=None):
+    return os.path.join(METRICS_DIR, f'{role}-{pid or os.getpid()}.json')
+
+def dump(path):
+    """Writes the snapshot atomically so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp_path, path)
+
+def start_exporter(role, before_dump=None):
+    """
+    Starts a daemon thread that dumps this process's snapshot every DUMP_INTERVAL
+    seconds, so /metrics in another process can include it.
+    before_dump, if given, is called first (e.g. to refresh gauges that are
+    expensive to keep up to date on every event).
+    """
+    path = snapshot_path(role)
+
+    def run():
+        while True:
+            try:
+                if before_dump is not None:
+                    before_dump()
+                dump(path)
+                remove_stale_snapshots()
+            except Exception as e:
+                log.error("Error dumping metrics: %s", e)
+            time.sleep(DUMP_INTERVAL)
+
+    threading.Thread(target=run, daemon=True).start()
+    atexit.register(lambda: os.path.exists(path) and os.remove(path))
+
+def remove_stale_snapshots():
+    """Deletes snapshots left behind by processes that exited without cleaning up."""
+    cutoff = time.time() - 10 * STALE_SECONDS
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def load_snapshots():
+    """Returns the fresh snapshots of every other process."""
+    own = f'-{os.getpid()}.json'
+    cutoff = time.time() - STALE_SECONDS
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        if path.endswith(own):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def merge(snapshots):
+    """Merges several snapshots into one by summing matching series."""
+    merged = {}
+    for families in snapshots:
+        for name, family in families.items():
+            target = merged.setdefault(name, {**family, 'samples': {}})
+            if target['type'] != family['type'] or target.get('buckets') != family.get('buckets'):
+                continue  # Changed definition between versions; keep the first one seen
+            for values, value in family['samples']:
+                key = tuple(values)
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = value
+                elif family['type'] == 'histogram':
+                    target['samples'][key] = {
+                        'counts': [a + b for a, b in zip(current['counts'], value['counts'])],
+                        'sum': current['sum'] + value['sum'],
+                    }
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _format_number(value):
+    """A sample value as the exposition format spells it (NaN, +Inf and -Inf included)."""
+    if isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def render(merged):
+    """Renders merged snapshots in the Prometheus text exposition format."""
+    lines = []
+    for name in sorted(merged):
+        family = merged[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        names = family['labelnames']
+        for values, value in sorted(family['samples'].items()):
+            if family['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(names, values)} {_format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(family['buckets']) + [float('inf')], value['counts']):
+                cumulative += count
+                le = _format_number(bound) if bound != float('inf') else '+Inf'
+                lines.append(f"{name}_bucket{_format_labels(names, values, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(names, values)} {_format_number(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(names, values)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+def exposition():
+    """Returns the /metrics text for this process plus every other live process."""
+    return render(merge([snapshot()] + load_snapshots()))
@@ -0,0 +1,360 @@
+# outbox.py
+# Store-and-forward queue that uploads this node's data to a collector.
+#
+# Enabled by setting UPLOAD_URL (the collector's POST /api/ingest, see
+# ingest.py). By default a node does not send every reading: the acquisition
+# loop folds the readings it logs into per-minute summaries (mean, min and max
+# of both channels), and queues one row per minute and one per closed alarm
+# episode. That is about 1/120 of the raw data at 2 Hz. With UPLOAD_RAW=1
+# every logged reading is queued instead.
+#
+# The raw readings stay in the node's own partitions. When an engineer wants
+# them for a range, the collector records a backfill request and hands it to
+# the node in its answer to the next upload; the node queues its readings in
+# that range (seq = the node's reading id, so asking twice stores them once)
+# followed by a marker that reports the request done.
+#
+# Everything waits in an SQLite queue in OUTBOX_FILE, next to the other data
+# files; the row id is the queue seq. A background thread drains the queue in
+# large gzip batches. When the collector acknowledges a batch, its highest
+# seq is stored as the acked seq and the rows up to it are deleted, so after a
+# restart or an outage the upload resumes right after the last acknowledged
+# row. A failed upload is retried with exponential backoff; the collector
+# ignores rows it already has, so sending a batch twice is harmless.
+#
+# Raw readings older than the collector's raw retention window would be
+# refused there, so they are dropped from the queue instead of piling up
+# during a long outage. The minute being summarized lives in memory, so a
+# restart loses at most that one minute's summary.
+
+from datetime import datetime
+import http.client
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import clock
+import database
+import ingest
+import metrics
+
+UPLOAD_URL = os.environ.get('UPLOAD_URL')  # e.g. http://collector:5300/api/ingest; unset = no upload
+UPLOAD_RAW = os.environ.get('UPLOAD_RAW') == '1'  # Upload every logged reading instead of per-minute summaries
+OUTBOX_FILE = 'outbox.db'
+UPLOAD_BATCH = 5000  # Queued rows per upload at most
+UPLOAD_INTERVAL = 10.0  # Seconds between uploads while the queue is drained
+BACKOFF_MIN = 5.0  # Seconds before the first retry after a failed upload
+BACKOFF_MAX = 600.0  # Longest wait between retries
+UPLOAD_TIMEOUT = 30.0
+
+log = logging.getLogger(__name__)
+
+OUTBOX_PENDING = metrics.gauge('outbox_pending', 'Rows waiting in the outbox for upload')
+OUTBOX_DROPPED = metrics.counter('outbox_dropped_total', 'Readings dropped from the outbox before they could be uploaded')
+UPLOADED = metrics.counter('upload_rows_total', 'Outbox rows acknowledged by the collector, by kind', ['kind'])
+UPLOAD_FAILURES = metrics.counter('upload_failures_total', 'Uploads that failed and will be retried')
+UPLOAD_SECONDS = metrics.histogram('upload_seconds', 'Time to upload one batch')
+UPLOAD_BYTES = metrics.histogram('upload_bytes', 'Compressed size of one upload', buckets=metrics.SIZE_BUCKETS)
+BACKFILLS = metrics.counter('backfill_readings_total', 'Raw readings queued for backfill requests of the collector')
+
+_ready_files = set()
+
+def outbox_path():
+    """The outbox lives in the same folder as the main database."""
+    return os.path.join(os.path.dirname(database.DB_FILE), OUTBOX_FILE)
+
+def connect():
+    """Opens the outbox database, creating it on first use."""
+    path = outbox_path()
+    conn = database.connect_db(path)
+    if path not in _ready_files:
+        conn.execute('PRAGMA journal_mode=WAL;')
+        # AUTOINCREMENT so a seq is never handed out twice, even after the queue was emptied.
+        # kind is reading, minute, episode or backfill_done; ref is the reading id of a
+        # backfilled reading, the episode id or the backfill request id; data holds the
+        # other values of a minute or an episode as a JSON list.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts INTEGER NOT NULL,
+                front_pressure REAL,
+                rear_pressure REAL,
+                kind TEXT NOT NULL DEFAULT 'reading',
+                ref INTEGER,
+                data TEXT
+            )
+        ''')
+        # Queues from before summaries only held readings
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(outbox)')}
+        for column, kind in (('kind', "TEXT NOT NULL DEFAULT 'reading'"), ('ref', 'INTEGER'), ('data', 'TEXT')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE outbox ADD COLUMN {column} {kind}')
+        conn.execute('CREATE TABLE IF NOT EXISTS upload_state (key TEXT PRIMARY KEY, value INTEGER)')
+        conn.commit()
+        _ready_files.add(path)
+    return conn
+
+def append(ts, front_pressure, rear_pressure):
+    """Queues one logged reading for upload."""
+    conn = connect()
+    try:
+        conn.execute('INSERT INTO outbox (ts, front_pressure, rear_pressure) VALUES (?, ?, ?)',
+                     (ts, front_pressure, rear_pressure))
+        conn.commit()
+    finally:
+        conn.close()
+
+def append_row(kind, ts, ref=None, data=None):
+    """Queues one summary row (see connect for the kinds)."""
+    conn = connect()
+    try:
+        conn.execute('INSERT INTO outbox (ts, kind, ref, data) VALUES (?, ?, ?, ?)',
+                     (ts, kind, ref, None if data is None else json.dumps(data)))
+        conn.commit()
+    finally:
+        conn.close()
+
+# --- Summaries ---
+
+class MinuteSummary:
+    """Mean, min and max of both channels over the logged readings of one minute."""
+    def __init__(self, ts):
+        self.ts = ts  # Start of the minute, ms
+        self.count = 0
+        self.channels = [[0.0, 0, None, None], [0.0, 0, None, None]]  # sum, count, min, max
+
+    def add(self, front_pressure, rear_pressure):
+        self.count += 1
+        for channel, value in zip(self.channels, (front_pressure, rear_pressure)):
+            if value is None:
+                continue
+            channel[0] += value
+            channel[1] += 1
+            channel[2] = value if channel[2] is None else min(channel[2], value)
+            channel[3] = value if channel[3] is None else max(channel[3], value)
+
+    def values(self):
+        """The summary in the order of ingest.MINUTE_FIELDS."""
+        result = [self.ts]
+        for total, count, low, high in self.channels:
+            result += [total / count if count else None, low, high]
+        return result + [self.count]
+
+# Minute being summarized (only touched by the acquisition loop)
+_minute = None
+
+def add_reading(ts, front_pressure, rear_pressure):
+    """
+    Queues one logged reading: as is with UPLOAD_RAW, otherwise folded into
+    the summary of its minute.
+    """
+    global _minute
+    if UPLOAD_RAW:
+        append(ts, front_pressure, rear_pressure)
+        return
+    minute_ts = ts - ts % ingest.MINUTE_MS
+    if _minute is not None and _minute.ts != minute_ts:
+        close_minute()
+    if _minute is None:
+        _minute = MinuteSummary(minute_ts)
+    _minute.add(front_pressure, rear_pressure)
+
+def close_minute(now_ms=None):
+    """
+    Queues the summary of the minute being summarized, if there is one and
+    it is over at now_ms (always when now_ms is None). Called by the
+    acquisition loop every iteration, so the last minute before the line
+    goes idle is sent too.
+    """
+    global _minute
+    if _minute is None or (now_ms is not None and now_ms < _minute.ts + ingest.MINUTE_MS):
+        return
+    values = _minute.values()
+    _minute = None
+    append_row('minute', values[0], data=values[1:])
+
+def add_episode(episode_id):
+    """Queues a closed alarm episode of this node."""
+    episode = database.get_alarm_episode(episode_id)
+    if episode is None:
+        return
+    start_ts = database.to_ms(datetime.fromisoformat(episode['start_ts']))
+    end_ts = database.to_ms(datetime.fromisoformat(episode['end_ts']))
+    append_row('episode', end_ts, ref=episode_id, data=[
+        start_ts, end_ts, episode['min_front_pressure'], episode['min_rear_pressure'],
+        episode['sample_count'], episode['error_type']])
+
+def queue_backfill(conn, request):
+    """
+    Queues this node's raw readings in the range of a collector backfill
+    request, then the marker that reports it done. With UPLOAD_RAW every
+    reading is on its way already, so only the marker is queued.
+    """
+    queued = 0
+    if not UPLOAD_RAW:
+        query = '''
+            SELECT id, ts, front_pressure, rear_pressure FROM readings
+            WHERE ts BETWEEN ? AND ? AND device_id = ?
+            ORDER BY id
+        '''
+        for day, rows in database.query_partitions(request['start_ts'], request['end_ts'], query,
+                                                   (database.DEVICE_ID,)):
+            conn.executemany('''
+                INSERT INTO outbox (ts, front_pressure, rear_pressure, kind, ref) VALUES (?, ?, ?, 'reading', ?)
+            ''', [(ts, front, rear, database.make_reading_id(day, row_id)) for row_id, ts, front, rear in rows])
+            queued += len(rows)
+    conn.execute("INSERT INTO outbox (ts, kind, ref) VALUES (?, 'backfill_done', ?)",
+                 (database.to_ms(clock.now()), request['id']))
+    conn.commit()
+    BACKFILLS.inc(queued)
+    log.info("Queued %d readings for backfill request %d (%s to %s)", queued, request['id'],
+             database.ms_to_iso(request['start_ts']), database.ms_to_iso(request['end_ts']))
+
+# --- Upload ---
+
+def acked_seq(conn):
+    row = conn.execute("SELECT value FROM upload_state WHERE key = 'acked_seq'").fetchone()
+    return row[0] if row else 0
+
+def pending_batch(conn, limit=UPLOAD_BATCH):
+    """Returns the oldest unacknowledged rows as (seq, kind, ts, front, rear, ref, data), in seq order."""
+    return conn.execute('''
+        SELECT seq, kind, ts, front_pressure, rear_pressure, ref, data FROM outbox
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (acked_seq(conn), limit)).fetchall()
+
+def encode(device_id, batch):
+    """Builds the request body for a batch of outbox rows."""
+    readings, minutes, episodes, backfill_done = [], [], [], []
+    for seq, kind, ts, front, rear, ref, data in batch:
+        if kind == 'reading':
+            # Backfilled readings are numbered by their reading id, so a second backfill of them is skipped
+            readings.append((ref or seq, ts, front, rear))
+        elif kind == 'minute':
+            minutes.append([ts] + json.loads(data))
+        elif kind == 'episode':
+            episodes.append([ref] + json.loads(data))
+        elif kind == 'backfill_done':
+            backfill_done.append(ref)
+    return ingest.encode_batch(device_id, readings, minutes=minutes, episodes=episodes, backfill_done=backfill_done)
+
+def acknowledge(conn, seq):
+    """Records that the collector has every row up to seq and deletes them here."""
+    conn.execute("INSERT OR REPLACE INTO upload_state (key, value) VALUES ('acked_seq', ?)", (seq,))
+    conn.execute('DELETE FROM outbox WHERE seq <= ?', (seq,))
+    conn.commit()
+
+def drop_expired(conn):
+    """Drops queued readings the collector would refuse as too old."""
+    cutoff = database.to_ms(clock.now()) - database.RETENTION_TIERS[0][2] * 86400000
+    dropped = conn.execute("DELETE FROM outbox WHERE kind = 'reading' AND ts < ?", (cutoff,)).rowcount
+    conn.commit()
+    if dropped:
+        OUTBOX_DROPPED.inc(dropped)
+        log.warning("Dropped %d readings from the outbox that are too old to upload", dropped)
+
+class Uploader:
+    """Posts outbox batches to UPLOAD_URL over one kept-alive connection."""
+    def __init__(self, url=UPLOAD_URL, device_id=None):
+        parts = urlsplit(url)
+        self.secure = parts.scheme == 'https'
+        self.host, self.port = parts.hostname, parts.port
+        self.path = parts.path or '/'
+        self.device_id = device_id or database.DEVICE_ID
+        self.conn = None
+
+    def post(self, body):
+        """
+        Sends one gzip batch and returns (status, response body). A kept-alive
+        connection the collector has meanwhile closed is retried once on a new one.
+        """
+        reused = self.conn is not None
+        try:
+            return self._post(body)
+        except (OSError, http.client.HTTPException):
+            if not reused:
+                raise
+            return self._post(body)
+
+    def _post(self, body):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=UPLOAD_TIMEOUT)
+        try:
+            self.conn.request('POST', self.path, body, {
+                'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+            response = self.conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+
+    def upload_once(self):
+        """
+        Uploads the next batch and queues the backfills the collector asks
+        for. Returns the number of rows acknowledged (0 if the queue was
+        empty); raises on failure.
+        """
+        conn = connect()
+        try:
+            batch = pending_batch(conn)
+            OUTBOX_PENDING.set(conn.execute('SELECT COUNT(*) FROM outbox WHERE seq > ?', (acked_seq(conn),)).fetchone()[0])
+            if not batch:
+                return 0
+            body = encode(self.device_id, batch)
+            UPLOAD_BYTES.observe(len(body))
+            started = time.perf_counter()
+            status, reply = self.post(body)
+            UPLOAD_SECONDS.observe(time.perf_counter() - started)
+            if status != 200:
+                raise RuntimeError(f"Collector answered {status}: {reply[:200]!r}")
+            acknowledge(conn, batch[-1][0])
+            for row in batch:
+                UPLOADED.labels(row[1]).inc()
+            for request in json.loads(reply).get('backfill', []):
+                queue_backfill(conn, request)
+            return len(batch)
+        finally:
+            conn.close()
+
+    def run(self):
+        """Drains the outbox forever: back to back while there is a backlog, otherwise every UPLOAD_INTERVAL."""
+        failures = 0
+        last_expiry = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_expiry > 3600:
+                    conn = connect()
+                    drop_expired(conn)
+                    conn.close()
+                    last_expiry = time.monotonic()
+                sent = self.upload_once()
+                if failures:
+                    log.info("Upload to %s resumed after %d failed attempts", UPLOAD_URL, failures)
+                failures = 0
+                if sent == UPLOAD_BATCH:
+                    continue  # More waiting: send the next batch right away
+                delay = UPLOAD_INTERVAL
+            except Exception as e:
+                UPLOAD_FAILURES.inc()
+                failures += 1
+                # Exponential backoff with jitter, so many nodes coming back at once don't retry in step
+                delay = min(BACKOFF_MAX, BACKOFF_MIN * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+                log.warning("Upload failed, retrying in %.0f s: %s", delay, e)
+            time.sleep(delay)
+
+def start_uploader():
+    """Starts the upload thread if UPLOAD_URL is set. Returns True if it was started."""
+    if not UPLOAD_URL:
+        return False
+    threading.Thread(target=Uploader().run, daemon=True).start()
+    log.info("Uploading %s to %s as %s", 'readings' if UPLOAD_RAW else 'minute summaries',
+             UPLOAD_URL, database.DEVICE_ID)
+    return True
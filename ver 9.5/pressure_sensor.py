@@ -2,25 +2,19 @@
 # Handles all sensor communication and pressure calculations.
 ##Hasing simulation features
 
+import threading
 import time
 #import random #simulation feature
 #import math #simulation feature
 import RPi.GPIO as GPIO
 
+import clock
+
 #-----------------------------------------------------#
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-#-----------------------------------------------------#
-# I2C bus initialization
-i2c = busio.I2C(board.SCL, board.SDA)##
-#-----------------------------------------------------#
-# Initialize ADC (assuming address 0x48)
-ads = ADS.ADS1115(i2c, address=0x48)
-ads.gain = 1  # ±4.096V gain
+# board, busio and adafruit_ads1x15 are imported and the I2C bus is opened
+# in init_sensors, on the first read, so importing this module stays cheap
+# and GPIO can be set up before the slower I2C initialization.
 #-----------------------------------------------------#
-# Define channels for front and rear sensors
 
 #Simulation parameters
 #SIM_BASE_PRESSURE_FRONT = 0.130  # MPa
@@ -71,8 +65,34 @@ alarm_hold_time = 1.0  # Hold alarm for 1 second
 #chan_front = MockAnalogInF()  #Simulation feature  
 #chan_rear =  MockAnalogInR()  #Simulation feature
 #-----------------------------------------------------#
-chan_front = AnalogIn(ads, ADS.P0) # Using channel A0
-chan_rear = AnalogIn(ads, ADS.P1) # Using channel A1   
+chan_front = None  # AnalogIn on channel A0, set by init_sensors
+chan_rear = None  # AnalogIn on channel A1, set by init_sensors
+_init_lock = threading.Lock()  # logger.py reads both channels from separate threads
+
+def init_sensors():
+    """
+    Opens the I2C bus and the ADS1115 and sets up both channels.
+    Called automatically by the first get_*_pressure; does nothing after that.
+    """
+    global chan_front, chan_rear
+    if chan_front is not None:
+        return
+    with _init_lock:
+        if chan_front is not None:
+            return
+        import board
+        import busio
+        import adafruit_ads1x15.ads1115 as ADS
+        from adafruit_ads1x15.analog_in import AnalogIn
+
+        # I2C bus initialization
+        i2c = busio.I2C(board.SCL, board.SDA)
+        # Initialize ADC (assuming address 0x48)
+        ads = ADS.ADS1115(i2c, address=0x48)
+        ads.gain = 1  # ±4.096V gain
+        # Define channels for front and rear sensors (front last: it marks init as done)
+        chan_rear = AnalogIn(ads, ADS.P1) # Using channel A1
+        chan_front = AnalogIn(ads, ADS.P0) # Using channel A0
 #-----------------------------------------------------#
 
 # Voltage to Pressure Conversion Constants
@@ -113,6 +133,7 @@ def get_front_pressure():
     """
     Reads the voltage from the front pressure sensor and returns the calibrated pressure in MPa.
     """
+    init_sensors()
     v_in = chan_front.voltage
     raw_pressure = convert_voltage_to_raw_pressure(v_in)
     calibrated_pressure = (raw_pressure * FRONT_CALIBRATION_SLOPE) + FRONT_CALIBRATION_OFFSET
@@ -123,6 +144,7 @@ def get_rear_pressure():
     """
     Reads the voltage from the rear pressure sensor and returns the calibrated pressure in MPa.
     """
+    init_sensors()
     v_in = chan_rear.voltage
     raw_pressure = convert_voltage_to_raw_pressure(v_in)
     calibrated_pressure = (raw_pressure * REAR_CALIBRATION_SLOPE) + REAR_CALIBRATION_OFFSET
@@ -147,7 +169,7 @@ def check_pressure_threshold(front_pressure, rear_pressure):
         return "error"
         
     global alarm_active, alarm_start_time
-    current_time = time.time()
+    current_time = clock.time()
     
     # Check if system is idle (not turned on yet)
     if front_pressure <= IDLE_PRESSURE_THRESHOLD or rear_pressure <= IDLE_PRESSURE_THRESHOLD:
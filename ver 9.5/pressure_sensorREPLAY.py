@@ -0,0 +1,149 @@
+# pressure_sensorREPLAY.py
+# Sensor backend that plays back a recorded pressure database instead of
+# reading the ADC, so the whole pipeline (alarm check, storage, live ring and
+# the dashboard) runs on real signal shapes from the shop floor:
+#   SENSOR_BACKEND=replay DATA_DIR=replay_data REPLAY_DB="../ver 4.5/pressure_data.db" REPLAY_SPEED=10 python acquisition.py
+# DATA_DIR keeps the replayed readings (and the acquisition lock) in a folder
+# of their own, so a replay never writes into the live data or stops the real
+# acquisition service from starting. Point the web tier at the same folder to
+# watch it, or run both in the dev server:
+#   SENSOR_BACKEND=replay DATA_DIR=replay_data REPLAY_DB="../ver 4.5/pressure_data.db" python AtsuKanshi.py
+#
+# The recording is treated as the pressure signal over time. Each read returns
+# the newest recorded sample at the current time of a virtual clock (clock.py)
+# that starts at the first recorded timestamp and runs REPLAY_SPEED times
+# faster than real time; REPLAY_SPEED=0 runs as fast as possible. Gaps longer
+# than REPLAY_GAP_SECONDS (the line was idle or the recorder was off) are
+# skipped by jumping the clock to the next sample.
+#
+# When the recording ends a summary line is logged and get_front_pressure
+# raises ReplayFinished: acquisition.py then exits when it runs as its own
+# process, and stops its loop (the dev server keeps serving) when it runs in
+# a thread. With REPLAY_LOOP=1 the recording starts over instead.
+#
+# Reads the readings table of old versions (ISO timestamp column) as well as
+# the day partitions of this version (ts in milliseconds).
+
+import bisect
+from datetime import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+import clock
+# The alarm output and its hold logic are the production ones
+from pressure_sensor import setup_gpio, check_pressure_threshold
+
+REPLAY_DB = os.environ.get('REPLAY_DB', 'pressure_data.db')
+REPLAY_SPEED = float(os.environ.get('REPLAY_SPEED', '1'))  # 1 = real time, 10 = 10x, 0 = as fast as possible
+REPLAY_LOOP = os.environ.get('REPLAY_LOOP') == '1'
+REPLAY_GAP_SECONDS = 5.0  # A sample older than this is stale; skip ahead to the next one
+
+log = logging.getLogger(__name__)
+
+_init_lock = threading.Lock()
+_times = None  # Recorded Unix times, ascending
+_samples = None  # (front_pressure, rear_pressure) per recorded time
+_offset = 0.0  # Added to the recorded times; grows by one recording length per loop
+_position = 0  # Index of the sample returned last
+_current = None  # Sample read by get_front_pressure, for the matching get_rear_pressure
+_replayed = 0
+_skipped_seconds = 0.0
+_real_started = None
+
+class ReplayFinished(Exception):
+    """Raised by the sensor reads once the recording has been played to the end."""
+
+def load_recording(path):
+    """
+    Returns (times, samples) from the readings table of a recorded database,
+    ordered by time. Rows with a missing pressure are left out.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Recording not found: {path}")
+    conn = sqlite3.connect(f'file:{pathname2url(os.path.abspath(path))}?mode=ro', uri=True)
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(readings)')]
+        if 'ts' in columns:
+            rows = conn.execute('''
+                SELECT ts / 1000.0, front_pressure, rear_pressure FROM readings
+                WHERE front_pressure IS NOT NULL AND rear_pressure IS NOT NULL
+                ORDER BY ts
+            ''').fetchall()
+        else:
+            rows = [(datetime.fromisoformat(timestamp).timestamp(), front, rear)
+                    for timestamp, front, rear in conn.execute('''
+                        SELECT timestamp, front_pressure, rear_pressure FROM readings
+                        WHERE front_pressure IS NOT NULL AND rear_pressure IS NOT NULL
+                        ORDER BY timestamp
+                    ''')]
+    finally:
+        conn.close()
+    if not rows:
+        raise ValueError(f"No readings in {path}")
+    return [row[0] for row in rows], [(row[1], row[2]) for row in rows]
+
+def init_sensors():
+    """Loads the recording and switches this process to its virtual clock."""
+    global _times, _samples, _real_started
+    with _init_lock:
+        if _times is not None:
+            return
+        times, samples = load_recording(REPLAY_DB)
+        clock.set_clock(clock.VirtualClock(times[0], REPLAY_SPEED))
+        _real_started = time.monotonic()
+        _samples = samples
+        _times = times
+        log.info("Replaying %s", REPLAY_DB, extra={
+            'samples': len(times), 'recorded_from': datetime.fromtimestamp(times[0]).isoformat(timespec='seconds'),
+            'recorded_to': datetime.fromtimestamp(times[-1]).isoformat(timespec='seconds'), 'speed': REPLAY_SPEED,
+        })
+
+def finish():
+    """Ends the replay: logs what was played and raises ReplayFinished."""
+    real_seconds = time.monotonic() - _real_started
+    virtual_seconds = _times[-1] - _times[0] - _skipped_seconds
+    log.info("Replay finished", extra={
+        'samples': _replayed, 'virtual_seconds': round(virtual_seconds, 1), 'skipped_seconds': round(_skipped_seconds, 1),
+        'real_seconds': round(real_seconds, 1), 'speedup': round(virtual_seconds / real_seconds, 1) if real_seconds else None,
+    })
+    raise ReplayFinished(REPLAY_DB)
+
+def current_sample():
+    """Returns the recorded (front, rear) sample at the current virtual time."""
+    global _position, _offset, _replayed, _skipped_seconds
+    if _times is None:
+        init_sensors()
+    now = clock.time() - _offset
+    i = max(_position, bisect.bisect_right(_times, now) - 1)
+    if now - _times[i] > REPLAY_GAP_SECONDS:
+        if i + 1 < len(_times):
+            # Stale sample: skip the gap
+            i += 1
+            _skipped_seconds += _times[i] - now
+            clock.get_clock().jump(_times[i] + _offset)
+        elif REPLAY_LOOP:
+            log.info("Recording ended; starting over")
+            _offset = now + _offset - _times[0]
+            i = 0
+        else:
+            finish()
+    _position = i
+    _replayed += 1
+    return _samples[i]
+
+def get_front_pressure():
+    """Returns the recorded front pressure at the current virtual time."""
+    global _current
+    _current = current_sample()
+    return _current[0]
+
+def get_rear_pressure():
+    """Returns the rear pressure of the sample read by get_front_pressure."""
+    global _current
+    sample = _current if _current is not None else current_sample()
+    _current = None
+    return sample[1]
@@ -3,10 +3,15 @@
 ##Hasing simulation features
 
 import time
-import random #simulation feature
-import math #simulation feature
 import RPi.GPIO as GPIO
 
+import clock
+from sim_model import ( #simulation feature
+    SIM_BASE_PRESSURE_FRONT,
+    SIM_BASE_PRESSURE_REAR,
+    simulated_pressure,
+)
+
 #-----------------------------------------------------#
 #import board
 #import busio
@@ -22,12 +27,7 @@ import RPi.GPIO as GPIO
 #-----------------------------------------------------#
 # Define channels for front and rear sensors
 
-#Simulation parameters
-SIM_BASE_PRESSURE_FRONT = 0.13  # MPa
-SIM_BASE_PRESSURE_REAR = 0.13  # MPa
-SIM_VARIATION = 0.005         # MPa
-SIM_NOISE = 0.0005         # MPa
-SIM_FREQUENCY = 0.05 #Mpa
+#Simulation parameters are in sim_model.py
 
 # GPIO Setup
 GPIO_PIN = 26  # Using GPIO26
@@ -40,32 +40,26 @@ alarm_hold_time = 1.0  # Hold alarm for 1 second
 class MockAnalogInF:
     """Mock class to simulate AnalogIn for front sensor"""
     def __init__(self):
-        self.timestamp = time.time()
+        self.timestamp = clock.time()
     @property
     def voltage(self):
         """Simulate a voltage reading with some variation"""
-        t = time.time() - self.timestamp
-        # Create a slower varying sine wave + minimal noise
-        variation = math.sin((t * SIM_FREQUENCY) + math.pi/4) * SIM_VARIATION  # Phase shift for different pattern
-        noise = random.uniform(-SIM_NOISE, SIM_NOISE)
-        simulated_pressure = SIM_BASE_PRESSURE_FRONT + variation + noise
+        t = clock.time() - self.timestamp
+        pressure = simulated_pressure(SIM_BASE_PRESSURE_FRONT, t)
         # Convert pressure back to equivalent voltage
-        return simulated_pressure * 5  # Using 3.3V for Raspberry Pi
+        return pressure * 5  # Using 3.3V for Raspberry Pi
 
 class MockAnalogInR:
     """Mock class to simulate AnalogIn for rear sensor"""
     def __init__(self):
-        self.timestamp = time.time()
+        self.timestamp = clock.time()
     @property
     def voltage(self):
         """Simulate a voltage reading with some variation"""
-        t = time.time() - self.timestamp
-        # Create a slower varying sine wave + minimal noise
-        variation = math.sin((t * SIM_FREQUENCY) + math.pi/4) * SIM_VARIATION  # Phase shift for different pattern
-        noise = random.uniform(-SIM_NOISE, SIM_NOISE)
-        simulated_pressure = SIM_BASE_PRESSURE_REAR + variation + noise
+        t = clock.time() - self.timestamp
+        pressure = simulated_pressure(SIM_BASE_PRESSURE_REAR, t)
         # Convert pressure back to equivalent voltage
-        return simulated_pressure * 5  # Using 3.3V for Raspberry Pi
+        return pressure * 5  # Using 3.3V for Raspberry Pi
     
 
 chan_front = MockAnalogInF()  #Simulation feature  
@@ -109,6 +103,9 @@ def convert_voltage_to_raw_pressure(voltage):
     pressure = V_sensor / Vmax_sensor * Pmax
     return pressure
 
+def init_sensors():
+    """Nothing to open for the simulated channels; matches pressure_sensor.init_sensors."""
+
 def get_front_pressure():
     """
     Reads the voltage from the front pressure sensor and returns the calibrated pressure in MPa.
@@ -147,7 +144,7 @@ def check_pressure_threshold(front_pressure, rear_pressure):
         return "error"
         
     global alarm_active, alarm_start_time
-    current_time = time.time()
+    current_time = clock.time()
     
     # Check if system is idle (not turned on yet)
     if front_pressure <= IDLE_PRESSURE_THRESHOLD or rear_pressure <= IDLE_PRESSURE_THRESHOLD:
@@ -0,0 +1,164 @@
+# profiler.py
+# Opt-in sampling profiler for the acquisition loop and Flask requests.
+#
+# Code that should be profiled marks the current thread with tag() while it
+# works and untag() when it is done (the acquisition loop per iteration, the
+# request hooks per request). While a profile is running, a background thread
+# looks at the stacks of the tagged threads every SAMPLE_INTERVAL seconds and
+# counts them. When the window ends the counts are written in the collapsed
+# stack format that flamegraph.pl and speedscope read:
+#   request /api/history;AtsuKanshi.py:api_history;database.py:get_historical_readings 42
+#
+# Outside a profile, tag() and untag() only check one flag.
+# Start a profile with POST /admin/profile (served only with PROFILE_ENABLED=1),
+# or send SIGUSR2 to the acquisition process; files go to PROFILE_DIR.
+
+import collections
+import fcntl
+from datetime import datetime
+import logging
+import os
+import sys
+import threading
+import time
+
+import database
+
+PROFILE_DIR = 'profiles'
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED') == '1'  # Serve the /admin/profile routes
+PROFILE_SECONDS = 120  # Default length of a profiling window
+MAX_PROFILE_SECONDS = 1800
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+MAX_DEPTH = 64  # Deeper stacks are cut at the root end
+
+log = logging.getLogger(__name__)
+
+active = False  # True while a profile is running
+_tags = {}  # thread id -> label, for threads doing work we want to profile
+_lock = threading.Lock()
+_current = None  # Details of the running profile, for status()
+_last_file = None
+_requested = None  # Role of a profile asked for by a signal, started by poll_request()
+
+def tag(label):
+    """Marks the calling thread as doing `label` work until untag()."""
+    if active:
+        _tags[threading.get_ident()] = label
+
+def untag():
+    if active:
+        _tags.pop(threading.get_ident(), None)
+
+def _stack(frame):
+    """Returns the folded stack of a frame, root first."""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def _run(role, seconds, interval):
+    global active, _current, _last_file
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    own = threading.get_ident()
+    try:
+        while time.monotonic() < deadline and active:
+            frames = sys._current_frames()
+            for thread_id, label in list(_tags.items()):
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own:
+                    counts[f'{label};{_stack(frame)}'] += 1
+            samples += 1
+            del frames
+            time.sleep(interval)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{role}-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in counts.most_common():
+                f.write(f'{stack} {count}\n')
+        _last_file = path
+
+        leaves = collections.Counter()
+        for stack, count in counts.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        log.info("Profile written to %s", path, extra={
+            'samples': samples, 'stacks': sum(counts.values()),
+            'top': ', '.join(f'{name} {count}' for name, count in leaves.most_common(5)),
+        })
+    except Exception as e:
+        log.error("Error while profiling: %s", e)
+    finally:
+        with _lock:
+            active = False
+            _current = None
+            _tags.clear()
+
+def start(role, seconds=PROFILE_SECONDS, interval=SAMPLE_INTERVAL):
+    """
+    Starts profiling this process for `seconds` seconds in a background thread.
+    Returns False if a profile is already running.
+    """
+    global active, _current
+    seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+    with _lock:
+        if active:
+            return False
+        active = True
+        _current = {'role': role, 'pid': os.getpid(), 'seconds': seconds,
+                    'started': datetime.now().isoformat(timespec='seconds')}
+    threading.Thread(target=_run, args=(role, seconds, interval), daemon=True).start()
+    log.info("Profiling %s for %d s", role, seconds)
+    return True
+
+def request(role):
+    """
+    Asks for a profile from a signal handler. The handler may interrupt a
+    thread holding _lock or a logging lock, so it only sets a flag; the
+    profiled loop starts the profile with poll_request().
+    """
+    global _requested
+    _requested = role
+
+def poll_request():
+    """Starts the profile asked for with request(), if any."""
+    global _requested
+    if _requested is not None:
+        role, _requested = _requested, None
+        start(role)
+
+def stop():
+    """Ends the running profile early; its file is still written."""
+    global active
+    active = False
+
+def status():
+    return {'active': active, 'current': _current, 'last_file': _last_file}
+
+def list_profiles():
+    """Returns the profile files, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = [name for name in os.listdir(PROFILE_DIR) if name.endswith('.folded')]
+    names.sort(key=lambda name: os.path.getmtime(os.path.join(PROFILE_DIR, name)), reverse=True)
+    return names
+
+def acquisition_pid():
+    """
+    Returns the pid of the running acquisition process from its lock file,
+    or None if no process holds the lock.
+    """
+    path = database.ACQUISITION_LOCK_FILE
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            pid = f.read().strip()  # Locked, so the pid in it is alive
+            return int(pid) if pid.isdigit() else None
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return None
@@ -0,0 +1,230 @@
+# querylog.py
+# Times every query database.py runs and logs the slow ones with their query plan.
+#
+# database.py opens all of its connections with factory=TimedConnection, whose
+# cursors measure execute plus fetch time and count the rows returned. Every
+# query feeds the db_query_seconds metric by caller; a query slower than
+# SLOW_QUERY_MS also has its EXPLAIN QUERY PLAN captured and is appended to
+# SLOW_LOG_FILE as one JSON line.
+#
+# All processes append to the same log. Only the acquisition process rotates it
+# (rotate_slow_log); the others use a WatchedFileHandler, which reopens the file
+# after it has been moved.
+
+from datetime import datetime
+import json
+import logging
+import logging.handlers
+import os
+import sqlite3
+import sys
+import time
+
+import metrics
+
+SLOW_QUERY_MS = 50.0  # Queries taking longer than this are logged with their plan
+SLOW_LOG_FILE = 'slow_queries.log'
+SLOW_LOG_MAX_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+
+log = logging.getLogger(__name__)
+
+QUERY_SECONDS = metrics.histogram('db_query_seconds', 'Time to execute and fetch one query, by calling function', ['caller'])
+SLOW_QUERIES = metrics.counter('db_slow_queries_total', 'Queries slower than SLOW_QUERY_MS, by calling function', ['caller'])
+
+_logger = None
+
+def slow_logger():
+    """Returns the logger writing to SLOW_LOG_FILE, creating it on first use."""
+    global _logger
+    if _logger is None or _logger.handlers[0].baseFilename != os.path.abspath(SLOW_LOG_FILE):
+        logger = logging.getLogger('atsukanshi.slow_queries')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = logging.handlers.WatchedFileHandler(SLOW_LOG_FILE, delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+def rotate_slow_log():
+    """Rotates SLOW_LOG_FILE once it is larger than SLOW_LOG_MAX_BYTES."""
+    if not os.path.exists(SLOW_LOG_FILE) or os.path.getsize(SLOW_LOG_FILE) < SLOW_LOG_MAX_BYTES:
+        return
+    for i in range(SLOW_LOG_BACKUPS - 1, 0, -1):
+        if os.path.exists(f'{SLOW_LOG_FILE}.{i}'):
+            os.replace(f'{SLOW_LOG_FILE}.{i}', f'{SLOW_LOG_FILE}.{i + 1}')
+    os.replace(SLOW_LOG_FILE, f'{SLOW_LOG_FILE}.1')
+
+def find_caller():
+    """Returns 'function (file:line)' of the first frame outside this module."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return 'unknown'
+    return f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})'
+
+def explain(connection, sql, params):
+    """Returns the EXPLAIN QUERY PLAN lines of a query, or [] if it cannot be explained."""
+    try:
+        cursor = sqlite3.Cursor(connection)  # A plain cursor, so the plan itself is not timed
+        return [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+    except sqlite3.Error:
+        return []
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that times each query from execute until its rows have been fetched.
+    Statements that return no rows finish in execute. Otherwise a query is
+    finished by fetchall, by running out of rows, by the next execute or by
+    close; fetchone finishes it as well because the callers here only ever
+    read one row that way.
+    """
+    _query = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        caller = find_caller()
+        started = time.perf_counter()
+        result = super().execute(sql, params)
+        self._query = [sql, params, caller, time.perf_counter() - started, 0]
+        if self.description is None:
+            self._finish()
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        caller = find_caller()
+        started = time.perf_counter()
+        result = super().executemany(sql, seq_of_params)
+        self._query = [sql, None, caller, time.perf_counter() - started, 0]
+        self._finish()
+        return result
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        self._finish()
+        return rows
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, 0 if row is None else 1)
+        self._finish()
+        return row
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - started, 0)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Catches queries whose rows were only partly read before the cursor was dropped
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _add(self, elapsed, rows):
+        if self._query is not None:
+            self._query[3] += elapsed
+            self._query[4] += rows
+
+    def _finish(self):
+        if self._query is None:
+            return
+        sql, params, caller, elapsed, rows = self._query
+        self._query = None
+        function = caller.split(' ', 1)[0]
+        QUERY_SECONDS.labels(function).observe(elapsed)
+        if elapsed * 1000 < SLOW_QUERY_MS:
+            return
+        SLOW_QUERIES.labels(function).inc()
+        try:
+            plan = explain(self.connection, sql, params) if params is not None else []
+            slow_logger().info(json.dumps({
+                'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+                'pid': os.getpid(),
+                'caller': caller,
+                'ms': round(elapsed * 1000, 2),
+                'rows': rows,
+                'sql': ' '.join(sql.split()),
+                'plan': plan,
+            }))
+        except Exception as e:
+            log.error("Error logging slow query: %s", e)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those made by execute, are TimedCursors."""
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def read_slow_log():
+    """Returns the entries of the slow-query log and its backups, oldest first."""
+    entries = []
+    paths = [f'{SLOW_LOG_FILE}.{i}' for i in range(SLOW_LOG_BACKUPS, 0, -1)] + [SLOW_LOG_FILE]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # A line still being written by another process
+    return entries
+
+def top_offenders(limit=20):
+    """
+    Groups logged slow queries by caller and statement, worst total time first.
+    Flags plans that scan a table or index instead of searching it, and plans
+    that build a temporary B-tree to sort or group.
+    """
+    groups = {}
+    for entry in read_slow_log():
+        key = (entry['caller'].split(' ', 1)[0], entry['sql'])
+        group = groups.setdefault(key, {
+            'caller': entry['caller'], 'sql': entry['sql'], 'count': 0,
+            'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['rows'] += entry['rows']
+        group['last_seen'] = entry['timestamp']
+        group['plan'] = entry['plan']
+    result = sorted(groups.values(), key=lambda g: g['total_ms'], reverse=True)[:limit]
+    for group in result:
+        group['avg_ms'] = group['total_ms'] / group['count']
+        group['avg_rows'] = group.pop('rows') / group['count']
+        group['scan'] = any(line.startswith('SCAN') for line in group['plan'])
+        group['temp_btree'] = any('TEMP B-TREE' in line for line in group['plan'])
+    return result
@@ -0,0 +1,135 @@
+# ring_buffer.py
+# Fixed-size memory-mapped ring file holding the most recent readings.
+#
+# The acquisition loop appends (ts, front, rear) records; any process can map
+# the same file read-only and look up recent windows without touching SQLite.
+#
+# File layout:
+#   header: magic (4s), pad (4x), capacity (Q), write count (Q), pad up to HEADER_SIZE
+#   records: capacity x (ts, front, rear) as little-endian float64,
+#            ts in Unix milliseconds, missing pressures stored as NaN
+#
+# Record i (counting every record ever written) lives in slot i % capacity.
+# The writer fills the slot first and then bumps the write count, so readers
+# only ever see complete records.
+
+import bisect
+import math
+import mmap
+import os
+import struct
+
+MAGIC = b'PRB1'
+HEADER = struct.Struct('<4s4xQQ')
+HEADER_SIZE = 64
+RECORD = struct.Struct('<ddd')
+RING_CAPACITY = 200000  # A little over 24 hours at 2 samples per second
+
+class RingFile:
+    """
+    A memory-mapped ring of (ts, front, rear) records.
+    Open with writable=True in the acquisition process only.
+    """
+    def __init__(self, path, capacity=RING_CAPACITY, writable=False):
+        self.path = path
+        self.writable = writable
+        if writable and not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, capacity, 0).ljust(HEADER_SIZE, b'\0'))
+                f.truncate(HEADER_SIZE + capacity * RECORD.size)
+        self.file = open(path, 'r+b' if writable else 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, self.capacity, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a ring file')
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    @property
+    def count(self):
+        """Total number of records ever written."""
+        return HEADER.unpack_from(self.map, 0)[2]
+
+    def append(self, ts_ms, front_pressure, rear_pressure):
+        """Appends one record. Timestamps must not go backwards."""
+        count = self.count
+        RECORD.pack_into(self.map, HEADER_SIZE + (count % self.capacity) * RECORD.size,
+                         ts_ms,
+                         math.nan if front_pressure is None else front_pressure,
+                         math.nan if rear_pressure is None else rear_pressure)
+        HEADER.pack_into(self.map, 0, MAGIC, self.capacity, count + 1)
+
+    def bounds(self):
+        """
+        Returns (first, end) record numbers currently readable.
+        The oldest slot is skipped while the ring is full because the writer
+        may be overwriting it.
+        """
+        count = self.count
+        first = max(0, count - self.capacity + 1)
+        return first, count
+
+    def record(self, n):
+        """Returns record number n as a (ts, front, rear) tuple."""
+        return RECORD.unpack_from(self.map, HEADER_SIZE + (n % self.capacity) * RECORD.size)
+
+    def timestamp(self, n):
+        return struct.unpack_from('<d', self.map, HEADER_SIZE + (n % self.capacity) * RECORD.size)[0]
+
+    def find(self, ts_ms, first=None, end=None):
+        """Returns the first record number with ts >= ts_ms (binary search)."""
+        if first is None:
+            first, end = self.bounds()
+        return bisect.bisect_left(range(first, end), ts_ms, key=self.timestamp) + first
+
+    def records(self, first, end):
+        """Returns records [first, end) as a list of (ts, front, rear) tuples."""
+        result = []
+        for start, stop in self.slots(first, end):
+            result.extend(RECORD.iter_unpack(self.map[HEADER_SIZE + start * RECORD.size:
+                                                      HEADER_SIZE + stop * RECORD.size]))
+        return result
+
+    def slots(self, first, end):
+        """Maps record numbers [first, end) to at most two contiguous (start, stop) slot ranges."""
+        if end <= first:
+            return []
+        start, stop = first % self.capacity, end % self.capacity or self.capacity
+        if start < stop:
+            return [(start, stop)]
+        return [(start, self.capacity), (0, stop)]
+
+    def window(self, start_ms, end_ms=None):
+        """Returns records with start_ms <= ts <= end_ms as a list of tuples, oldest first."""
+        first, end = self.bounds()
+        lo = self.find(start_ms, first, end)
+        hi = end if end_ms is None else bisect.bisect_right(range(first, end), end_ms, key=self.timestamp) + first
+        return self.records(lo, hi)
+
+    def latest(self, n):
+        """Returns the newest n records, oldest first."""
+        first, end = self.bounds()
+        return self.records(max(first, end - n), end)
+
+    def covers(self, start_ms):
+        """True if the ring still holds every record since start_ms."""
+        first, end = self.bounds()
+        return end > first and (first == 0 or self.timestamp(first) <= start_ms)
+
+    def window_arrays(self, start_ms, end_ms=None):
+        """
+        Returns the records in [start_ms, end_ms] as a list of NumPy structured
+        arrays (fields ts, front_pressure, rear_pressure) that view the mapped
+        file without copying. There are two arrays when the window wraps around.
+        """
+        import numpy as np  # Only needed for zero-copy access
+
+        dtype = np.dtype([('ts', '<f8'), ('front_pressure', '<f8'), ('rear_pressure', '<f8')])
+        records = np.frombuffer(self.map, dtype=dtype, count=self.capacity, offset=HEADER_SIZE)
+        first, end = self.bounds()
+        lo = self.find(start_ms, first, end)
+        hi = end if end_ms is None else bisect.bisect_right(range(first, end), end_ms, key=self.timestamp) + first
+        return [records[start:stop] for start, stop in self.slots(lo, hi)]
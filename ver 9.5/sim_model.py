@@ -0,0 +1,63 @@
+# sim_model.py
+# Pressure model used by the simulator backend (pressure_sensorSIM.py)
+# and the synthetic history generator (generate_history.py), and the
+# compressor model of the fleet simulator (fleet_sim.py).
+
+import math
+import random
+
+#Simulation parameters
+SIM_BASE_PRESSURE_FRONT = 0.13  # MPa
+SIM_BASE_PRESSURE_REAR = 0.13  # MPa
+SIM_VARIATION = 0.005         # MPa
+SIM_NOISE = 0.0005         # MPa
+SIM_FREQUENCY = 0.05 #Mpa
+
+def simulated_pressure(base_pressure, t, rng=random):
+    """
+    Returns the simulated pressure in MPa at t seconds after start:
+    a slow sine wave around base_pressure plus minimal noise.
+    """
+    # Create a slower varying sine wave + minimal noise
+    variation = math.sin((t * SIM_FREQUENCY) + math.pi/4) * SIM_VARIATION  # Phase shift for different pattern
+    noise = rng.uniform(-SIM_NOISE, SIM_NOISE)
+    return base_pressure + variation + noise
+
+class CompressorModel:
+    """
+    The air supply of one line: the compressor runs until the pressure reaches
+    cut_out, stops, and starts again once consumption has drawn it down to
+    cut_in. Every parameter is drawn from `rng`, so each seeded line gets its
+    own profile.
+    """
+    def __init__(self, rng=random):
+        self.rng = rng
+        self.cut_in = rng.uniform(0.14, 0.45)  # MPa, above the low-pressure alarm
+        self.cut_out = self.cut_in + rng.uniform(0.03, 0.12)  # MPa
+        self.fill_rate = rng.uniform(0.002, 0.01)  # MPa/s added while the compressor runs
+        self.draw_rate = rng.uniform(0.0005, 0.002)  # MPa/s used by the line
+        self.line_drop = rng.uniform(0.0, 0.01)  # MPa lost in the piping before the rear sensor
+        self.pressure = rng.uniform(self.cut_in, self.cut_out)
+        self.running = rng.random() < 0.5
+
+    def step(self, dt, leak=0.0, powered=True):
+        """
+        Advances the model by dt seconds and returns (front, rear) in MPa.
+        leak is an extra loss in MPa/s; powered=False means the line is switched
+        off and bleeds down towards zero.
+        """
+        if not powered:
+            self.running = False
+            self.pressure -= (self.draw_rate + 0.01) * dt
+        elif self.running:
+            self.pressure += (self.fill_rate - self.draw_rate - leak) * dt
+            if self.pressure >= self.cut_out:
+                self.running = False
+        else:
+            self.pressure -= (self.draw_rate + leak) * dt
+            if self.pressure <= self.cut_in:
+                self.running = True
+        self.pressure = max(0.0, self.pressure)
+        front = self.pressure + self.rng.uniform(-SIM_NOISE, SIM_NOISE)
+        rear = self.pressure - self.line_drop + self.rng.uniform(-SIM_NOISE, SIM_NOISE)
+        return max(0.0, front), max(0.0, rear)
@@ -0,0 +1,282 @@
+# soak_test.py
+# Runs the whole system for weeks of simulated time and checks that nothing
+# grows without bound.
+#
+# The acquisition service (simulator backend) and the Flask app run in this one
+# process on a simulated clock (clock.py), so 30 days of sampling, the daily
+# compaction and cleanup jobs and the retention windows pass in minutes.
+# Dashboard requests go through the Flask test client every --poll-minutes of
+# simulated time, and every --checkpoint-hours the harness records:
+#   RSS, memory traced by tracemalloc, open file descriptors, threads,
+#   the size of every kind of data file including the SQLite WALs,
+#   and the p95 latency of each endpoint since the last checkpoint.
+#
+# After --warmup-days (long enough for the raw retention window to fill), each
+# series should be flat. A straight line is fitted through the steady-state
+# checkpoints; the run fails if a series grows by more than its limit over
+# the window (see CHECKS). Files that are meant to grow for longer than the
+# run (rollups, archives) are reported but not checked.
+#
+# Example:
+#   python soak_test.py --days 30 --output soak_results.json
+
+import argparse
+from datetime import datetime
+import json
+import os
+import shutil
+import statistics
+import threading
+import time
+import tracemalloc
+
+import clock
+
+# (series, max relative growth over the steady-state window, growth below which it never fails)
+CHECKS = [
+    ('rss_kib', 0.10, 4096),
+    ('traced_kib', 0.10, 1024),
+    ('open_fds', 0.0, 2),
+    ('threads', 0.0, 1),
+    ('file_main', 0.25, 1024 * 1024),
+    ('file_main_wal', 0.25, 4 * 1024 * 1024),
+    ('file_rollups_wal', 0.25, 4 * 1024 * 1024),
+    ('file_partitions', 0.25, 4 * 1024 * 1024),
+    ('file_partitions_wal', 0.25, 4 * 1024 * 1024),
+    ('file_rings', 0.0, 1),
+]
+LATENCY_GROWTH = 0.5  # Max relative growth of an endpoint's p95 latency
+LATENCY_FLOOR_MS = 5.0  # p95 growth below this never fails
+
+# Requested by every dashboard poll, like an open dashboard plus a log page
+POLL_URLS = [
+    '/api/realtime',
+    '/api/average/hour',
+    '/api/average/minute',
+    '/api/log',
+    '/api/error-log',
+]
+CHECKPOINT_URLS = ['/api/history']  # Heavier; requested once per checkpoint
+
+class SteppedClock(clock.SimulatedClock):
+    """
+    Simulated clock that holds the acquisition loop when it reaches the next
+    harness event, so polls and checkpoints happen at exact simulated times
+    and never run concurrently with the loop.
+    """
+    def __init__(self, start):
+        super().__init__(start)
+        self.pause_at = None
+        self.reached = threading.Event()
+        self.resume = threading.Event()
+
+    def sleep(self, seconds):
+        super().sleep(seconds)
+        if self.pause_at is not None and self.time() >= self.pause_at:
+            self.resume.clear()
+            self.reached.set()
+            self.resume.wait()
+
+    def run_until(self, when, timeout=60.0):
+        """Lets the loop run until the clock reaches `when`, then holds it there."""
+        self.reached.clear()
+        self.pause_at = when
+        self.resume.set()
+        if not self.reached.wait(timeout):
+            raise RuntimeError(f"Acquisition loop did not reach {datetime.fromtimestamp(when)} within {timeout:.0f} s")
+
+def rss_kib():
+    """Resident memory of this process in KiB (Linux)."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return None
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+def growth(points, key):
+    """
+    Fits a line through (day, value) and returns (absolute, relative) growth
+    over the covered days, or None if there are too few points.
+    """
+    points = [(p['day'], p[key]) for p in points if p.get(key) is not None]
+    if len(points) < 3:
+        return None
+    days = [p[0] for p in points]
+    values = [p[1] for p in points]
+    if len(set(values)) == 1:
+        return 0.0, 0.0
+    slope, intercept = statistics.linear_regression(days, values)
+    absolute = slope * (days[-1] - days[0])
+    start = slope * days[0] + intercept
+    return absolute, absolute / start if start > 0 else float('inf')
+
+class Soak:
+    def __init__(self, args):
+        self.args = args
+        self.start = datetime.now().timestamp() if args.start is None else datetime.fromisoformat(args.start).timestamp()
+        self.sim = SteppedClock(self.start)
+        self.latencies = {}
+        self.checkpoints = []
+        self.errors = 0
+        self.snapshot = None
+        self.tracemalloc_top = []
+        self.steady_start = None  # Index of the first checkpoint after the tracemalloc snapshot
+
+    def boot(self):
+        """Starts acquisition and imports the web app on the simulated clock."""
+        clock.set_clock(self.sim)
+        os.environ['SENSOR_BACKEND'] = 'sim'
+        # Imported only now, so the simulator and the app pick up the simulated clock
+        import acquisition
+        import applog
+        import database
+        applog.setup_logging(self.args.log_level)
+        if os.path.exists(self.args.data_dir):
+            shutil.rmtree(self.args.data_dir)
+        database.set_data_dir(self.args.data_dir)
+        acquisition.LOOP_INTERVAL = self.args.sample_interval
+        self.sim.pause_at = self.start  # Hold the loop after its first iteration
+        if not acquisition.start(in_thread=True):
+            raise RuntimeError(f"Another acquisition process holds the lock in {self.args.data_dir}")
+        import AtsuKanshi
+        self.client = AtsuKanshi.app.test_client()
+        self.database = database
+
+    def request(self, url):
+        started = time.perf_counter()
+        response = self.client.get(url)
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            self.errors += 1
+        self.latencies.setdefault(url.split('?')[0], []).append(elapsed)
+
+    def poll(self):
+        for url in POLL_URLS:
+            self.request(url)
+
+    def checkpoint(self):
+        for url in CHECKPOINT_URLS:
+            self.request(url)
+        day = (self.sim.time() - self.start) / 86400
+        point = {
+            'day': round(day, 3),
+            'time': self.sim.now().isoformat(timespec='seconds'),
+            'rss_kib': rss_kib(),
+            'traced_kib': tracemalloc.get_traced_memory()[0] // 1024 if tracemalloc.is_tracing() else None,
+            'open_fds': open_fds(),
+            'threads': threading.active_count(),
+        }
+        for name, size in self.database.storage_sizes().items():
+            point[f'file_{name}'] = size
+        for url, values in self.latencies.items():
+            point[f'p95_ms {url}'] = percentile(values, 0.95)
+        self.latencies = {}
+        self.checkpoints.append(point)
+        if tracemalloc.is_tracing() and day >= self.args.warmup_days and self.snapshot is None:
+            # The snapshot itself takes memory, so the steady state starts after it
+            self.snapshot = tracemalloc.take_snapshot()
+            self.steady_start = len(self.checkpoints)
+        print(f"day {day:6.2f}  rss {point['rss_kib']:8d} KiB  traced {point['traced_kib'] or 0:8d} KiB  "
+              f"fds {point['open_fds']:4d}  threads {point['threads']:3d}  "
+              f"partitions {point['file_partitions'] / 1024:9.0f} KiB  wal {point['file_partitions_wal'] / 1024:7.0f} KiB  "
+              f"realtime p95 {point.get('p95_ms /api/realtime') or 0:6.2f} ms", flush=True)
+
+    def run(self):
+        args = self.args
+        if args.tracemalloc:
+            tracemalloc.start(args.tracemalloc_frames)
+        self.boot()
+        end = self.start + args.days * 86400
+        poll_every = args.poll_minutes * 60
+        checkpoint_every = args.checkpoint_hours * 3600
+        next_poll = self.start + poll_every
+        next_checkpoint = self.start
+        real_started = time.monotonic()
+        while True:
+            now = min(next_poll, next_checkpoint, end)
+            self.sim.run_until(now)
+            if now >= next_poll:
+                self.poll()
+                next_poll += poll_every
+            if now >= next_checkpoint:
+                self.checkpoint()
+                next_checkpoint += checkpoint_every
+            if now >= end:
+                break
+        if self.checkpoints[-1]['day'] < args.days:
+            self.checkpoint()
+        real_seconds = time.monotonic() - real_started
+        if self.snapshot is not None:
+            diff = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+            self.tracemalloc_top = [str(stat) for stat in diff[:10]]
+        return real_seconds
+
+    def verdicts(self):
+        """Returns (series, absolute growth, relative growth, limit, ok) for every checked series."""
+        if self.steady_start is not None:
+            steady = self.checkpoints[self.steady_start:]
+        else:
+            steady = [p for p in self.checkpoints if p['day'] >= self.args.warmup_days]
+        checks = list(CHECKS) + [(key, LATENCY_GROWTH, LATENCY_FLOOR_MS)
+                                 for key in sorted(self.checkpoints[-1]) if key.startswith('p95_ms')]
+        result = []
+        for key, limit, floor in checks:
+            fitted = growth(steady, key)
+            if fitted is None:
+                continue
+            absolute, relative = fitted
+            ok = absolute <= floor or relative <= limit
+            result.append((key, absolute, relative, limit, ok))
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Soak test the acquisition service and the app on a simulated clock.')
+    parser.add_argument('--days', type=float, default=30, help='simulated days to run')
+    parser.add_argument('--warmup-days', type=float, default=10, help='days before growth is checked (retention windows filling up)')
+    parser.add_argument('--sample-interval', type=float, default=30.0, help='simulated seconds between acquisition loop iterations')
+    parser.add_argument('--poll-minutes', type=float, default=10.0, help='simulated minutes between dashboard polls')
+    parser.add_argument('--checkpoint-hours', type=float, default=6.0, help='simulated hours between checkpoints')
+    parser.add_argument('--start', help='simulated start time (ISO), default now')
+    parser.add_argument('--data-dir', default='soak_data', help='folder for the data files (emptied first)')
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false', help='skip tracemalloc (runs about twice as fast)')
+    parser.add_argument('--tracemalloc-frames', type=int, default=1, help='frames kept per traced allocation')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the system under test')
+    parser.add_argument('--output', default='soak_results.json', help='JSON file to write results to')
+    args = parser.parse_args()
+
+    soak = Soak(args)
+    real_seconds = soak.run()
+    verdicts = soak.verdicts()
+
+    print(f"\n{args.days:g} simulated days in {real_seconds:.0f} s; {soak.errors} failed requests")
+    print(f"\n{'series':35s} {'growth':>14s} {'relative':>9s} {'limit':>7s}")
+    for key, absolute, relative, limit, ok in verdicts:
+        print(f"{key:35s} {absolute:14.1f} {relative:9.1%} {limit:7.0%}  {'ok' if ok else 'FAIL'}")
+    if soak.tracemalloc_top:
+        print("\nLargest allocation growth since the end of the warmup:")
+        for line in soak.tracemalloc_top:
+            print(f"  {line}")
+
+    failed = [v[0] for v in verdicts if not v[4]]
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {'args': vars(args), 'real_seconds': real_seconds, 'failed_requests': soak.errors},
+            'checkpoints': soak.checkpoints,
+            'verdicts': [{'series': k, 'growth': a, 'relative': r, 'limit': l, 'ok': ok} for k, a, r, l, ok in verdicts],
+            'tracemalloc_top': soak.tracemalloc_top,
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if failed or soak.errors:
+        print(f"FAILED: {', '.join(failed) or 'request errors'}")
+        raise SystemExit(1)
+    print("PASSED")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+// device.js
+// Which device the pages show. A collector box holds the readings of many
+// nodes; the device is picked in the header and kept in the page URL
+// (?device=...), and every API call of the page passes it on.
+// Without ?device= the pages show this box's own sensors.
+
+const DEVICE = new URLSearchParams(window.location.search).get('device');
+const DEVICE_STATUS_LABELS = { normal: '正常', warning: '低圧', idle: '待機中', offline: 'オフライン' };
+
+/**
+ * Adds the shown device to an API or page URL
+ */
+function withDevice(url) {
+    if (!DEVICE) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'device=' + encodeURIComponent(DEVICE);
+}
+
+/**
+ * Fills the device picker from the fleet overview; it stays hidden on a box with one device
+ */
+async function initDeviceSelect() {
+    // Page links keep the device
+    document.querySelectorAll('a.history-link').forEach(a => {
+        a.href = withDevice(a.getAttribute('href'));
+    });
+
+    const select = document.getElementById('device-select');
+    if (!select) return;
+    try {
+        const response = await fetch('/api/devices');
+        if (!response.ok) throw new Error('Failed to fetch devices');
+        const fleet = await response.json();
+        if (fleet.devices.length < 2) return;
+
+        fleet.devices.forEach(device => {
+            const option = document.createElement('option');
+            option.value = device.device_id;
+            option.textContent = `${device.device_id} (${DEVICE_STATUS_LABELS[device.status] || device.status})`;
+            select.appendChild(option);
+        });
+        select.value = DEVICE || fleet.local_device;
+        select.hidden = false;
+        select.addEventListener('change', () => {
+            const url = new URL(window.location.href);
+            url.searchParams.set('device', select.value);
+            window.location.href = url.toString();
+        });
+    } catch (error) {
+        console.error('Error fetching devices:', error);
+    }
+}
+document.addEventListener('DOMContentLoaded', initDeviceSelect);
@@ -1,5 +1,6 @@
 let chart = null;
 let lastData = [];
+let lastDisplayData = [];
 
 /**
  * Updates the clock display in the header
@@ -68,7 +69,7 @@ window.loadHistoryData = async function(startDate, endDate) {
 
     try {
         // Fetch with cache-buster
-        const res = await fetch(`/api/history?start_date=${startDate}&end_date=${endDate}&_=${new Date().getTime()}`);
+        const res = await fetch(withDevice(`/api/history?start_date=${startDate}&end_date=${endDate}&_=${new Date().getTime()}`));
         if (!res.ok) throw new Error('データ取得失敗');
         
         const rawData = await res.json();
@@ -82,6 +83,7 @@ window.loadHistoryData = async function(startDate, endDate) {
             const step = Math.ceil(displayData.length / maxPoints);
             displayData = displayData.filter((_, index) => index % step === 0);
         }
+        lastDisplayData = displayData;
 
         // 3. Prepare Chart.js Arrays
         const labels = displayData.map(entry => {
@@ -169,6 +171,26 @@ document.getElementById('reset-zoom').addEventListener('click', () => {
     if (chart) chart.resetZoom();
 });
 
+// Raw data request: a node that uploads minute summaries sends its raw
+// readings for the range shown (zoom in first to narrow it) on request
+const requestRawButton = document.getElementById('request-raw');
+if (DEVICE) requestRawButton.hidden = false;
+requestRawButton.addEventListener('click', async () => {
+    if (!chart || !lastDisplayData.length) return;
+    const first = lastDisplayData[Math.max(0, Math.floor(chart.scales.x.min))];
+    const last = lastDisplayData[Math.min(lastDisplayData.length - 1, Math.ceil(chart.scales.x.max))];
+    try {
+        const res = await fetch(`/api/devices/${encodeURIComponent(DEVICE)}/backfill?start=${first.timestamp}&end=${last.timestamp}`,
+                                { method: 'POST' });
+        const body = await res.json();
+        if (!res.ok) throw new Error(body.error || res.status);
+        alert('生データを要求しました。端末から届き次第、再読み込みで表示されます');
+    } catch (err) {
+        console.error(err);
+        alert('生データの要求に失敗しました');
+    }
+});
+
 // CSV Download
 document.getElementById('download-csv').addEventListener('click', function() {
     if (!lastData.length) {
@@ -187,7 +209,7 @@ document.getElementById('download-csv').addEventListener('click', function() {
     const url = URL.createObjectURL(blob);
     const a = document.createElement('a');
     a.href = url;
-    a.download = `pressure_history_${startDate}_to_${endDate}.csv`;
+    a.download = `pressure_history_${DEVICE ? DEVICE + '_' : ''}${startDate}_to_${endDate}.csv`;
     document.body.appendChild(a);
     a.click();
     document.body.removeChild(a);
@@ -4,7 +4,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const errorLogList = document.getElementById('error-log-list');
     const clearErrorLogBtn = document.getElementById('clear-error-log');
     const IDLE_PRESSURE_THRESHOLD = 0.029; // Values below this will not be shown
-    const LOW_PRESSURE_THRESHOLD = 0.125; // Values below this are considered "low pressure" events
+    const MAX_LOG_ENTRIES = 5000; // Max entries kept in each list (older ones are dropped)
+    const OVERSCAN_ROWS = 10; // Rows rendered above and below the visible part of a list
+
+    let lastLogId = null; // id of the newest reading already shown
+    let latestEpisodeId = 0; // id of the newest alarm episode received
+    let clearedEpisodeId = 0; // episodes up to this id were cleared by the user
 
     // Update date and time display
     function updateDateTimeDisplay() {
@@ -26,20 +31,144 @@ document.addEventListener('DOMContentLoaded', () => {
     function clearErrorLog() {
         if (confirm('エラーログをクリアしますか？')) {
             errorLogList.innerHTML = '<li class="log-entry">低気圧無し</li>';
+            clearedEpisodeId = latestEpisodeId;
             console.log('Error log cleared');
         }
     }
 
+    function createLogEntry(timestamp, value) {
+        const li = document.createElement('li');
+        li.className = 'log-entry';
+        const timeSpan = document.createElement('span');
+        timeSpan.className = 'log-timestamp';
+        timeSpan.textContent = timestamp;
+        const valueSpan = document.createElement('span');
+        valueSpan.className = 'log-value';
+        valueSpan.textContent = `${value.toFixed(3)} MPa`;
+        li.append(timeSpan, valueSpan);
+        return li;
+    }
+
+    // Minimum of one channel over an episode; null if the channel had no readings
+    function formatEpisodePressure(value) {
+        return value !== null ? `${value.toFixed(3)} MPa` : '—';
+    }
+
+    // Virtualized log list: the newest MAX_LOG_ENTRIES entries are kept in an
+    // array, but only the rows in view (plus OVERSCAN_ROWS on each side) exist
+    // in the DOM. Two spacer items stand in for the rest, so the scrollbar
+    // still covers every entry. Memory and DOM size stay fixed however long
+    // the page is left open.
+    function createVirtualLogList(list) {
+        const entries = []; // { timestamp, value }, oldest first
+        const topSpacer = document.createElement('li');
+        const bottomSpacer = document.createElement('li');
+        let rowHeight = 0; // Every entry is one line, so one measured row fits all
+
+        function render() {
+            if (entries.length === 0) return;
+            if (!rowHeight) {
+                const probe = createLogEntry(entries[0].timestamp, entries[0].value);
+                list.appendChild(probe);
+                rowHeight = probe.offsetHeight; // 0 while the list is hidden; measured again next time
+                list.removeChild(probe);
+            }
+            const height = rowHeight || 1;
+            const first = Math.max(0, Math.floor(list.scrollTop / height) - OVERSCAN_ROWS);
+            const last = Math.min(entries.length, first + Math.ceil(list.clientHeight / height) + 2 * OVERSCAN_ROWS);
+            topSpacer.style.height = `${first * rowHeight}px`;
+            bottomSpacer.style.height = `${(entries.length - last) * rowHeight}px`;
+            const fragment = document.createDocumentFragment();
+            fragment.appendChild(topSpacer);
+            for (let i = first; i < last; i++) {
+                fragment.appendChild(createLogEntry(entries[i].timestamp, entries[i].value));
+            }
+            fragment.appendChild(bottomSpacer);
+            list.replaceChildren(fragment);
+        }
+
+        // Adds entries at the end; follows them if the list was scrolled to the bottom
+        function append(newEntries) {
+            if (newEntries.length === 0) return;
+            const following = entries.length === 0 ||
+                list.scrollTop + list.clientHeight >= list.scrollHeight - rowHeight;
+            entries.push(...newEntries);
+            const dropped = Math.max(0, entries.length - MAX_LOG_ENTRIES);
+            entries.splice(0, dropped);
+            render();
+            if (following) {
+                list.scrollTop = list.scrollHeight;
+            } else {
+                list.scrollTop -= dropped * rowHeight; // Keep the rows being read in place
+            }
+            render();
+        }
+
+        list.addEventListener('scroll', render);
+        window.addEventListener('resize', render);
+        return { append };
+    }
+
+    const frontLog = createVirtualLogList(frontLogList);
+    const rearLog = createVirtualLogList(rearLogList);
+
+    function createErrorEntry(episode) {
+        const start = new Date(episode.start_ts).toLocaleTimeString('ja-JP');
+        const state = episode.is_open ? '継続中' : `${episode.duration.toFixed(1)}秒`;
+        const li = document.createElement('li');
+        li.className = 'log-entry error-entry';
+        li.innerHTML = `
+            <span class="log-timestamp">${start} (${state})</span>
+            <div class="error-details">
+                <span class="error-value">F: ${formatEpisodePressure(episode.min_front_pressure)}</span>
+                <span class="error-value">R: ${formatEpisodePressure(episode.min_rear_pressure)}</span>
+            </div>
+        `;
+        return li;
+    }
+
+    // Error log shows alarm episodes (one entry per low-pressure alarm) from the server
+    async function updateErrorLog() {
+        try {
+            const response = await fetch(withDevice('/api/error-log'));
+            if (!response.ok) throw new Error('Failed to fetch error log');
+            const episodes = await response.json();
+            if (episodes.length > 0) latestEpisodeId = episodes[0].id;
+
+            // Episodes come newest first; skip ones hidden with the clear button
+            const visible = episodes.filter(episode => episode.id > clearedEpisodeId).reverse();
+            errorLogList.innerHTML = '';
+            if (visible.length === 0) {
+                errorLogList.innerHTML = '<li class="log-entry">低気圧無し</li>';
+                return;
+            }
+            const fragment = document.createDocumentFragment();
+            visible.forEach(episode => fragment.appendChild(createErrorEntry(episode)));
+            errorLogList.appendChild(fragment);
+            errorLogList.scrollTop = errorLogList.scrollHeight;
+        } catch (error) {
+            console.error('Error fetching error log:', error);
+        }
+    }
+
     async function updateLogDisplay() {
         try {
-            // Fetch regular logs
-            const response = await fetch('/api/log');
+            // Only ask for rows newer than the last one we have shown
+            const url = lastLogId === null ? '/api/log' : `/api/log?after_id=${lastLogId}`;
+            const response = await fetch(withDevice(url));
             if (!response.ok) throw new Error('Failed to fetch logs');
             const data = await response.json();
 
-            // Clear existing content (except error log since it can be manually cleared)
-            frontLogList.innerHTML = '';
-            rearLogList.innerHTML = '';
+            // Remove the loading placeholder on the first successful fetch
+            if (lastLogId === null) {
+                frontLogList.innerHTML = '';
+                rearLogList.innerHTML = '';
+            }
+            if (data.length === 0) return;
+            lastLogId = data[data.length - 1].id;
+
+            const frontEntries = [];
+            const rearEntries = [];
 
             // Add regular log entries
             data.forEach(entry => {
@@ -47,74 +176,37 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 // Only show front pressure logs if above the idle threshold
                 if (entry.front_pressure !== null && entry.front_pressure >= IDLE_PRESSURE_THRESHOLD) {
-                    const frontEntry = document.createElement('li');
-                    frontEntry.className = 'log-entry';
-                    frontEntry.innerHTML = `
-                        <span class="log-timestamp">${timestamp}</span>
-                        <span class="log-value">${entry.front_pressure.toFixed(3)} MPa</span>
-                    `;
-                    frontLogList.appendChild(frontEntry);
+                    frontEntries.push({ timestamp, value: entry.front_pressure });
                 }
 
                 // Only show rear pressure logs if above the idle threshold
                 if (entry.rear_pressure !== null && entry.rear_pressure >= IDLE_PRESSURE_THRESHOLD) {
-                    const rearEntry = document.createElement('li');
-                    rearEntry.className = 'log-entry';
-                    rearEntry.innerHTML = `
-                        <span class="log-timestamp">${timestamp}</span>
-                        <span class="log-value">${entry.rear_pressure.toFixed(3)} MPa</span>
-                    `;
-                    rearLogList.appendChild(rearEntry);
+                    rearEntries.push({ timestamp, value: entry.rear_pressure });
                 }
             });
 
-            // Filter for and display "error" (low pressure) logs from the same data
-            const errorData = data.filter(entry =>
-                (entry.front_pressure < LOW_PRESSURE_THRESHOLD && entry.front_pressure > IDLE_PRESSURE_THRESHOLD) ||
-                (entry.rear_pressure < LOW_PRESSURE_THRESHOLD && entry.rear_pressure > IDLE_PRESSURE_THRESHOLD)
-            );
-
-            // Only update error log if it hasn't been manually cleared
-            if (!frontLogList.innerHTML.includes('No errors currently')) {
-                if (errorData.length > 0) {
-                    errorLogList.innerHTML = ''; // Clear the placeholder first
-                    errorData.forEach(entry => {
-                        const timestamp = new Date(entry.timestamp).toLocaleTimeString('ja-JP');
-                        const errorEntry = document.createElement('li');
-                        errorEntry.className = 'log-entry error-entry';
-                        errorEntry.innerHTML = `
-                            <span class="log-timestamp">${timestamp}</span>
-                            <div class="error-details">
-                                <span class="error-value">F: ${entry.front_pressure.toFixed(3)} MPa</span>
-                                <span class="error-value">R: ${entry.rear_pressure.toFixed(3)} MPa</span>
-                            </div>
-                        `;
-                        errorLogList.appendChild(errorEntry);
-                    });
-                }
-            }
-
-            // Scroll to latest entries
-            frontLogList.scrollTop = frontLogList.scrollHeight;
-            rearLogList.scrollTop = rearLogList.scrollHeight;
-            errorLogList.scrollTop = errorLogList.scrollHeight;
-
+            frontLog.append(frontEntries);
+            rearLog.append(rearEntries);
         } catch (error) {
             console.error('Error fetching log data:', error);
-            frontLogList.innerHTML = '<li class="log-entry">Error loading logs.</li>';
-            rearLogList.innerHTML = '<li class="log-entry">Error loading logs.</li>';
+            if (lastLogId === null) {
+                frontLogList.innerHTML = '<li class="log-entry">Error loading logs.</li>';
+                rearLogList.innerHTML = '<li class="log-entry">Error loading logs.</li>';
+            }
         }
     }
 
     // Initial setup
     updateDateTimeDisplay();
     updateLogDisplay();
+    updateErrorLog();
 
     // Update date/time every second
     setInterval(updateDateTimeDisplay, 1000);
 
     // Update logs every 5 seconds
     setInterval(updateLogDisplay, 5000);
+    setInterval(updateErrorLog, 5000);
 
     // Clear error log button click handler
     if (clearErrorLogBtn) {
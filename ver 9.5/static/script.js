@@ -5,6 +5,7 @@ const MINUTES_AVERAGE_API = '/api/average/minute';
 const REALTIME_UPDATE_INTERVAL = 500; 
 const CHART_UPDATE_INTERVAL = 1000; 
 const IDLE_PRESSURE_THRESHOLD = 0.029;
+const CHART_STORAGE_KEY = DEVICE ? `dashboardChartData:${DEVICE}` : 'dashboardChartData';
 const LOW_PRESSURE_THRESHOLD = 0.125;
 
 const button = document.getElementById('notificationButton');
@@ -119,7 +120,7 @@ function addNotification(type, message, details) {
 // --- 2. Real-time Monitoring Logic ---
 async function updateRealtimeData() {
     try {
-        const response = await fetch(REALTIME_API);
+        const response = await fetch(withDevice(REALTIME_API));
         const data = await response.json();        
         if (data.front_pressure !== undefined && data.rear_pressure !== undefined) {
             frontPressure = data.front_pressure;
@@ -154,11 +155,11 @@ function saveChartDataToLocalStorage() {
         rearData: rearPressureChart.data.datasets[0].data,
         timestamp: new Date().getTime()
     };
-    localStorage.setItem('dashboardChartData', JSON.stringify(chartData));
+    localStorage.setItem(CHART_STORAGE_KEY, JSON.stringify(chartData));
 }
 
 function loadChartDataFromLocalStorage() {
-    const stored = localStorage.getItem('dashboardChartData');
+    const stored = localStorage.getItem(CHART_STORAGE_KEY);
     if (stored) {
         try {
             return JSON.parse(stored);
@@ -228,7 +229,7 @@ async function loadInitialData() {
         }
         
         // Otherwise, fetch the latest 30 minutes of data from the database
-        const response = await fetch('/api/history');
+        const response = await fetch(withDevice('/api/history'));
         
         if (!response.ok) {
             // If API fails, use empty charts
@@ -357,7 +358,7 @@ function updateDateTimeDisplay() {
 
 async function updateAverages() {
     try {
-        const [hRes, mRes] = await Promise.all([fetch(HOURLY_AVERAGE_API), fetch(MINUTES_AVERAGE_API)]);
+        const [hRes, mRes] = await Promise.all([fetch(withDevice(HOURLY_AVERAGE_API)), fetch(withDevice(MINUTES_AVERAGE_API))]);
         const hData = await hRes.json();
         const mData = await mRes.json();
         document.getElementById('front-average-value').innerText = hData.front_average?.toFixed(3) || '0.000';
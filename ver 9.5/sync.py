@@ -0,0 +1,306 @@
+# sync.py
+# Copies the data of other boxes into this (central) data folder, incrementally.
+#
+# A source is another box's data folder (a mounted share or a copy of it) or a
+# pressure_data.db file from an older version. Three tables are read from it:
+#   readings        - the day partitions in <source>/readings/
+#   legacy_readings - the readings table of an older pressure_data.db (ISO timestamps)
+#   error_logs      - the error_logs table of pressure_data.db
+# For every source and table the highest id copied so far (the high-water mark)
+# is kept in the sync_state table of this box's main database. A run only asks
+# for rows beyond it with keyset queries (WHERE id > ? ORDER BY id LIMIT ?) on
+# the primary key, and partitions of days before the mark are never opened, so
+# running it again after a week costs time in proportion to the week's rows.
+# A partition id is the global reading id (see make_reading_id), which only
+# grows from day to day.
+#
+# Rows are merged SYNC_BATCH at a time, with one executemany and one
+# transaction per central partition. Every copied row carries a seq: the one
+# it already had (readings pushed to the source by other nodes) or else its id
+# at the source, which is also the seq a node sends raw readings for a
+# backfill request with. Legacy readings use their timestamp in milliseconds
+# instead, as import_legacy.py does, since the ids of different versions'
+# files overlap. The (device_id, seq) unique indexes skip rows that
+# are already stored, so a run that was interrupted, a source that was
+# replaced by an older copy (its mark is reset) or two copies of the same
+# database never store a row twice. Closed days that received rows are rolled
+# up again afterwards.
+#
+# Rows from before devices were tracked have no device id; they are stored
+# under --device, or the source folder name.
+#
+# Example, on the collector:
+#   python sync.py /mnt/line3/data "/backups/ver 9.0/pressure_data.db" --device line3
+
+import argparse
+from datetime import datetime
+import os
+import re
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+import clock
+import database
+
+SYNC_BATCH = 50000  # Source rows read and merged per transaction
+
+_ready_files = set()
+
+def connect_state():
+    """Opens this box's main database with the sync_state table."""
+    conn = database.connect_db(database.DB_FILE)
+    if database.DB_FILE not in _ready_files:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                source TEXT NOT NULL,
+                source_table TEXT NOT NULL,
+                last_id INTEGER NOT NULL,
+                synced INTEGER,
+                PRIMARY KEY (source, source_table)
+            )
+        ''')
+        conn.commit()
+        _ready_files.add(database.DB_FILE)
+    return conn
+
+def get_mark(conn, source, table):
+    """Highest id of the source table copied so far (0 if none)."""
+    row = conn.execute('SELECT last_id FROM sync_state WHERE source = ? AND source_table = ?',
+                       (source, table)).fetchone()
+    return row[0] if row else 0
+
+def set_mark(conn, source, table, last_id):
+    conn.execute('INSERT OR REPLACE INTO sync_state (source, source_table, last_id, synced) VALUES (?, ?, ?, ?)',
+                 (source, table, last_id, database.to_ms(clock.now())))
+    conn.commit()
+
+def open_source(path):
+    """Opens a source database read-only, so a live source is never written to or locked."""
+    return sqlite3.connect(f'file:{pathname2url(os.path.abspath(path))}?mode=ro', uri=True, timeout=5.0)
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def source_partition_dir(folder):
+    return os.path.join(folder, os.path.basename(database.PARTITION_DIR))
+
+def source_partition_path(folder, day):
+    return os.path.join(source_partition_dir(folder), f'readings_{day.isoformat()}.db')
+
+def source_partition_days(folder):
+    """Days that have a partition file in a source folder, oldest first."""
+    days = []
+    partition_dir = source_partition_dir(folder)
+    if not os.path.isdir(partition_dir):
+        return days
+    for name in os.listdir(partition_dir):
+        if name.startswith('readings_') and name.endswith('.db'):
+            try:
+                days.append(datetime.strptime(name[len('readings_'):-len('.db')], '%Y-%m-%d').date())
+            except ValueError:
+                continue
+    days.sort()
+    return days
+
+class Merger:
+    """Stores copied rows in this box's partitions and error logs, and counts them."""
+    def __init__(self):
+        self.counts = {}  # Source table -> [rows read, rows stored]
+        self.days = set()  # Partitions that received rows
+        self.newest = {}  # device_id -> newest (ts, front, rear)
+
+    def count(self, table, read, stored):
+        counts = self.counts.setdefault(table, [0, 0])
+        counts[0] += read
+        counts[1] += stored
+
+    def readings(self, table, rows):
+        """Stores (ts, front_pressure, rear_pressure, device_id, seq) rows, one transaction per day."""
+        stored = 0
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(datetime.fromtimestamp(row[0] / 1000).date(), []).append(row)
+            newest = self.newest.get(row[3])
+            if newest is None or row[0] > newest[0]:
+                self.newest[row[3]] = row[:3]
+        for day, day_rows in sorted(by_day.items()):
+            conn = database.connect_partition(day, create=True)
+            try:
+                before = conn.total_changes
+                conn.executemany('''
+                    INSERT OR IGNORE INTO readings (ts, front_pressure, rear_pressure, device_id, seq)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', day_rows)
+                conn.commit()
+                added = conn.total_changes - before
+            finally:
+                conn.close()
+            if added:
+                self.days.add(day)
+            stored += added
+        self.count(table, len(rows), stored)
+
+    def error_logs(self, rows):
+        """Stores (timestamp, front_pressure, rear_pressure, error_type, device_id, seq) rows."""
+        conn = database.connect_db(database.DB_FILE)
+        try:
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO error_logs (timestamp, front_pressure, rear_pressure, error_type, device_id, seq)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            self.count('error_logs', len(rows), conn.total_changes - before)
+        finally:
+            conn.close()
+
+    def finish(self):
+        """Rolls closed days that received rows up again and moves the devices on to their newest readings."""
+        today = clock.now().date()
+        for day in sorted(self.days):
+            if day < today:
+                database.compact_partition(day)
+        for device_id, (ts, front_pressure, rear_pressure) in self.newest.items():
+            database.update_device(device_id, None, ts, front_pressure, rear_pressure)
+
+def check_mark(state, source, table, mark, newest):
+    """Starts a table over if the source holds less than was copied: it was replaced by another copy."""
+    if newest < mark:
+        print(f"  {table}: source is behind the mark ({newest} < {mark}), copying it again")
+        set_mark(state, source, table, 0)
+        return 0
+    return mark
+
+def sync_partitions(state, source, folder, device_id, merger):
+    """Copies the readings of the source's day partitions beyond the mark."""
+    days = source_partition_days(folder)
+    if not days:
+        return
+    conn = open_source(source_partition_path(folder, days[-1]))
+    newest = database.make_reading_id(days[-1], conn.execute('SELECT COALESCE(MAX(id), 0) FROM readings').fetchone()[0])
+    conn.close()
+    mark = check_mark(state, source, 'readings', get_mark(state, source, 'readings'), newest)
+    mark_day, mark_row = database.split_reading_id(mark) if mark else (None, 0)
+
+    for day in days:
+        if mark_day is not None and day < mark_day:
+            continue  # Copied in an earlier run
+        conn = open_source(source_partition_path(folder, day))
+        try:
+            columns = table_columns(conn, 'readings')
+            query = f'''
+                SELECT ts, front_pressure, rear_pressure,
+                       {'COALESCE(device_id, ?)' if 'device_id' in columns else '?'},
+                       {'COALESCE(seq, ? + id)' if 'seq' in columns else '? + id'}, id
+                FROM readings
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            '''
+            last = mark_row if day == mark_day else 0
+            while True:
+                rows = conn.execute(query, (device_id, database.make_reading_id(day, 0), last, SYNC_BATCH)).fetchall()
+                if not rows:
+                    break
+                merger.readings('readings', [row[:5] for row in rows])
+                last = rows[-1][5]
+                set_mark(state, source, 'readings', database.make_reading_id(day, last))
+        finally:
+            conn.close()
+
+def sync_legacy_readings(state, source, conn, device_id, merger):
+    """Copies the readings table of an older pressure_data.db beyond the mark."""
+    newest = conn.execute('SELECT COALESCE(MAX(id), 0) FROM readings').fetchone()[0]
+    last = check_mark(state, source, 'legacy_readings', get_mark(state, source, 'legacy_readings'), newest)
+    while True:
+        rows = conn.execute(f'''
+            SELECT {database.LEGACY_TIMESTAMP_MS}, front_pressure, rear_pressure, id
+            FROM readings
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last, SYNC_BATCH)).fetchall()
+        if not rows:
+            break
+        merger.readings('legacy_readings', [(ts, front, rear, device_id, ts)
+                                            for ts, front, rear, _ in rows if ts is not None])
+        last = rows[-1][3]
+        set_mark(state, source, 'legacy_readings', last)
+
+def sync_error_logs(state, source, conn, device_id, merger):
+    """Copies the error_logs table of the source's pressure_data.db beyond the mark."""
+    columns = table_columns(conn, 'error_logs')
+    newest = conn.execute('SELECT COALESCE(MAX(id), 0) FROM error_logs').fetchone()[0]
+    last = check_mark(state, source, 'error_logs', get_mark(state, source, 'error_logs'), newest)
+    query = f'''
+        SELECT timestamp, front_pressure, rear_pressure, error_type,
+               {'COALESCE(device_id, ?)' if 'device_id' in columns else '?'},
+               {'COALESCE(seq, id)' if 'seq' in columns else 'id'}, id
+        FROM error_logs
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    '''
+    while True:
+        rows = conn.execute(query, (device_id, last, SYNC_BATCH)).fetchall()
+        if not rows:
+            break
+        merger.error_logs([row[:6] for row in rows])
+        last = rows[-1][6]
+        set_mark(state, source, 'error_logs', last)
+
+def sync_source(path, device_id=None):
+    """
+    Copies everything new from one source (a data folder or a pressure_data.db
+    file). Returns {table: [rows read, rows stored]}.
+    """
+    if os.path.isdir(path):
+        folder, main_file = path, os.path.join(path, os.path.basename(database.DB_FILE))
+    else:
+        folder, main_file = os.path.dirname(path) or '.', path
+    source = os.path.abspath(path)
+    device_id = device_id or re.sub(r'[^A-Za-z0-9._-]', '-', os.path.basename(os.path.abspath(folder)))[:64]
+    merger = Merger()
+    state = connect_state()
+    try:
+        sync_partitions(state, source, folder, device_id, merger)
+        if os.path.exists(main_file):
+            conn = open_source(main_file)
+            try:
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                if 'readings' in tables:
+                    sync_legacy_readings(state, source, conn, device_id, merger)
+                if 'error_logs' in tables:
+                    sync_error_logs(state, source, conn, device_id, merger)
+            finally:
+                conn.close()
+        merger.finish()
+    finally:
+        state.close()
+    return merger.counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy new readings and error logs of other boxes into this data folder.")
+    parser.add_argument('sources', nargs='+', help='data folders or pressure_data.db files to copy from')
+    parser.add_argument('--device', help='device id for rows without one (default: the source folder name)')
+    parser.add_argument('--data-dir', default='.', help='data folder to copy into')
+    args = parser.parse_args()
+
+    database.set_data_dir(args.data_dir)
+    database.setup_database()
+    for path in args.sources:
+        if not os.path.exists(path):
+            print(f"{path}: not found, skipped")
+            continue
+        print(f"{path}:")
+        started = time.perf_counter()
+        result = sync_source(path, args.device)
+        elapsed = time.perf_counter() - started
+        for table, (read, stored) in result.items():
+            print(f"  {table}: {read} new rows, {stored} stored, {read - stored} already there")
+        total = sum(read for read, _ in result.values())
+        print(f"  {total} rows in {elapsed:.1f} s ({total / max(elapsed, 1e-6):.0f} rows/s)")
+
+if __name__ == '__main__':
+    main()
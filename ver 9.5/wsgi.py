@@ -0,0 +1,30 @@
+# wsgi.py
+# Production entry point for the web tier.
+#
+# The web workers only read data: databases are opened read-only and the live
+# values come from the memory-mapped ring files. Acquisition and the scheduler
+# run once, in their own process:
+#   python acquisition.py
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# Both must be started from the same folder so they share the data files.
+#
+# A collector box (INGEST_ENABLED=1) also accepts readings from other nodes on
+# POST /api/ingest, so its workers open the databases for writing.
+
+import boot  # First, so its clock starts before the other imports
+import applog
+import database
+import logging
+import metrics
+
+applog.setup_logging()
+
+if not database.INGEST_ENABLED:
+    database.set_read_only()
+
+from AtsuKanshi import app  # noqa: E402  (read-only mode must be set first)
+
+# Each worker imports this module, so each one exports its own request metrics for /metrics
+metrics.start_exporter('web')
+boot.mark('web_ready')
+boot.report(logging.getLogger('wsgi'))